@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Memory per cached company for each InMemoryCompanyCache storage mode.
+
+Parses synthetic Enlite responses with the production parser (so strings
+are allocated as they are in a live worker), fills one cache per mode and
+reports traced bytes per company, the cache's own byte estimate and the
+cost of a lookup (which decodes in compact mode).
+
+Usage:
+    python benchmarks/cache_footprint.py [--companies 5000] [--lookups 20000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.WARNING)
+
+from enlite_cache import InMemoryCompanyCache, approximate_size
+from final_ubo_system import EnliteResponseParser
+from mock_data_generator import build_enlite_response_xml, generate_ownership_network
+
+MODES = [
+    ('dicts', {}),
+    ('dicts + intern', {'intern': True}),
+    ('compact', {'compact': True}),
+    ('compact + intern', {'compact': True, 'intern': True})
+]
+
+
+def parsed_records(count: int, seed: int):
+    """(registration ID, xml bytes) for ``count`` companies; parsed fresh per mode."""
+    network = generate_ownership_network(num_companies=count, seed=seed)
+    for company_id in network:
+        record = network[company_id]
+        xml = build_enlite_response_xml(record['profile'], record['shareholders'], record.get('directors'),
+                                        record.get('official_signatory', ''))
+        yield company_id, xml.encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--companies', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    responses = list(parsed_records(args.companies, args.seed))
+    parse = EnliteResponseParser()._parse_response
+    ids = [company_id for company_id, _ in responses]
+    rng = random.Random(args.seed)
+    print(f"{len(responses)} companies, {sum(len(body) for _, body in responses) / len(responses):.0f} "
+          f"XML bytes each on average")
+    print(f"{'mode':<18} {'traced B/company':>17} {'cache estimate':>15} {'lookup us':>10}")
+    baseline = None
+    for name, options in MODES:
+        cache = InMemoryCompanyCache(**options)
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for company_id, body in responses:
+            cache.set(company_id, parse(body))  # Parsed records are dropped unless the cache keeps them
+        gc.collect()
+        per_company = (tracemalloc.get_traced_memory()[0] - before) / len(responses)
+        tracemalloc.stop()
+
+        estimate = cache.stats()['bytes_per_entry'] or approximate_size(cache.get(ids[0]))
+        started = time.perf_counter()
+        for _ in range(args.lookups):
+            cache.get(rng.choice(ids))
+        lookup_us = (time.perf_counter() - started) / args.lookups * 1e6
+        baseline = baseline or per_company
+        print(f"{name:<18} {per_company:>17.0f} {estimate:>15} {lookup_us:>10.1f}"
+              f"   ({per_company / baseline:.0%} of dicts)")
+
+
+if __name__ == '__main__':
+    main()
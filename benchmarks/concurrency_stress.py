@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stress the shared analyzer with many simultaneous analyses.
+
+Runs every target once sequentially through ``analyze_company_ubo`` as the
+baseline, then runs ``--analyses`` analyses of randomly chosen targets at
+once against a local fake Enlite server and fails if any result differs
+from its baseline (UBO totals, path counts, hierarchy, checklist counts).
+``--mode async`` drives ``analyze_company_ubo_async`` on one event loop and
+``--mode gevent`` monkey-patches the process first (requires gevent).
+
+Usage:
+    python benchmarks/concurrency_stress.py [--analyses 200] [--concurrency 32] [--mode threads|async|gevent]
+"""
+
+import sys
+
+if '--mode' in sys.argv and sys.argv[sys.argv.index('--mode') + 1:][:1] == ['gevent']:
+    try:
+        from gevent import monkey
+    except ImportError:
+        sys.exit('gevent is not installed: pip install gevent')
+    monkey.patch_all()  # Must run before sockets and threads are imported
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_enlite_server import FakeEnliteServer
+from mock_data_generator import generate_ownership_network
+
+
+def signature(result):
+    """Order-independent fingerprint of everything a concurrent run could corrupt."""
+    return (
+        result.company_name,
+        result.total_companies_checked,
+        result.max_level_reached,
+        tuple(sorted((c.name, round(c.total_percentage, 9), len(c.paths)) for c in result.ubo_candidates)),
+        tuple(sorted(u.name for u in result.final_ubos)),
+        tuple(sorted(result.hierarchy)),
+        result.risk_level,
+        result.compliance_status
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['threads', 'async', 'gevent'], default='threads')
+    parser.add_argument('--analyses', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--targets', type=int, default=8, help='distinct companies analysed')
+    parser.add_argument('--companies', type=int, default=400)
+    parser.add_argument('--cycle-density', type=float, default=0.05)
+    parser.add_argument('--cross-holding', type=float, default=0.05)
+    parser.add_argument('--latency', default='fixed:0.002', help='see fake_enlite_server.parse_latency')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    network = generate_ownership_network(num_companies=args.companies, cycle_density=args.cycle_density,
+                                         cross_holding_rate=args.cross_holding, seed=args.seed)
+    server = FakeEnliteServer(network, latency=args.latency, seed=args.seed).start()
+    # The analyzer reads its configuration at import time
+    os.environ['ENLITE_API_URL'] = server.url
+    os.environ.setdefault('ENLITE_API_KEY', 'benchmark')
+    import final_ubo_system
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    targets = [network.root_id] + [network.company_id(rng.randrange(1, len(network)))
+                                   for _ in range(args.targets - 1)]
+    baseline = {target: signature(final_ubo_system.analyze_company_ubo(target)) for target in targets}
+    plan = [rng.choice(targets) for _ in range(args.analyses)]
+    final_ubo_system.company_cache.clear()  # Concurrent runs fetch (and share in-flight fetches) again
+
+    started = time.perf_counter()
+    if args.mode == 'async':
+        async def run_all():
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(target):
+                async with semaphore:
+                    return await final_ubo_system.analyze_company_ubo_async(target)
+            try:
+                return await asyncio.gather(*(one(target) for target in plan))
+            finally:
+                await final_ubo_system.async_api_client.close()
+        results = asyncio.run(run_all())
+    else:
+        # Under gevent the patched pool threads are greenlets
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(final_ubo_system.analyze_company_ubo, plan))
+    elapsed = time.perf_counter() - started
+    server.stop()
+
+    mismatches = [target for target, result in zip(plan, results) if signature(result) != baseline[target]]
+    print(f"{args.mode}: {len(plan)} analyses of {len(targets)} targets, {args.concurrency} at once, "
+          f"{elapsed:.2f}s, {server.calls} Enlite calls")
+    if mismatches:
+        print(f"FAILED: {len(mismatches)} results differ from the sequential baseline "
+              f"(targets {sorted(set(mismatches))})")
+        sys.exit(1)
+    print("OK: every concurrent result matches the sequential baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local stand-in for the Enlite SOAP service.
+
+Serves ``getDataEnlite`` responses for a synthetic ownership network with a
+configurable latency distribution, so the analyzer can be benchmarked without
+touching enlite.lhb.co.th.
+
+Standalone usage (then point ENLITE_API_URL at it):
+    python benchmarks/fake_enlite_server.py --port 8089 --depth 4 --fan-out 3 --latency lognormal:0.8:0.5
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Mapping, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_data_generator import build_enlite_response_xml, generate_ownership_network
+
+REGISTRATION_ID_PATTERN = re.compile(rb'<registrationId>\s*([^<\s]+)\s*</registrationId>')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Build a latency sampler (seconds) from a spec.
+
+    ``fixed:S``, ``uniform:LOW:HIGH``, ``lognormal:MEDIAN:SIGMA`` or
+    ``tail:BASE:SLOW:PROBABILITY`` (BASE normally, SLOW with the given probability).
+    """
+    kind, *params = spec.split(':')
+    values = [float(p) for p in params]
+    if kind == 'fixed':
+        return lambda rng: values[0] if values else 0.0
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        mu = math.log(values[0]) if values[0] > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if kind == 'tail':
+        return lambda rng: values[1] if rng.random() < values[2] else values[0]
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeEnliteServer:
+    """Threaded HTTP server answering POST /enlitews/companyData."""
+
+    def __init__(self, companies: Mapping[str, Dict[str, Any]], host: str = '127.0.0.1', port: int = 0,
+                 latency: str = 'fixed:0', error_rate: float = 0.0, seed: int = 0,
+                 capacity: Optional[int] = None):
+        self.companies = companies
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.capacity = capacity  # Concurrent requests served before answering 429, like Enlite's throttling
+        self.calls = 0
+        self.bytes_sent = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = {}  # registration_id -> rendered bytes
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _render(self, registration_id: str) -> Optional[bytes]:
+        cached = self._responses.get(registration_id)
+        if cached is None:
+            record = self.companies.get(registration_id)
+            if record is None:
+                return None
+            cached = build_enlite_response_xml(
+                record['profile'], record['shareholders'], record.get('directors'),
+                record.get('official_signatory', '')
+            ).encode('utf-8')
+            self._responses[registration_id] = cached
+        return cached
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.calls += 1
+                    if server.capacity is not None and server.in_flight >= server.capacity:
+                        server.throttled += 1
+                        throttled = True
+                    else:
+                        throttled = False
+                        server.in_flight += 1
+                        server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                        delay = server.latency(server._rng)
+                        fail = server._rng.random() < server.error_rate
+                if throttled:
+                    self._reply(429, b'Too Many Requests')
+                    return
+                try:
+                    time.sleep(max(delay, 0.0))
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+                match = REGISTRATION_ID_PATTERN.search(body)
+                payload = server._render(match.group(1).decode('utf-8')) if match else None
+                if fail:
+                    self._reply(503, b'Service Unavailable')
+                elif payload is None:
+                    # Enlite answers unknown IDs with an empty <return/>
+                    self._reply(200, b'<?xml version="1.0" encoding="utf-8"?><S:Envelope '
+                                     b'xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>'
+                                     b'<ns2:getDataEnliteResponse xmlns:ns2="http://view.bol.com/"><return/>'
+                                     b'</ns2:getDataEnliteResponse></S:Body></S:Envelope>')
+                else:
+                    self._reply(200, payload)
+
+            def _reply(self, status: int, payload: bytes):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # Client gave up, e.g. a cancelled hedge
+                with server._lock:
+                    server.bytes_sent += len(payload)
+
+        return Handler
+
+    def start(self) -> 'FakeEnliteServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-enlite', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--depth', type=int, default=None, help='tiers below the root (default 4 unless --companies)')
+    parser.add_argument('--companies', type=int, default=None, help='total companies to generate')
+    parser.add_argument('--fan-out', type=int, default=3)
+    parser.add_argument('--fan-out-alpha', type=float, default=None, help='Pareto exponent for power-law fan-out')
+    parser.add_argument('--cross-holding', type=float, default=0.0, help='chance of an extra holder elsewhere')
+    parser.add_argument('--personal', type=int, default=3, help='personal shareholders per company')
+    parser.add_argument('--cycle-density', type=float, default=0.05)
+    parser.add_argument('--latency', default='lognormal:0.8:0.5')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=None, help='concurrent requests before answering 429')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    companies = generate_ownership_network(depth=args.depth, fan_out=args.fan_out,
+                                           personal_per_company=args.personal,
+                                           cycle_density=args.cycle_density, seed=args.seed,
+                                           num_companies=args.companies, fan_out_alpha=args.fan_out_alpha,
+                                           cross_holding_rate=args.cross_holding)
+    server = FakeEnliteServer(companies, args.host, args.port, args.latency, args.error_rate, args.seed,
+                              args.capacity).start()
+    root_id = companies.root_id
+    print(f"Fake Enlite serving {len(companies)} companies at {server.url} (root {root_id})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Load test for the traversal and graph-building stages on large synthetic networks.
+
+Generates seeded ownership networks with mock_data_generator, runs the
+analyzer in-process over them (no HTTP), then times ``build_network_graph``
+and ``build_tree_structure`` on the resulting hierarchy.
+
+Usage:
+    python benchmarks/graph_benchmark.py [--sizes 10000 100000] [--max-levels 12] [--cross-holding 0.02]
+"""
+
+import argparse
+import logging
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.disable(logging.WARNING)
+
+from enhanced_app import build_network_graph, build_tree_structure
+from mock_data_generator import generate_ownership_network
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--fan-out', type=int, default=3)
+    parser.add_argument('--fan-out-alpha', type=float, default=2.2)
+    parser.add_argument('--personal', type=int, default=3)
+    parser.add_argument('--cycle-density', type=float, default=0.05)
+    parser.add_argument('--cross-holding', type=float, default=0.0)
+    parser.add_argument('--max-levels', type=int, default=7, help='analyzer depth limit (7 in production)')
+    parser.add_argument('--skip-tree', action='store_true', help='skip build_tree_structure')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    print(f"{'companies':>10} {'edges':>9} {'gen ms':>9} | {'visited':>8} {'analyze ms':>11} "
+          f"{'graph ms':>9} {'nodes':>8} {'tree ms':>9} | {'rss MB':>7}")
+    for size in args.sizes:
+        network, gen_ms = _timed(generate_ownership_network, num_companies=size, fan_out=args.fan_out,
+                                 fan_out_alpha=args.fan_out_alpha, personal_per_company=args.personal,
+                                 cycle_density=args.cycle_density, cross_holding_rate=args.cross_holding,
+                                 seed=args.seed)
+        hierarchy, analyze_ms = _timed(network.to_hierarchy, max_levels=args.max_levels)
+        graph, graph_ms = _timed(build_network_graph, network.root_id, hierarchy, set())
+        tree_ms = float('nan')
+        if not args.skip_tree:
+            _, tree_ms = _timed(build_tree_structure, network.root_id, hierarchy, set())
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{len(network):>10} {network.edge_count:>9} {gen_ms:>9.0f} | {len(hierarchy):>8} {analyze_ms:>11.0f} "
+              f"{graph_ms:>9.0f} {len(graph['nodes']):>8} {tree_ms:>9.0f} | {rss_mb:>7.0f}")
+
+
+if __name__ == '__main__':
+    main()
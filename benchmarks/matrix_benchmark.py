@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check and time the matrix ownership engine against the path-sum totals.
+
+For each size, runs the analyzer in-process over a seeded network, then
+builds the ownership matrix from its hierarchy and solves it with SciPy
+(when installed) and with the pure-Python series. On acyclic trees
+(``--cycle-density 0 --cross-holding 0``) every total must equal the
+traversal's; with shared parents or cycles the differences are listed.
+
+Usage:
+    python benchmarks/matrix_benchmark.py [--sizes 1000 10000] [--cross-holding 0.02] [--cycle-density 0.05]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logging.disable(logging.WARNING)
+
+import ubo_matrix
+from final_ubo_system import FinalUBOAnalyzer
+from mock_data_generator import generate_ownership_network
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--fan-out', type=int, default=3)
+    parser.add_argument('--personal', type=int, default=3)
+    parser.add_argument('--cycle-density', type=float, default=0.0)
+    parser.add_argument('--cross-holding', type=float, default=0.0)
+    parser.add_argument('--max-levels', type=int, default=12, help='analyzer depth limit (7 in production)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--show', type=int, default=5, help='differences to print per size')
+    args = parser.parse_args()
+
+    sparse_np = ubo_matrix.np
+    print(f"{'companies':>10} {'fetched':>8} {'edges':>8} {'analyze ms':>11} | {'build ms':>9} "
+          f"{'scipy ms':>9} {'python ms':>10} | {'persons':>8} {'differ':>7} {'max diff':>9}")
+    for size in args.sizes:
+        network = generate_ownership_network(num_companies=size, fan_out=args.fan_out,
+                                             personal_per_company=args.personal,
+                                             cycle_density=args.cycle_density,
+                                             cross_holding_rate=args.cross_holding, seed=args.seed)
+        analyzer = FinalUBOAnalyzer()
+        analyzer.max_levels = args.max_levels
+        result, analyze_ms = _timed(analyzer.analyze_company_hierarchy, network, network.root_id, max_workers=1)
+        matrix, build_ms = _timed(ubo_matrix.OwnershipMatrix.from_hierarchy, result.hierarchy)
+
+        scipy_ms = float('nan')
+        if sparse_np is not None:
+            scipy_totals, scipy_ms = _timed(matrix.person_totals, network.root_id)
+        ubo_matrix.np = None  # Force the pure-Python series
+        try:
+            totals, python_ms = _timed(matrix.person_totals, network.root_id)
+        finally:
+            ubo_matrix.np = sparse_np
+        if sparse_np is not None:
+            drift = max((abs(totals[name] - scipy_totals[name]) for name in totals), default=0.0)
+            assert drift < 1e-6, f"SciPy and pure-Python totals differ by {drift}"
+
+        differences = ubo_matrix.compare_with_paths(result)
+        max_diff = max((abs(matrix_total - paths_total) for paths_total, matrix_total in differences.values()),
+                       default=0.0)
+        print(f"{size:>10} {len(result.hierarchy):>8} {matrix.edge_count:>8} {analyze_ms:>11.0f} | {build_ms:>9.1f} "
+              f"{scipy_ms:>9.1f} {python_ms:>10.1f} | {len(totals):>8} {len(differences):>7} {max_diff:>9.4f}")
+        ranked = sorted(differences.items(), key=lambda item: abs(item[1][1] - item[1][0]), reverse=True)
+        for name, (paths_total, matrix_total) in ranked[:args.show]:
+            print(f"{'':>12}{name}: paths {paths_total:.4f}% -> matrix {matrix_total:.4f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark for Enlite response parsing.
+
+Compares the original per-field ``find()`` parser with the table-driven tree
+parser and the streaming parser on synthetic responses of increasing size.
+``auto`` is what the clients run: the tree parser, or the streaming parser
+from STREAM_PARSE_MIN_BYTES up.
+
+Usage:
+    python benchmarks/parse_benchmark.py [--sizes 100 1000 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.WARNING)
+
+from final_ubo_system import EnliteResponseParser
+from mock_data_generator import build_enlite_response_xml
+
+
+def _legacy_get_text(element, tag):
+    if element is None:
+        return ""
+    elem = element.find(tag)
+    return elem.text if elem is not None and elem.text else ""
+
+
+def legacy_parse(xml_response: str):
+    """The parser as it was before field tables: one find() per field, full tree."""
+    root = ET.fromstring(xml_response)
+    return_data = root.find('.//return')
+    data = {}
+    profile = return_data.find('.//profileSummary')
+    if profile is not None:
+        data['profile'] = {key: _legacy_get_text(profile, tag) for tag, key in [
+            ('nameThFull', 'name_th_full'), ('nameTh', 'name_th'), ('businessTypeTh', 'business_type_th'),
+            ('nameEnFull', 'name_en_full'), ('nameEn', 'name_en'), ('businessTypeEn', 'business_type_en'),
+            ('regisId', 'regis_id'), ('companyStatus', 'company_status'), ('capital', 'capital'),
+            ('regisDate', 'regis_date'), ('setSymbol', 'set_symbol')]}
+        address = profile.find('.//address')
+        data['profile']['address'] = {key: _legacy_get_text(address, tag) for tag, key in [
+            ('addressNo', 'address_no'), ('moo', 'moo'), ('buildingEn', 'building_en'),
+            ('buildingTh', 'building_th'), ('floor', 'floor'), ('soiEn', 'soi_en'), ('soiTh', 'soi_th'),
+            ('roadEn', 'road_en'), ('roadTh', 'road_th'), ('mooBanEn', 'moo_ban_en'),
+            ('mooBanTh', 'moo_ban_th'), ('subDistrict', 'sub_district'), ('district', 'district'),
+            ('province', 'province'), ('postcode', 'postcode'), ('room', 'room'), ('roomEn', 'room_en')]}
+    signatory = return_data.find('.//officialSignatory')
+    data['official_signatory'] = signatory.text.strip() if signatory is not None and signatory.text else ''
+    directors = return_data.find('.//director')
+    if directors is not None:
+        data['directors'] = [{tag: _legacy_get_text(d, tag) for tag in ('title', 'firstname', 'lastname')}
+                             for d in directors.findall('.//list')]
+    held_by = return_data.find('.//heldBy')
+    if held_by is not None:
+        data['shareholders'] = []
+        level_held = held_by.find('.//levelHeldBy[@level="1"]')
+        for row in level_held.findall('.//data'):
+            shareholder = {key: _legacy_get_text(row, tag) for tag, key in [
+                ('regisIdHeldBy', 'regis_id_held_by'), ('businessStatus', 'business_status'),
+                ('numOfSH', 'num_of_sh'), ('shareAmount', 'share_amount'), ('percent', 'percent'),
+                ('nationality', 'nationality'), ('directorShip', 'directorship'),
+                ('directorUpdDate', 'director_upd_date')]}
+            detail = row.find('.//shareholder')
+            if detail is not None:
+                for tag, key in [('title', 'title'), ('firstname', 'firstname'),
+                                 ('lastname', 'lastname'), ('businessType', 'business_type')]:
+                    shareholder[key] = _legacy_get_text(detail, tag)
+                shareholder['shareholder_type'] = detail.get('type', 'personal')
+            data['shareholders'].append(shareholder)
+    return data
+
+
+def synthetic_response(num_shareholders: int, seed: int = 42) -> bytes:
+    """Build a listed-company style response with ``num_shareholders`` rows."""
+    rng = random.Random(seed)
+    profile = {
+        'name_th_full': 'บริษัท ทดสอบ จำกัด (มหาชน)', 'name_en_full': 'TEST PUBLIC COMPANY LIMITED',
+        'name_en': 'TEST', 'business_type_en': 'Holding', 'regis_id': '0107500000000',
+        'company_status': 'Active', 'capital': '1,000,000,000', 'regis_date': '01/01/2000', 'set_symbol': 'TEST',
+        'address': {'address_no': '1', 'road_en': 'Rama IV', 'district': 'Pathum Wan', 'province': 'Bangkok',
+                    'postcode': '10330'}
+    }
+    shareholders = []
+    for i in range(num_shareholders):
+        is_company = rng.random() < 0.2
+        shareholders.append({
+            'regis_id_held_by': f"01055{i:08d}" if is_company else '',
+            'business_status': 'Active' if is_company else '',
+            'share_amount': f"{rng.randint(100, 10_000_000):,}",
+            'percent': f"{rng.uniform(0.001, 5):.4f}",
+            'nationality': rng.choice(['ไทย', 'THAI', 'SINGAPOREAN', 'JAPANESE']),
+            'directorship': rng.choice(['YES', 'NO']),
+            'director_upd_date': '2024-01-01',
+            'shareholder_type': 'company' if is_company else 'personal',
+            'title': '' if is_company else 'นาย',
+            'firstname': f"บริษัท ผู้ถือหุ้น {i}" if is_company else f"สมชาย{i}",
+            'lastname': '' if is_company else f"ใจดี{i}"
+        })
+    directors = [{'title': 'นาย', 'firstname': f'กรรมการ{i}', 'lastname': 'ทดสอบ'} for i in range(12)]
+    return build_enlite_response_xml(profile, shareholders, directors, 'นายกรรมการ0 ทดสอบ ลงลายมือชื่อ').encode('utf-8')
+
+
+def _peak_memory(fn) -> float:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    enlite = EnliteResponseParser()
+    print(f"{'rows':>8} {'bytes':>10} | {'legacy ms':>10} {'tree ms':>10} {'stream ms':>10} {'auto ms':>10} | "
+          f"{'legacy MB':>9} {'tree MB':>9} {'stream MB':>9} {'auto MB':>9}")
+    for size in args.sizes:
+        payload = synthetic_response(size)
+        text = payload.decode('utf-8')
+        assert enlite._parse_company_data(text) == enlite._parse_company_data_stream(payload)
+
+        runs = {
+            'legacy': lambda: legacy_parse(payload.decode('utf-8')),
+            'tree': lambda: enlite._parse_company_data(payload.decode('utf-8')),
+            'stream': lambda: enlite._parse_company_data_stream(payload),
+            'auto': lambda: enlite._parse_response(payload),
+        }
+        times = {name: min(timeit.repeat(fn, number=1, repeat=args.repeat)) * 1000 for name, fn in runs.items()}
+        peaks = {name: _peak_memory(fn) for name, fn in runs.items()}
+        print(f"{size:>8} {len(payload):>10} | {times['legacy']:>10.1f} {times['tree']:>10.1f} "
+              f"{times['stream']:>10.1f} {times['auto']:>10.1f} | {peaks['legacy']:>9.1f} {peaks['tree']:>9.1f} "
+              f"{peaks['stream']:>9.1f} {peaks['auto']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
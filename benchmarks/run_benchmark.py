@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""End-to-end benchmark of the UBO analyzer against a local fake Enlite server.
+
+Drives ``analyze_company_ubo`` and/or ``POST /api/analyze`` over a synthetic
+ownership network and reports p50/p95/p99 latency, throughput, Enlite calls per
+analysis and peak RSS (of this process, which also hosts the fake server).
+
+Examples:
+    python benchmarks/run_benchmark.py --depth 4 --fan-out 3 --latency lognormal:0.05:0.5
+    python benchmarks/run_benchmark.py --target api --iterations 20 --cache warm
+    python benchmarks/run_benchmark.py --concurrency 8 --max-workers 8 --latency tail:0.02:0.5:0.05
+    python benchmarks/run_benchmark.py --target analyzer --concurrency 8 --max-workers 8 --capacity 12 --adaptive off
+    python benchmarks/run_benchmark.py --target analyzer --iterations 30 --latency tail:0.02:1.0:0.02 --hedge on
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_enlite_server import FakeEnliteServer
+from mock_data_generator import generate_ownership_network
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_scenario(name: str, analyse: Callable[[], Any], server: FakeEnliteServer, clear_cache: Callable[[], None],
+                 iterations: int, concurrency: int, cold: bool) -> Dict[str, Any]:
+    """Run ``iterations`` analyses with ``concurrency`` in flight and summarise them."""
+    latencies = []
+
+    def one():
+        if cold:
+            clear_cache()
+        started = time.perf_counter()
+        analyse()
+        latencies.append(time.perf_counter() - started)
+
+    calls_before = server.calls
+    throttled_before = server.throttled
+    bytes_before = server.bytes_sent
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(one) for _ in range(iterations)]:
+                future.result()
+    else:
+        for _ in range(iterations):
+            one()
+    wall = time.perf_counter() - started
+
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'cache': 'cold' if cold else 'warm',
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+        'throughput_per_s': round(iterations / wall, 2) if wall else 0.0,
+        'enlite_calls_per_analysis': round((server.calls - calls_before) / iterations, 2),
+        'enlite_throttled_429': server.throttled - throttled_before,
+        'enlite_peak_in_flight': server.peak_in_flight,
+        'response_kb_per_analysis': round((server.bytes_sent - bytes_before) / iterations / 1024, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['analyzer', 'api', 'both'], default='both')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='simultaneous analyses (analyzer target; /api/analyze is driven sequentially)')
+    parser.add_argument('--max-workers', type=int, default=1, help='ENLITE_MAX_WORKERS for tier-parallel fetching')
+    parser.add_argument('--cache', choices=['cold', 'warm'], default='cold',
+                        help='cold clears the company cache before every analysis')
+    parser.add_argument('--depth', type=int, default=None, help='tiers below the root (default 4 unless --companies)')
+    parser.add_argument('--companies', type=int, default=None, help='total companies to generate')
+    parser.add_argument('--fan-out', type=int, default=3)
+    parser.add_argument('--fan-out-alpha', type=float, default=None, help='Pareto exponent for power-law fan-out')
+    parser.add_argument('--cross-holding', type=float, default=0.0, help='chance of an extra holder elsewhere')
+    parser.add_argument('--personal', type=int, default=3, help='personal shareholders per company')
+    parser.add_argument('--cycle-density', type=float, default=0.05)
+    parser.add_argument('--latency', default='lognormal:0.02:0.5', help='see fake_enlite_server.parse_latency')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=None,
+                        help='fake Enlite answers 429 beyond this many concurrent calls')
+    parser.add_argument('--adaptive', choices=['on', 'off'], default='on',
+                        help='ENLITE_ADAPTIVE_CONCURRENCY: AIMD limit on in-flight Enlite calls')
+    parser.add_argument('--hedge', choices=['on', 'off'], default='off',
+                        help='ENLITE_HEDGING: duplicate calls slower than the recent p95')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    parser.add_argument('--verbose', action='store_true', help='keep INFO logging from the analyzer')
+    args = parser.parse_args()
+
+    companies = generate_ownership_network(depth=args.depth, fan_out=args.fan_out,
+                                           personal_per_company=args.personal,
+                                           cycle_density=args.cycle_density, seed=args.seed,
+                                           num_companies=args.companies, fan_out_alpha=args.fan_out_alpha,
+                                           cross_holding_rate=args.cross_holding)
+    root_id = companies.root_id
+    server = FakeEnliteServer(companies, latency=args.latency, error_rate=args.error_rate, seed=args.seed,
+                              capacity=args.capacity).start()
+
+    # The analyzer reads its configuration at import time
+    os.environ['ENLITE_API_URL'] = server.url
+    os.environ.setdefault('ENLITE_API_KEY', 'benchmark')
+    os.environ['ENLITE_MAX_WORKERS'] = str(args.max_workers)
+    os.environ['ENLITE_ADAPTIVE_CONCURRENCY'] = '1' if args.adaptive == 'on' else '0'
+    os.environ['ENLITE_HEDGING'] = '1' if args.hedge == 'on' else '0'
+    import final_ubo_system
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    results = []
+    cold = args.cache == 'cold'
+    print(f"Synthetic network: {len(companies)} companies, root {root_id}, fake Enlite at {server.url}",
+          file=sys.stderr)
+
+    if args.target in ('analyzer', 'both'):
+        # Safe at any concurrency: every analysis keeps its own AnalysisContext
+        analyse = lambda: final_ubo_system.analyze_company_ubo(root_id)
+        results.append(run_scenario('analyze_company_ubo', analyse, server, final_ubo_system.company_cache.clear,
+                                    args.iterations, args.concurrency, cold))
+
+    if args.target in ('api', 'both'):
+        from enhanced_app import app
+        client = app.test_client()
+
+        def analyse_http():
+            response = client.post('/api/analyze', json={'registration_id': root_id})
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/analyze returned {response.status_code}: {response.get_data(as_text=True)}")
+            return response
+
+        results.append(run_scenario('POST /api/analyze', analyse_http, server, final_ubo_system.company_cache.clear,
+                                    args.iterations, 1, cold))
+
+    server.stop()
+    for result in results:
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"\n{result['scenario']} ({result['iterations']} runs, concurrency {result['concurrency']}, "
+                  f"{result['cache']} cache)")
+            for key, value in result.items():
+                if key not in ('scenario', 'iterations', 'concurrency', 'cache'):
+                    print(f"  {key:<28} {value}")
+
+
+if __name__ == '__main__':
+    main()
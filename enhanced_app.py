@@ -2,12 +2,17 @@
 # -*- coding: utf-8 -*-
 """Enhanced UBO Web Application (English output only)."""
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, make_response, render_template, request, jsonify, send_file
 from flask_cors import CORS
+import csv
+import io
 import json
 import os
+import queue
 import sys
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import logging
 from typing import Any, Dict, List, Optional, Set
@@ -21,7 +26,14 @@ except ImportError:
     pass  # python-dotenv not installed, use system environment variables
 
 # Import Final UBO System
-from final_ubo_system import analyze_company_ubo
+from final_ubo_system import (AnalysisCancelled, AnalysisContext, analyze_company_ubo, api_client, company_cache,
+                              ubo_analyzer)
+from ubo_instrumentation import analysis_metrics, timed_stage, track_analysis
+from ubo_jobs import JobLimitExceeded, create_job_manager_from_env
+from ubo_matrix import apply_matrix_engine
+from ubo_metrics import render_metrics
+from ubo_ownership import SharedOwnershipAnalyzer, create_ownership_cache_from_env
+from ubo_snapshots import create_incremental_analyzer_from_env
 
 # Import Mock Data Generator
 from mock_data_generator import generate_mock_ubo_data
@@ -508,6 +520,269 @@ def build_tree_structure(root_id: str, hierarchy: Dict[str, Any], ubo_names: set
 
     return _build_node(root_id, level=0, effective=100.0, direct=100.0)
 
+def build_analysis_report(registration_id: str, result: Any) -> Dict[str, Any]:
+    """Turn a UBOAnalysisResult into the JSON report returned by /api/analyze."""
+    # Convert dataclass response to dictionary if needed
+    if hasattr(result, '__dict__'):
+        result_dict = result.__dict__
+    else:
+        result_dict = result
+    
+    # Extract main company data from hierarchy
+    hierarchy = result_dict.get('hierarchy', {})
+    main_company_data = hierarchy.get(registration_id, {})
+    
+    # Create report from analyzed data (English only)
+    display_name = (
+        main_company_data.get('display_name')
+        or main_company_data.get('name_en')
+        or main_company_data.get('name_th')
+        or registration_id
+    )
+    business_type = (
+        main_company_data.get('business_type_en')
+        or main_company_data.get('business_type')
+        or 'Unknown'
+    )
+
+    # Extract officialSignatory and directors
+    official_signatory_text = main_company_data.get('official_signatory', '')
+    with timed_stage('signatory_names'):
+        signatory_names = extract_names_from_signatory(official_signatory_text)
+    directors_list = main_company_data.get('directors', [])
+    directors_signatories = build_directors_signatories_table(directors_list, signatory_names)
+    
+    report = {
+        'company_info': {
+            'regis_id': registration_id,
+            'name': display_name,
+            'name_en': display_name,
+            'display_name': display_name,
+            'status': main_company_data.get('status', 'Active'),
+            'capital': main_company_data.get('capital', 'Unknown'),
+            'regis_date': main_company_data.get('regis_date', 'Unknown'),
+            'business_type': business_type,
+            'business_type_en': business_type,
+            'address': main_company_data.get('address', {}),
+            'check_date': result_dict.get('check_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+            'official_signatory': official_signatory_text,
+            'signatory_names': signatory_names,
+            'directors': directors_list,
+            'directors_signatories': directors_signatories
+        },
+        'ubos': [],
+        'checklist': result_dict.get('checklist', {}),
+        'hierarchy_data': hierarchy,
+        'analysis_summary': f"Analysis completed - Checked {result_dict.get('total_companies_checked', 0)} companies, Max level {result_dict.get('max_level_reached', 0)} tiers",
+        'traversal': result_dict.get('traversal', 'bfs'),
+        'coverage_percentage': result_dict.get('coverage_percentage', 100.0),
+        'budget_exhausted': result_dict.get('budget_exhausted'),
+        'partial': result_dict.get('partial', False),
+        'enlite_health': result_dict.get('enlite_health', {}),
+        'unexplored': result_dict.get('unexplored', []),
+        'level_summary': {
+            'level_1_count': len([c for c in hierarchy.values() if c.get('level') == 1]),
+            'level_2_count': len([c for c in hierarchy.values() if c.get('level') == 2]),
+            'level_3_count': len([c for c in hierarchy.values() if c.get('level') == 3]),
+            'level_4_count': len([c for c in hierarchy.values() if c.get('level') == 4]),
+            'level_5_count': len([c for c in hierarchy.values() if c.get('level') == 5]),
+            'level_6_count': len([c for c in hierarchy.values() if c.get('level') == 6]),
+            'total_personal': sum(len([s for s in c.get('shareholders', []) if s.get('shareholder_type') == 'personal']) for c in hierarchy.values()),
+            'total_company': sum(len([s for s in c.get('shareholders', []) if s.get('shareholder_type') == 'company']) for c in hierarchy.values())
+        }
+    }
+    
+    # Convert UBO candidates into serialisable dictionaries
+    ubo_candidates = result_dict.get('ubo_candidates', [])
+    for candidate in ubo_candidates:
+        if hasattr(candidate, '__dict__'):
+            candidate_dict = candidate.__dict__
+        else:
+            candidate_dict = candidate
+        nationality = candidate_dict.get('nationality') or 'Unknown'
+        
+        # Include path details for calculation transparency
+        path_details = candidate_dict.get('path_details', [])
+        if hasattr(path_details, '__iter__') and not isinstance(path_details, (str, bytes)):
+            path_details_list = list(path_details)
+        else:
+            path_details_list = []
+            
+        report['ubos'].append({
+            'name': candidate_dict.get('name', 'Unknown'),
+            'total_percentage': candidate_dict.get('total_percentage', 0),
+            'identification_method': f"Method {candidate_dict.get('method', 1)}",
+            'nationality': nationality,
+            'is_director': candidate_dict.get('is_director', False),
+            'ubo_status': 'YES' if candidate_dict.get('total_percentage', 0) >= 15.0 else 'NO',
+            'path_details': path_details_list,
+            'paths_count': len(path_details_list)
+        })
+    
+    # Build network graph (NetworkX-based spider web visualization)
+    try:
+        ubo_name_set = _extract_ubo_name_set(report['ubos'])
+        with timed_stage('network_graph'):
+            report['network_graph'] = build_network_graph(
+                registration_id,
+                hierarchy,
+                ubo_name_set
+            )
+    except Exception as e:
+        logger.warning(f"Failed to prepare network graph: {e}")
+        report['network_graph'] = {'nodes': [], 'edges': []}
+    
+    # Build hierarchical tree structure for D3 visualisation (keep for compatibility)
+    try:
+        with timed_stage('tree_structure'):
+            report['tree_structure'] = build_tree_structure(
+                registration_id,
+                hierarchy,
+                ubo_name_set
+            )
+    except Exception as e:
+        logger.warning(f"Failed to prepare hierarchy tree data: {e}")
+        report['tree_structure'] = None
+    
+    return report
+
+EXPORT_HEADERS = ['Company ID', 'Company Name', 'Check Date', 'Method Used', 'Max Level',
+                  'Companies Checked', 'Risk Level', 'Compliance Status', 'Total UBO Candidates',
+                  'Final UBOs', 'UBO Name', 'UBO Method', 'UBO Percentage', 'UBO Paths',
+                  'Is Director', 'Position']
+
+def build_export_csv(results: List[Dict[str, Any]]) -> str:
+    """Render export records (the /api/export_excel ``results`` layout) as CSV text."""
+    csv_data = []
+    for result in results:
+        if 'error' in result:
+            continue
+            
+        company_info = result.get('company_info', {})
+        analysis_summary = result.get('analysis_summary', {})
+        ubo_results = result.get('ubo_results', {})
+        
+        # Base row
+        base_row = [
+            company_info.get('id', ''),
+            company_info.get('name', ''),
+            company_info.get('check_date', ''),
+            analysis_summary.get('method_used', ''),
+            analysis_summary.get('max_level_reached', ''),
+            analysis_summary.get('total_companies_checked', ''),
+            analysis_summary.get('risk_level', ''),
+            analysis_summary.get('compliance_status', ''),
+            ubo_results.get('total_candidates', ''),
+            ubo_results.get('final_ubos', '')
+        ]
+        
+        # UBO details
+        ubo_details = ubo_results.get('ubo_details', [])
+        if ubo_details:
+            for ubo in ubo_details:
+                row = base_row + [
+                    ubo.get('name', ''),
+                    ubo.get('method', ''),
+                    ubo.get('total_percentage', ''),
+                    ubo.get('paths_count', len(ubo.get('paths', []))),
+                    ubo.get('is_director', False),
+                    ubo.get('position', '')
+                ]
+                csv_data.append(row)
+        else:
+            csv_data.append(base_row + ['', '', '', '', '', ''])
+    
+    # Create CSV in memory
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_HEADERS)
+    writer.writerows(csv_data)
+    return output.getvalue()
+
+def _csv_download(csv_content: str) -> Response:
+    """Return CSV text as a timestamped attachment (no file writing for Vercel)."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    response = make_response(csv_content)
+    response.headers['Content-Type'] = 'text/csv; charset=utf-8-sig'
+    response.headers['Content-Disposition'] = f'attachment; filename=ubo_analysis_{timestamp}.csv'
+    return response
+
+def build_export_record(registration_id: str, result: Any) -> Dict[str, Any]:
+    """Summarise a UBOAnalysisResult in the /api/export_excel ``results`` layout."""
+    final_ubos = result.final_ubos
+    return {
+        'company_info': {
+            'id': registration_id,
+            'name': result.company_name or registration_id,
+            'check_date': result.check_date
+        },
+        'analysis_summary': {
+            'method_used': 'Method 1' if final_ubos else 'Method 2',
+            'max_level_reached': result.max_level_reached,
+            'total_companies_checked': result.total_companies_checked,
+            'risk_level': result.risk_level,
+            'compliance_status': result.compliance_status
+        },
+        'ubo_results': {
+            'total_candidates': len(result.ubo_candidates),
+            'final_ubos': len(final_ubos),
+            'ubo_details': [{
+                'name': ubo.name,
+                'method': f"Method {ubo.method}",
+                'total_percentage': round(ubo.total_percentage, 4),
+                'paths': ubo.paths,
+                'paths_count': ubo.path_count if ubo.path_count is not None else len(ubo.paths),
+                'is_director': ubo.is_director,
+                'position': 'Director' if ubo.is_director else 'Shareholder'
+            } for ubo in final_ubos]
+        }
+    }
+
+MOCK_REGISTRATION_ID = "XXXXXXXX"
+
+def build_mock_report(registration_id: str) -> Dict[str, Any]:
+    """Build the demonstration report served for MOCK_REGISTRATION_ID."""
+    logger.info("🎭 Using MOCK DATA for demonstration")
+    mock_report = generate_mock_ubo_data()
+    
+    # Build network graph from mock data
+    try:
+        ubo_name_set = _extract_ubo_name_set(mock_report.get('ubos', []))
+        mock_report['network_graph'] = build_network_graph(
+            registration_id,
+            mock_report.get('hierarchy_data', {}),
+            ubo_name_set
+        )
+    except Exception as e:
+        logger.warning(f"Failed to build mock network graph: {e}")
+        mock_report['network_graph'] = {'nodes': [], 'edges': []}
+    
+    # Build tree structure from mock data
+    try:
+        mock_report['tree_structure'] = build_tree_structure(
+            registration_id,
+            mock_report.get('hierarchy_data', {}),
+            ubo_name_set
+        )
+    except Exception as e:
+        logger.warning(f"Failed to build mock tree structure: {e}")
+        mock_report['tree_structure'] = None
+    
+    return mock_report
+
+def run_analysis_job(registration_id: str, progress_callback) -> Dict[str, Any]:
+    """Job runner: analyse (each call has its own context, so jobs run concurrently) and build the report."""
+    with track_analysis() as timings:
+        with timed_stage('analysis'):
+            result = ubo_analyzer.analyze_company_hierarchy(
+                api_client, registration_id, progress_callback=progress_callback
+            )
+        report = build_analysis_report(registration_id, result)
+    analysis_metrics.record(timings)
+    return report
+
+job_manager = create_job_manager_from_env(run_analysis_job)
+
 def initialize_ubo_system():
     """Initialize UBO System with API Key"""
     try:
@@ -527,6 +802,23 @@ def index():
     """Main page"""
     return render_template('enhanced_index.html')
 
+def _traversal_options(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Traversal order and budgets from a request body; raises ValueError on bad input.
+
+    Unset budgets fall back to the UBO_MAX_* defaults.
+    """
+    traversal = data.get('traversal')
+    if traversal is not None and traversal not in ('bfs', 'best_first'):
+        raise ValueError(f"Unknown traversal '{traversal}', expected 'bfs' or 'best_first'")
+    try:
+        max_calls = int(data['max_calls']) if data.get('max_calls') is not None else None
+        max_seconds = float(data['max_seconds']) if data.get('max_seconds') is not None else None
+        max_companies = int(data['max_companies']) if data.get('max_companies') is not None else None
+    except (TypeError, ValueError):
+        raise ValueError('max_calls, max_seconds and max_companies must be numbers')
+    return {'traversal': traversal, 'max_calls': max_calls, 'max_seconds': max_seconds,
+            'max_companies': max_companies}
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_company():
     """Analyze company and return structured UBO report."""
@@ -536,39 +828,24 @@ def analyze_company():
         
         if not registration_id:
             return jsonify({'error': 'Please provide a company registration ID'}), 400
+        engine = str(data.get('engine') or 'bfs').lower()
+        if engine not in ('bfs', 'matrix'):
+            return jsonify({'error': f"Unknown engine '{engine}', expected 'bfs' or 'matrix'"}), 400
+        try:
+            options = _traversal_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            freshness_seconds = float(data['freshness_seconds']) if data.get('freshness_seconds') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'freshness_seconds must be a number'}), 400
         
         # ✅ Mock Data Mode: If registration_id == "XXXXXXXX", use mock data
-        if registration_id == "XXXXXXXX":
-            logger.info("🎭 Using MOCK DATA for demonstration")
-            mock_report = generate_mock_ubo_data()
-            
-            # Build network graph from mock data
-            try:
-                ubo_name_set = _extract_ubo_name_set(mock_report.get('ubos', []))
-                mock_report['network_graph'] = build_network_graph(
-                    registration_id,
-                    mock_report.get('hierarchy_data', {}),
-                    ubo_name_set
-                )
-            except Exception as e:
-                logger.warning(f"Failed to build mock network graph: {e}")
-                mock_report['network_graph'] = {'nodes': [], 'edges': []}
-            
-            # Build tree structure from mock data
-            try:
-                mock_report['tree_structure'] = build_tree_structure(
-                    registration_id,
-                    mock_report.get('hierarchy_data', {}),
-                    ubo_name_set
-                )
-            except Exception as e:
-                logger.warning(f"Failed to build mock tree structure: {e}")
-                mock_report['tree_structure'] = None
-            
+        if registration_id == MOCK_REGISTRATION_ID:
             return jsonify({
                 'success': True,
                 'timestamp': datetime.now().isoformat(),
-                'data': mock_report,
+                'data': build_mock_report(registration_id),
                 'is_mock': True
             })
         
@@ -578,135 +855,281 @@ def analyze_company():
         
         logger.info(f"Starting analysis for company: {registration_id}")
         
-        # Perform UBO analysis
-        result = analyze_company_ubo(registration_id)
-        
-        # Convert dataclass response to dictionary if needed
-        if hasattr(result, '__dict__'):
-            result_dict = result.__dict__
-        else:
-            result_dict = result
-        
-        # Extract main company data from hierarchy
-        hierarchy = result_dict.get('hierarchy', {})
-        main_company_data = hierarchy.get(registration_id, {})
-        
-        # Create report from analyzed data (English only)
-        display_name = (
-            main_company_data.get('display_name')
-            or main_company_data.get('name_en')
-            or main_company_data.get('name_th')
-            or registration_id
-        )
-        business_type = (
-            main_company_data.get('business_type_en')
-            or main_company_data.get('business_type')
-            or 'Unknown'
-        )
-
-        # Extract officialSignatory and directors
-        official_signatory_text = main_company_data.get('official_signatory', '')
-        signatory_names = extract_names_from_signatory(official_signatory_text)
-        directors_list = main_company_data.get('directors', [])
-        directors_signatories = build_directors_signatories_table(directors_list, signatory_names)
-        
-        report = {
-            'company_info': {
-                'regis_id': registration_id,
-                'name': display_name,
-                'name_en': display_name,
-                'display_name': display_name,
-                'status': main_company_data.get('status', 'Active'),
-                'capital': main_company_data.get('capital', 'Unknown'),
-                'regis_date': main_company_data.get('regis_date', 'Unknown'),
-                'business_type': business_type,
-                'business_type_en': business_type,
-                'address': main_company_data.get('address', {}),
-                'check_date': result_dict.get('check_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-                'official_signatory': official_signatory_text,
-                'signatory_names': signatory_names,
-                'directors': directors_list,
-                'directors_signatories': directors_signatories
-            },
-            'ubos': [],
-            'checklist': result_dict.get('checklist', {}),
-            'hierarchy_data': hierarchy,
-            'analysis_summary': f"Analysis completed - Checked {result_dict.get('total_companies_checked', 0)} companies, Max level {result_dict.get('max_level_reached', 0)} tiers",
-            'level_summary': {
-                'level_1_count': len([c for c in hierarchy.values() if c.get('level') == 1]),
-                'level_2_count': len([c for c in hierarchy.values() if c.get('level') == 2]),
-                'level_3_count': len([c for c in hierarchy.values() if c.get('level') == 3]),
-                'level_4_count': len([c for c in hierarchy.values() if c.get('level') == 4]),
-                'level_5_count': len([c for c in hierarchy.values() if c.get('level') == 5]),
-                'level_6_count': len([c for c in hierarchy.values() if c.get('level') == 6]),
-                'total_personal': sum(len([s for s in c.get('shareholders', []) if s.get('shareholder_type') == 'personal']) for c in hierarchy.values()),
-                'total_company': sum(len([s for s in c.get('shareholders', []) if s.get('shareholder_type') == 'company']) for c in hierarchy.values())
-            }
-        }
-        
-        # Convert UBO candidates into serialisable dictionaries
-        ubo_candidates = result_dict.get('ubo_candidates', [])
-        for candidate in ubo_candidates:
-            if hasattr(candidate, '__dict__'):
-                candidate_dict = candidate.__dict__
-            else:
-                candidate_dict = candidate
-            nationality = candidate_dict.get('nationality') or 'Unknown'
-            
-            # Include path details for calculation transparency
-            path_details = candidate_dict.get('path_details', [])
-            if hasattr(path_details, '__iter__') and not isinstance(path_details, (str, bytes)):
-                path_details_list = list(path_details)
-            else:
-                path_details_list = []
-                
-            report['ubos'].append({
-                'name': candidate_dict.get('name', 'Unknown'),
-                'total_percentage': candidate_dict.get('total_percentage', 0),
-                'identification_method': f"Method {candidate_dict.get('method', 1)}",
-                'nationality': nationality,
-                'is_director': candidate_dict.get('is_director', False),
-                'ubo_status': 'YES' if candidate_dict.get('total_percentage', 0) >= 15.0 else 'NO',
-                'path_details': path_details_list,
-                'paths_count': len(path_details_list)
-            })
-        
-        # Build network graph (NetworkX-based spider web visualization)
-        try:
-            ubo_name_set = _extract_ubo_name_set(report['ubos'])
-            report['network_graph'] = build_network_graph(
-                registration_id,
-                hierarchy,
-                ubo_name_set
-            )
-        except Exception as e:
-            logger.warning(f"Failed to prepare network graph: {e}")
-            report['network_graph'] = {'nodes': [], 'edges': []}
+        # Perform UBO analysis and build the report, recording per-stage timings
+        with track_analysis() as timings:
+            with timed_stage('analysis'):
+                if data.get('incremental'):
+                    # Reuse the last snapshot's fresh companies and report what changed since
+                    result, changes = incremental_analyzer.analyze(registration_id, freshness_seconds=freshness_seconds,
+                                                                   prune=data.get('prune'), **options)
+                else:
+                    result = analyze_company_ubo(registration_id, prune=data.get('prune'), **options)
+            if engine == 'matrix':
+                with timed_stage('matrix_engine'):
+                    result = apply_matrix_engine(result)
+            report = build_analysis_report(registration_id, result)
+            if data.get('incremental'):
+                report['changes'] = changes
         
-        # Build hierarchical tree structure for D3 visualisation (keep for compatibility)
-        try:
-            report['tree_structure'] = build_tree_structure(
-                registration_id,
-                hierarchy,
-                ubo_name_set
-            )
-        except Exception as e:
-            logger.warning(f"Failed to prepare hierarchy tree data: {e}")
-            report['tree_structure'] = None
         
         # Return report directly (no file writing for Vercel serverless)
         logger.info(f"Analysis completed for {registration_id}")
         
-        return jsonify({
+        payload = {
             'success': True,
             'timestamp': datetime.now().isoformat(),
             'data': report
-        })
+        }
+        if data.get('include_timings') or request.args.get('timings', '').lower() in ('1', 'true', 'yes'):
+            payload['timings'] = timings.as_dict()
+        with timings.stage('json_serialization'):
+            response = jsonify(payload)
+        response.headers['Server-Timing'] = timings.server_timing_header()
+        analysis_metrics.record(timings)
+        return response
         
     except Exception as e:
         logger.error(f"Error in analysis: {e}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_CANDIDATES = 50
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event with a single-line JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+def _running_candidates(context: AnalysisContext, threshold: float) -> List[Dict[str, Any]]:
+    """Current UBO candidate totals, largest first."""
+    candidates = sorted(context.ubo_results.values(), key=lambda c: c.total_percentage, reverse=True)
+    return [{
+        'name': candidate.name,
+        'total_percentage': round(candidate.total_percentage, 4),
+        'paths_count': len(candidate.paths),
+        'ubo_status': 'YES' if candidate.total_percentage >= threshold else 'NO'
+    } for candidate in candidates[:SSE_MAX_CANDIDATES]]
+
+@app.route('/api/analyze/stream', methods=['GET'])
+def analyze_company_stream():
+    """Stream traversal progress as Server-Sent Events, ending with the full report.
+
+    Events: ``start``, one ``company`` per fetched company (node, shareholders,
+    running UBO totals, queue size), then ``result`` (same payload as
+    /api/analyze) or ``error``. Disconnecting cancels the analysis.
+    """
+    registration_id = request.args.get('registration_id', '').strip()
+    if not registration_id:
+        return jsonify({'error': 'Please provide a company registration ID'}), 400
+    
+    events = queue.Queue()
+    cancelled = threading.Event()
+    context = AnalysisContext()
+    
+    def on_progress(progress: Dict[str, Any]) -> None:
+        if cancelled.is_set():
+            raise AnalysisCancelled(registration_id)
+        node = context.hierarchy.get(progress['current_company_id'], {})
+        events.put(('company', dict(
+            progress,
+            company={key: value for key, value in node.items() if key != 'shareholders'},
+            shareholders=node.get('shareholders', []),
+            ubo_candidate_count=len(context.ubo_results),
+            ubo_candidates=_running_candidates(context, ubo_analyzer.threshold_15)
+        )))
+    
+    def run() -> None:
+        try:
+            if registration_id == MOCK_REGISTRATION_ID:
+                events.put(('result', {'success': True, 'timestamp': datetime.now().isoformat(),
+                                       'data': build_mock_report(registration_id), 'is_mock': True}))
+                return
+            with track_analysis() as timings:
+                with timed_stage('analysis'):
+                    result = ubo_analyzer.analyze_company_hierarchy(api_client, registration_id,
+                                                                    progress_callback=on_progress, context=context)
+                report = build_analysis_report(registration_id, result)
+            analysis_metrics.record(timings)
+            events.put(('result', {'success': True, 'timestamp': datetime.now().isoformat(), 'data': report}))
+        except AnalysisCancelled:
+            logger.info(f"Streaming analysis for {registration_id} cancelled (client disconnected)")
+        except Exception as e:
+            logger.error(f"Error in streaming analysis: {e}")
+            events.put(('error', {'error': f'Unexpected error: {str(e)}'}))
+        finally:
+            events.put(None)
+    
+    def generate():
+        threading.Thread(target=run, name=f"ubo-stream-{registration_id}", daemon=True).start()
+        try:
+            yield _sse_event('start', {'registration_id': registration_id})
+            while True:
+                try:
+                    item = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"  # Keeps proxies from closing the idle stream
+                    continue
+                if item is None:
+                    break
+                yield _sse_event(*item)
+        finally:
+            cancelled.set()
+    
+    logger.info(f"Starting streaming analysis for company: {registration_id}")
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs', methods=['POST'])
+def create_analysis_job():
+    """Queue an analysis and return its job ID immediately."""
+    data = request.get_json(silent=True) or {}
+    registration_id = str(data.get('registration_id', '')).strip()
+    if not registration_id:
+        return jsonify({'error': 'Please provide a company registration ID'}), 400
+    
+    try:
+        job = job_manager.submit(registration_id)
+    except JobLimitExceeded as e:
+        return jsonify({'error': f'Too many analyses in progress, try again later ({e})'}), 429
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status,
+        'status_url': f"/api/jobs/{job.job_id}"
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Return job progress, and the report once the job has succeeded."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_analysis_job(job_id):
+    """Cancel a queued or running job."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify({'success': True, 'job': job.to_dict(include_result=False)})
+
+BATCH_MAX_IDS = int(os.getenv('UBO_BATCH_MAX_IDS', '500'))
+BATCH_WORKERS = int(os.getenv('UBO_BATCH_WORKERS', '4'))
+
+# Ownership vectors shared by every batch run with engine=shared
+ownership_analyzer = SharedOwnershipAnalyzer(api_client, create_ownership_cache_from_env())
+incremental_analyzer = create_incremental_analyzer_from_env(api_client, ubo_analyzer)
+
+def _batch_registration_ids() -> List[str]:
+    """Read IDs from a JSON ``registration_ids`` list or an uploaded CSV ``file``.
+
+    A CSV may have a ``registration_id`` header column; otherwise the first
+    column is used. Blank values and duplicates are dropped, order is kept.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        rows = list(csv.reader(io.StringIO(upload.read().decode('utf-8-sig'))))
+        column = 0
+        if rows:
+            header = [cell.strip().lower() for cell in rows[0]]
+            for name in ('registration_id', 'registration id', 'company id'):
+                if name in header:
+                    column = header.index(name)
+                    rows = rows[1:]
+                    break
+        raw_ids = [row[column] for row in rows if len(row) > column]
+    else:
+        data = request.get_json(silent=True) or {}
+        raw_ids = data.get('registration_ids') or []
+        if not isinstance(raw_ids, list):
+            raw_ids = []
+    registration_ids = []
+    for raw_id in raw_ids:
+        registration_id = str(raw_id).strip()
+        if registration_id and registration_id not in registration_ids:
+            registration_ids.append(registration_id)
+    return registration_ids
+
+@app.route('/api/batch', methods=['POST'])
+def analyze_batch():
+    """Screen many companies in one request.
+
+    Analyses run concurrently on the shared ``ubo_analyzer`` and API client,
+    each with its own AnalysisContext, so parent companies common to several
+    IDs are fetched once (cache + request coalescing). The response streams NDJSON, one line per
+    company as it finishes, each in the /api/export_excel ``results`` layout;
+    ``?format=csv`` waits for all companies and returns that CSV instead.
+    
+    ``engine=shared`` (JSON field or query) screens from memoized ownership
+    vectors, so upper tiers common to the portfolio are computed once; it
+    counts every ownership path rather than the first one reached.
+    ``engine=matrix`` traverses as usual, then recomputes totals as
+    integrated ownership over the fetched hierarchy (see ubo_matrix).
+    """
+    registration_ids = _batch_registration_ids()
+    if not registration_ids:
+        return jsonify({'error': 'Please provide registration_ids or a CSV file of registration IDs'}), 400
+    if len(registration_ids) > BATCH_MAX_IDS:
+        return jsonify({'error': f'Too many registration IDs ({len(registration_ids)}), maximum is {BATCH_MAX_IDS}'}), 400
+    output_format = request.args.get('format', 'ndjson').lower()
+    engine = (request.args.get('engine') or (request.get_json(silent=True) or {}).get('engine')
+              or request.form.get('engine') or 'bfs').lower()
+    if engine not in ('bfs', 'shared', 'matrix'):
+        return jsonify({'error': f"Unknown engine '{engine}', expected 'bfs', 'shared' or 'matrix'"}), 400
+    cancelled = threading.Event()
+    
+    def on_progress(progress: Dict[str, Any]) -> None:
+        if cancelled.is_set():
+            raise AnalysisCancelled(progress['current_company_id'])
+    
+    def screen(index: int, registration_id: str) -> Dict[str, Any]:
+        line = {'index': index, 'registration_id': registration_id}
+        try:
+            with track_analysis() as timings:
+                with timed_stage('analysis'):
+                    if engine == 'shared':
+                        result = ownership_analyzer.analyze(registration_id)
+                    else:
+                        result = ubo_analyzer.analyze_company_hierarchy(
+                            api_client, registration_id, progress_callback=on_progress
+                        )
+                if engine == 'matrix':
+                    with timed_stage('matrix_engine'):
+                        result = apply_matrix_engine(result)
+            analysis_metrics.record(timings)
+            line.update(build_export_record(registration_id, result), success=True)
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Batch analysis failed for {registration_id}: {e}")
+            line.update(success=False, error=str(e))
+        return line
+    
+    def screen_all():
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(registration_ids))),
+                                      thread_name_prefix='ubo-batch')
+        try:
+            futures = [executor.submit(screen, index, registration_id)
+                       for index, registration_id in enumerate(registration_ids)]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            cancelled.set()  # Client went away (or we are done): stop running analyses
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    logger.info(f"Starting batch screening of {len(registration_ids)} companies ({engine} engine)")
+    if output_format == 'csv':
+        results = sorted(screen_all(), key=lambda line: line['index'])
+        return _csv_download(build_export_csv(results))
+    
+    def generate():
+        for line in screen_all():
+            yield json.dumps(line, ensure_ascii=False, default=str) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/export_excel', methods=['POST'])
 def export_excel():
     """Export analysis results to CSV (Excel-compatible format)."""
@@ -717,74 +1140,7 @@ def export_excel():
         if not results:
             return jsonify({'error': 'No data available for export'}), 400
         
-        # Build CSV data (no pandas needed)
-        import csv
-        import io
-        
-        csv_data = []
-        headers = ['Company ID', 'Company Name', 'Check Date', 'Method Used', 'Max Level', 
-                   'Companies Checked', 'Risk Level', 'Compliance Status', 'Total UBO Candidates', 
-                   'Final UBOs', 'UBO Name', 'UBO Method', 'UBO Percentage', 'UBO Paths', 
-                   'Is Director', 'Position']
-        
-        for result in results:
-            if 'error' in result:
-                continue
-                
-            company_info = result.get('company_info', {})
-            analysis_summary = result.get('analysis_summary', {})
-            ubo_results = result.get('ubo_results', {})
-            
-            # Base row
-            base_row = [
-                company_info.get('id', ''),
-                company_info.get('name', ''),
-                company_info.get('check_date', ''),
-                analysis_summary.get('method_used', ''),
-                analysis_summary.get('max_level_reached', ''),
-                analysis_summary.get('total_companies_checked', ''),
-                analysis_summary.get('risk_level', ''),
-                analysis_summary.get('compliance_status', ''),
-                ubo_results.get('total_candidates', ''),
-                ubo_results.get('final_ubos', '')
-            ]
-            
-            # UBO details
-            ubo_details = ubo_results.get('ubo_details', [])
-            if ubo_details:
-                for ubo in ubo_details:
-                    row = base_row + [
-                        ubo.get('name', ''),
-                        ubo.get('method', ''),
-                        ubo.get('total_percentage', ''),
-                        len(ubo.get('paths', [])),
-                        ubo.get('is_director', False),
-                        ubo.get('position', '')
-                    ]
-                    csv_data.append(row)
-            else:
-                csv_data.append(base_row + ['', '', '', '', '', ''])
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(csv_data)
-        
-        # Return CSV data directly (no file writing for Vercel)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        csv_filename = f"ubo_analysis_{timestamp}.csv"
-        csv_content = output.getvalue()
-        
-        # Return as downloadable response
-        from io import BytesIO
-        from flask import make_response
-        
-        response = make_response(csv_content)
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8-sig'
-        response.headers['Content-Disposition'] = f'attachment; filename={csv_filename}'
-        
-        return response
+        return _csv_download(build_export_csv(results))
         
     except Exception as e:
         logger.error(f"Error exporting to CSV: {e}")
@@ -804,9 +1160,31 @@ def system_status():
     return jsonify({
         'status': 'running',
         'ubo_system_initialized': ubo_system is not None,
+        'company_cache': company_cache.stats(),
+        'negative_cache': api_client.negative_cache.stats(),
+        'request_coalescing': api_client.singleflight.stats(),
+        'enlite_concurrency': api_client.limiter.stats() if api_client.limiter is not None else None,
+        'circuit_breaker': api_client.breaker.stats() if api_client.breaker is not None else None,
+        'hedging': api_client.hedging.stats() if api_client.hedging is not None else None,
+        'ownership_vectors': ownership_analyzer.cache.stats(),
+        'snapshots': incremental_analyzer.store.stats(),
+        'jobs': job_manager.stats(),
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     })
 
+@app.route('/api/metrics')
+def analysis_metrics_summary():
+    """Return per-stage timing aggregates for analyses served by this process."""
+    return jsonify({
+        'analysis': analysis_metrics.snapshot(),
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of Enlite client and analyzer metrics."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Resource not found'}), 404
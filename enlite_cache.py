@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Pluggable cache backends for parsed Enlite company data."""
+
+import json
+import logging
+import marshal
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def approximate_size(value: Any) -> int:
+    """Rough in-memory footprint of nested dict/list/str data, in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+# Low-cardinality fields repeated across thousands of records (one str object per distinct value)
+INTERNED_FIELDS = frozenset({
+    'nationality', 'business_status', 'directorship', 'shareholder_type', 'business_type', 'title',
+    'company_status', 'business_type_en', 'business_type_th', 'province', 'district', 'sub_district'
+})
+
+
+def intern_fields(value: Any, fields: frozenset = INTERNED_FIELDS) -> Any:
+    """Intern the string values of ``fields`` throughout nested dicts/lists, in place."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, str):
+                if key in fields:
+                    value[key] = sys.intern(item)
+            elif isinstance(item, (dict, list)):
+                intern_fields(item, fields)
+    elif isinstance(value, list):
+        for item in value:
+            intern_fields(item, fields)
+    return value
+
+
+def encode_record(value: Dict[str, Any], level: int = 6) -> bytes:
+    """Compact form of a parsed record: marshal (same interpreter only) compressed with zlib."""
+    return zlib.compress(marshal.dumps(value), level)
+
+
+def decode_record(blob: bytes) -> Dict[str, Any]:
+    return marshal.loads(zlib.decompress(blob))
+
+
+class CompanyDataCache:
+    """Base interface for company-data caches keyed by registration ID.
+
+    Entries younger than ``ttl_seconds`` are fresh. For ``stale_ttl_seconds``
+    after that they are still served by ``lookup`` but flagged stale so the
+    caller can refresh them in the background; older entries are dropped.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, stale_ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds or 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return (stored_at, value) for a key, or None."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store parsed company data."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return (value, is_stale); value is None on a miss or expired entry."""
+        entry = self._load(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if self.ttl_seconds is None or age <= self.ttl_seconds:
+                self._record('hits')
+                return entry[1], False
+            if age <= self.ttl_seconds + self.stale_ttl_seconds:
+                self._record('stale_hits')
+                return entry[1], True
+            self.delete(key)
+        self._record('misses')
+        return None, False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached data (fresh or stale), or None."""
+        return self.lookup(key)[0]
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def _record(self, counter: str) -> None:
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this process."""
+        served = self.hits + self.stale_hits
+        lookups = served + self.misses
+        return {
+            'backend': type(self).__name__,
+            'entries': len(self),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': round(served / lookups, 4) if lookups else 0.0,
+            'ttl_seconds': self.ttl_seconds,
+            'stale_ttl_seconds': self.stale_ttl_seconds
+        }
+
+
+class InMemoryCompanyCache(CompanyDataCache):
+    """Process-local LRU cache bounded by entry count and/or approximate bytes.
+
+    With ``compact`` each record is held as one compressed blob (see
+    encode_record) and decoded on every lookup, so callers get a private copy
+    and an entry costs about a sixth of the nested dicts, at roughly 20x the
+    CPU per hit; ``max_bytes`` then counts blob sizes. ``intern`` shares
+    repeated field values (nationality, statuses) between records; it runs
+    once per set, before encoding when compact.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, stale_ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 compact: bool = False, intern: bool = False):
+        super().__init__(ttl_seconds, stale_ttl_seconds)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self.intern = intern
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (stored_at, value or compact blob, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+        if not self.compact:
+            return entry[0], entry[1]
+        return entry[0], decode_record(entry[1])  # Outside the lock: decoding is the expensive part
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        if self.intern:
+            intern_fields(value)
+        if self.compact:
+            value = encode_record(value)
+            size = sys.getsizeof(value)
+        else:
+            size = approximate_size(value) if self.max_bytes else 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (time.time(), value, size)
+            self._bytes += size
+            while self._data and (
+                (self.max_entries and len(self._data) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes and len(self._data) > 1)
+            ):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        tracked = self.compact or self.max_bytes
+        stats.update({
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'compact': self.compact,
+            'intern': self.intern,
+            'approx_bytes': self._bytes if tracked else None,
+            'bytes_per_entry': round(self._bytes / len(self._data)) if tracked and self._data else None,
+            'evictions': self.evictions
+        })
+        return stats
+
+
+class SQLiteCompanyCache(CompanyDataCache):
+    """On-disk cache shared by every worker process on the host.
+
+    Entries expire after ``ttl_seconds``; once more than ``max_entries`` are
+    stored the least recently used ones are evicted. Reads do not write:
+    access times older than ``access_resolution_seconds`` are buffered and
+    written in one transaction per ``access_batch`` reads (or per resolution
+    interval), and before every eviction.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = 86400,
+                 max_entries: Optional[int] = 10000, stale_ttl_seconds: Optional[float] = None,
+                 access_resolution_seconds: float = 60.0, access_batch: int = 100):
+        super().__init__(ttl_seconds, stale_ttl_seconds)
+        self.path = path
+        self.max_entries = max_entries
+        self.access_resolution_seconds = access_resolution_seconds
+        self.access_batch = access_batch
+        self._accessed = {}  # key -> access time not yet written
+        self._accessed_lock = threading.Lock()
+        self._accessed_flushed_at = time.time()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS company_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_company_cache_access ON company_cache(last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not shareable)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, stored_at, last_access FROM company_cache WHERE key = ?",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[2] >= self.access_resolution_seconds and self._note_access(key, now):
+                try:
+                    with conn:
+                        self._flush_access(conn)
+                except sqlite3.Error as e:
+                    logger.warning(f"Company cache access-time update failed: {e}")
+            return row[1], json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Company cache read failed for {key}: {e}")
+            return None
+
+    def _note_access(self, key: str, accessed_at: float) -> bool:
+        """Buffer an access time; True when the buffer is due to be written."""
+        with self._accessed_lock:
+            self._accessed[key] = accessed_at
+            return (len(self._accessed) >= self.access_batch
+                    or accessed_at - self._accessed_flushed_at >= self.access_resolution_seconds)
+
+    def _flush_access(self, conn: sqlite3.Connection) -> None:
+        """Write buffered access times; call inside a transaction."""
+        with self._accessed_lock:
+            pending, self._accessed = self._accessed, {}
+            self._accessed_flushed_at = time.time()
+        if pending:
+            conn.executemany("UPDATE company_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                             [(accessed_at, key) for key, accessed_at in pending.items()])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            now = time.time()
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO company_cache (key, value, stored_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                if self.max_entries:
+                    self._flush_access(conn)  # Evict by up-to-date access times
+                    conn.execute(
+                        "DELETE FROM company_cache WHERE key IN ("
+                        " SELECT key FROM company_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Company cache write failed for {key}: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM company_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Company cache delete failed for {key}: {e}")
+
+    def clear(self) -> None:
+        with self._accessed_lock:
+            self._accessed.clear()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM company_cache")
+        except sqlite3.Error as e:
+            logger.warning(f"Company cache clear failed: {e}")
+
+    def __len__(self) -> int:
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM company_cache").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({'path': self.path, 'max_entries': self.max_entries})
+        return stats
+
+
+NOT_FOUND = 'not_found'  # Enlite answered with an empty <return/>
+PARSE_ERROR = 'parse_error'  # The response could not be parsed
+UPSTREAM_ERROR = 'upstream_error'  # Timeout, connection error or non-200 after retries
+
+
+class NegativeCompanyCache:
+    """Short-lived, process-local record of lookups that returned no company.
+
+    Kept apart from the company-data cache so failures never displace or
+    masquerade as company data. Upstream errors usually get a shorter TTL
+    than answers Enlite gave deliberately (not found, unparseable).
+    """
+
+    def __init__(self, ttl_seconds: float = 600.0, error_ttl_seconds: float = 30.0,
+                 max_entries: Optional[int] = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.error_ttl_seconds = error_ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stored = {NOT_FOUND: 0, PARSE_ERROR: 0, UPSTREAM_ERROR: 0}
+        self._data = OrderedDict()  # key -> (expires_at, reason)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the reason a recent lookup of ``key`` failed, or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry[0]:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, reason: str) -> None:
+        ttl = self.error_ttl_seconds if reason == UPSTREAM_ERROR else self.ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + ttl, reason)
+            self.stored[reason] = self.stored.get(reason, 0) + 1
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'hits': self.hits,
+                'stored': dict(self.stored),
+                'ttl_seconds': self.ttl_seconds,
+                'error_ttl_seconds': self.error_ttl_seconds,
+                'max_entries': self.max_entries
+            }
+
+
+def create_negative_cache_from_env() -> NegativeCompanyCache:
+    """Negative cache configured by ENLITE_NEGATIVE_CACHE_* variables (a TTL of 0 disables that kind)."""
+    return NegativeCompanyCache(
+        ttl_seconds=float(os.getenv('ENLITE_NEGATIVE_CACHE_TTL', '600')),
+        error_ttl_seconds=float(os.getenv('ENLITE_NEGATIVE_CACHE_ERROR_TTL', '30')),
+        max_entries=int(os.getenv('ENLITE_NEGATIVE_CACHE_MAX_ENTRIES', '10000')) or None
+    )
+
+
+def create_company_cache_from_env() -> CompanyDataCache:
+    """Build the cache backend selected by ENLITE_CACHE_* environment variables."""
+    backend = os.getenv('ENLITE_CACHE_BACKEND', 'memory').strip().lower()
+    ttl = os.getenv('ENLITE_CACHE_TTL')
+    ttl_seconds = float(ttl) if ttl else None
+    stale_ttl_seconds = float(os.getenv('ENLITE_CACHE_STALE_TTL', '0'))
+    max_entries = int(os.getenv('ENLITE_CACHE_MAX_ENTRIES', '10000')) or None
+
+    if backend == 'sqlite':
+        path = os.getenv('ENLITE_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'enlite_company_cache.sqlite3')
+        logger.info(f"Using SQLite company cache at {path}")
+        return SQLiteCompanyCache(path, ttl_seconds=ttl_seconds or 86400, max_entries=max_entries,
+                                  stale_ttl_seconds=stale_ttl_seconds)
+
+    if backend != 'memory':
+        logger.warning(f"Unknown ENLITE_CACHE_BACKEND '{backend}', falling back to memory")
+    max_bytes = int(os.getenv('ENLITE_CACHE_MAX_BYTES', '0')) or None
+    return InMemoryCompanyCache(ttl_seconds=ttl_seconds, stale_ttl_seconds=stale_ttl_seconds,
+                                max_entries=max_entries, max_bytes=max_bytes,
+                                compact=os.getenv('ENLITE_CACHE_COMPACT', '0').strip().lower() not in ('0', 'false', 'no'),
+                                intern=os.getenv('ENLITE_CACHE_INTERN', '1').strip().lower() not in ('0', 'false', 'no'))
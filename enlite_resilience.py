@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Traffic-control helpers for calls to the Enlite API."""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from ubo_metrics import ENLITE_CONCURRENCY_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in flight
+    wait on the same future and receive its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            logger.info(f"Waiting for in-flight request for {key}")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how many upstream calls ran and how many were saved by coalescing."""
+        total = self.executed + self.coalesced
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'saved_ratio': round(self.coalesced / total, 4) if total else 0.0,
+            'in_flight': len(self._calls)
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """asyncio variant of SingleFlight for coroutines on one event loop.
+
+    The call runs as its own task and every caller, the first included, awaits
+    it through ``asyncio.shield``. A cancelled caller therefore only stops
+    waiting; the call itself is cancelled once no caller is left.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._waiters = {}  # task -> callers still awaiting it
+
+    async def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._calls.get(key)
+            if task is not None and task.get_loop() is not loop:
+                task = None  # Left over from a finished event loop
+            if task is None:
+                task = loop.create_task(fn(*args, **kwargs))
+                task.add_done_callback(lambda done, key=key: self._forget(key, done))
+                self._calls[key] = task
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            self._waiters[task] = self._waiters.get(task, 0) + 1
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            with self._lock:
+                self._waiters[task] -= 1
+                abandoned = not self._waiters[task]
+                if abandoned:
+                    del self._waiters[task]
+            if abandoned and not task.done():
+                task.cancel()  # Every caller was cancelled
+
+    def _forget(self, key: str, task: 'asyncio.Task') -> None:
+        with self._lock:
+            if self._calls.get(key) is task:
+                self._calls.pop(key, None)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Process-wide AIMD cap on in-flight Enlite calls, shared by the sync and async clients.
+
+    Every ``limit`` healthy responses received while callers were queued at
+    the cap raise the limit by one (additive increase). A timeout, connection
+    error, 429 or 5xx, or a short-term average latency above
+    ``latency_tolerance`` times the long-term one, multiplies it by ``backoff``
+    (multiplicative decrease), at most once per round trip so one burst of
+    failures counts once. Comparing two averages rather than a minimum keeps
+    steady overheads from reading as congestion, and a permanently slower
+    upstream becomes the new long-term normal.
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0,
+                 smoothing: float = 0.2, baseline_smoothing: float = 0.01):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_smoothing = baseline_smoothing
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.waits = 0
+        self._latency = None  # Short-term average latency of healthy responses, seconds
+        self._baseline = None  # Long-term average
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = deque()  # (loop, future) queued by acquire_async
+        self._reported_limit = 0
+        self._report_limit()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def acquire(self) -> None:
+        """Block until a call may start."""
+        with self._cond:
+            if self.in_flight >= self.current_limit:
+                self.waits += 1
+                while self.in_flight >= self.current_limit:
+                    self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until a call may start."""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.in_flight < self.current_limit and not self._async_waiters:
+                self.in_flight += 1
+                return
+            self.waits += 1
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._cond:
+                if (loop, future) in self._async_waiters:
+                    self._async_waiters.remove((loop, future))
+                elif future.done() and not future.cancelled():
+                    self._release_slot()  # Granted just before the cancellation
+            raise
+
+    def release(self, outcome: str = 'ok', latency: Optional[float] = None) -> None:
+        """Finish a call: ``outcome`` is 'ok', 'overload' (backs off) or 'error' (no signal)."""
+        with self._cond:
+            self._feedback(outcome, latency)
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._async_waiters and self.in_flight < self.current_limit:
+            loop, future = self._async_waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:  # Loop already closed
+                self.in_flight -= 1
+        self._cond.notify_all()
+
+    def _grant(self, future: 'asyncio.Future') -> None:
+        if future.cancelled():
+            with self._cond:
+                self._release_slot()
+        else:
+            future.set_result(None)
+
+    def _feedback(self, outcome: str, latency: Optional[float]) -> None:
+        now = time.monotonic()
+        if outcome == 'overload':
+            self._decrease(now, 'upstream overload')
+        elif outcome == 'ok' and latency is not None:
+            self._latency = latency if self._latency is None else \
+                self._latency + self.smoothing * (latency - self._latency)
+            self._baseline = latency if self._baseline is None else \
+                self._baseline + self.baseline_smoothing * (latency - self._baseline)
+            if self._latency > self.latency_tolerance * self._baseline:
+                self._decrease(now, f"latency {self._latency:.2f}s over baseline {self._baseline:.2f}s")
+            elif self.in_flight >= self.current_limit and self.limit < self.max_limit:
+                # Only grow while the cap is actually what holds callers back
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                if int(self.limit) > self._reported_limit:
+                    self.increases += 1
+                    self._report_limit()
+                    self._wake()
+
+    def _decrease(self, now: float, reason: str) -> None:
+        if now - self._last_decrease < (self._latency or 0.0):
+            return
+        self._last_decrease = now
+        limit = max(float(self.min_limit), self.limit * self.backoff)
+        if int(limit) < int(self.limit):
+            self.decreases += 1
+            logger.warning(f"Enlite concurrency limit {int(self.limit)} -> {int(limit)} ({reason})")
+        self.limit = limit
+        self._report_limit()
+
+    def _report_limit(self) -> None:
+        ENLITE_CONCURRENCY_LIMIT.inc(amount=self.current_limit - self._reported_limit)
+        self._reported_limit = self.current_limit
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'limit': self.current_limit,
+                'in_flight': self.in_flight,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'queued_async': len(self._async_waiters),
+                'latency_ms': round(self._latency * 1000, 1) if self._latency is not None else None,
+                'baseline_ms': round(self._baseline * 1000, 1) if self._baseline is not None else None,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'waits': self.waits
+            }
+
+
+def create_limiter_from_env() -> Optional[AdaptiveConcurrencyLimiter]:
+    """Build the limiter configured by ENLITE_ADAPTIVE_* variables, or None when disabled."""
+    if os.getenv('ENLITE_ADAPTIVE_CONCURRENCY', '1').strip().lower() in ('0', 'false', 'no'):
+        return None
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=int(os.getenv('ENLITE_ADAPTIVE_INITIAL', '4')),
+        min_limit=int(os.getenv('ENLITE_ADAPTIVE_MIN', '1')),
+        max_limit=int(os.getenv('ENLITE_ADAPTIVE_MAX', '64')),
+        backoff=float(os.getenv('ENLITE_ADAPTIVE_BACKOFF', '0.5')),
+        latency_tolerance=float(os.getenv('ENLITE_ADAPTIVE_LATENCY_TOLERANCE', '2.0'))
+    )
+
+
+@dataclass
+class RetryPolicy:
+    """Retries of failed Enlite calls with full-jitter exponential backoff."""
+    retries: int = 2
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to sleep before retry number ``attempt`` (0-based), honouring Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class CircuitBreaker:
+    """Fail fast once Enlite is clearly down.
+
+    Opens after ``failure_threshold`` consecutive failed calls (timeouts,
+    connection errors, 5xx, unexpected errors). While open every call is
+    rejected at once; after ``reset_seconds`` one probe is let through
+    (half-open) and its outcome closes the breaker or opens it again. A probe
+    that reports nothing within ``probe_timeout_seconds`` (default: the reset
+    period) is treated as lost and another one is allowed. Only the probe can
+    close the breaker: successes of calls sent before it (``sent_at``, on the
+    time.monotonic clock) arrive late and are ignored.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 probe_timeout_seconds: Optional[float] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.probe_timeout_seconds = reset_seconds if probe_timeout_seconds is None else probe_timeout_seconds
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Return whether a call may go out now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN and (
+                    not self._probing or now - self._probe_started >= self.probe_timeout_seconds):
+                self._probing = True  # Exactly one probe at a time; a lost one expires
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, sent_at: Optional[float] = None) -> None:
+        with self._lock:
+            if self._state == self.OPEN or (
+                    self._state == self.HALF_OPEN and sent_at is not None and sent_at < self._probe_started):
+                return  # Not the probe
+            if self._state != self.CLOSED:
+                logger.info("Enlite circuit closed")
+            self._state = self.CLOSED
+            self._probing = False
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                logger.error(f"Enlite circuit opened after {self.consecutive_failures} consecutive failures; "
+                             f"failing fast for {self.reset_seconds:.0f}s")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'failure_threshold': self.failure_threshold,
+            'reset_seconds': self.reset_seconds,
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
+
+
+def create_retry_policy_from_env() -> RetryPolicy:
+    """Retry policy configured by ENLITE_RETRY_* variables."""
+    return RetryPolicy(
+        retries=int(os.getenv('ENLITE_RETRIES', '2')),
+        base_delay=float(os.getenv('ENLITE_RETRY_BASE_DELAY', '0.5')),
+        max_delay=float(os.getenv('ENLITE_RETRY_MAX_DELAY', '8'))
+    )
+
+
+def create_breaker_from_env() -> CircuitBreaker:
+    """Circuit breaker configured by ENLITE_BREAKER_* variables."""
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv('ENLITE_BREAKER_FAILURES', '5')),
+        reset_seconds=float(os.getenv('ENLITE_BREAKER_RESET_SECONDS', '30'))
+    )
+
+
+class HedgingPolicy:
+    """When to send a backup copy of a slow Enlite call, and how many to allow.
+
+    A call still running after the ``percentile`` of the last ``window``
+    completed calls (never less than ``min_delay``) is hedged: a duplicate
+    goes out and whichever answers first wins. Nothing is hedged before
+    ``min_samples`` calls have completed. Extra load is capped by a token
+    bucket shared by every client: each call earns ``budget_ratio`` of a
+    token (up to ``burst``) and each hedge spends one, so hedges stay below
+    about ``budget_ratio`` of traffic even when Enlite slows down as a whole.
+    The percentile is recomputed every ``refresh_every`` new samples rather
+    than on each call.
+    """
+
+    def __init__(self, percentile: float = 95.0, window: int = 500, min_samples: int = 20,
+                 min_delay: float = 0.05, budget_ratio: float = 0.05, burst: float = 10.0,
+                 refresh_every: int = 20):
+        self.percentile = percentile
+        self.refresh_every = refresh_every
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self._latencies = deque(maxlen=window)
+        self._cached_delay = None
+        self._new_samples = 0  # Recorded since _cached_delay was computed
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def _delay(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        if self._cached_delay is None or self._new_samples >= self.refresh_every:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+            self._cached_delay = max(self.min_delay, ordered[index])
+            self._new_samples = 0
+        return self._cached_delay
+
+    def start_call(self) -> Optional[float]:
+        """Register a call; return seconds to wait before hedging it, or None while warming up."""
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.burst, self._tokens + self.budget_ratio)
+            return self._delay()
+
+    def try_hedge(self) -> bool:
+        """Spend one hedge from the budget; False when the budget is used up."""
+        with self._lock:
+            if self._tokens < 1.0:
+                self.denied += 1
+                return False
+            self._tokens -= 1.0
+            self.hedges += 1
+            return True
+
+    def record(self, latency: float) -> None:
+        """Add the latency of one completed request, primary or hedge."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._new_samples += 1
+
+    def record_win(self) -> None:
+        """The hedge answered before the primary."""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            delay = self._delay()
+            return {
+                'percentile': self.percentile,
+                'hedge_delay_ms': round(delay * 1000, 1) if delay is not None else None,
+                'samples': len(self._latencies),
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'denied': self.denied,
+                'budget_ratio': self.budget_ratio,
+                'tokens': round(self._tokens, 2)
+            }
+
+
+def create_hedging_from_env() -> Optional[HedgingPolicy]:
+    """Build the hedging policy configured by ENLITE_HEDGE_* variables, or None when disabled."""
+    if os.getenv('ENLITE_HEDGING', '0').strip().lower() in ('0', 'false', 'no', ''):
+        return None
+    return HedgingPolicy(
+        percentile=float(os.getenv('ENLITE_HEDGE_PERCENTILE', '95')),
+        min_samples=int(os.getenv('ENLITE_HEDGE_MIN_SAMPLES', '20')),
+        min_delay=float(os.getenv('ENLITE_HEDGE_MIN_DELAY', '0.05')),
+        budget_ratio=float(os.getenv('ENLITE_HEDGE_BUDGET', '0.05'))
+    )
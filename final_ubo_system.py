@@ -4,18 +4,121 @@
 
 import requests
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
+from dataclasses import dataclass, asdict, field
 from datetime import datetime
 import logging
 from collections import deque
+import heapq
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import io
 import json
 import os
+import threading
+import asyncio
+import contextvars
+import time
+
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None  # Streaming parser falls back to xml.etree.ElementTree.iterparse
+
+from enlite_cache import (NOT_FOUND, PARSE_ERROR, UPSTREAM_ERROR, CompanyDataCache, InMemoryCompanyCache,
+                          NegativeCompanyCache, create_company_cache_from_env, create_negative_cache_from_env)
+from enlite_resilience import (AdaptiveConcurrencyLimiter, AsyncSingleFlight, CircuitBreaker, HedgingPolicy, RetryPolicy,
+                               SingleFlight, create_breaker_from_env, create_hedging_from_env, create_limiter_from_env,
+                               create_retry_policy_from_env)
+from ubo_instrumentation import count, timed_stage
+from ubo_metrics import ANALYSES_IN_FLIGHT, CACHE_LOOKUPS, record_analysis, record_enlite_request
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # Optional: only needed by AsyncEnliteAPIClient
+# Connect timeouts are retried, read timeouts are not; aiohttp < 3.10 cannot tell them apart
+AIOHTTP_CONNECT_TIMEOUT = getattr(aiohttp, 'ConnectionTimeoutError', ())
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class AnalysisCancelled(Exception):
+    """Raised from a progress callback to stop an analysis early."""
+
+_current_analysis = contextvars.ContextVar('ubo_analysis_context', default=None)
+
+def _note_fetch(counter: str) -> None:
+    """Count an Enlite call, retry or fast-fail against the running analysis (and its timings)."""
+    count(counter)
+    context = _current_analysis.get()
+    if context is not None:
+        context.note(counter)
+
+def _note_lookup_failure(registration_id: str, reason: str) -> None:
+    """Record why a company could not be looked up against the running analysis."""
+    count(f'lookup_{reason}')
+    context = _current_analysis.get()
+    if context is not None:
+        context.note_failure(registration_id, reason)
+
+def _lookup_failure(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Why a fetch yielded no company (a negative-cache reason), or None when it did."""
+    if data is None:
+        return UPSTREAM_ERROR
+    if not data:
+        return PARSE_ERROR  # The parser returns {} for responses it cannot read
+    if not (data.get('profile') or data.get('shareholders') or data.get('directors')):
+        return NOT_FOUND  # Enlite answers unknown IDs with an empty <return/>
+    return None
+
+def _record_breaker(breaker: Optional[CircuitBreaker], failed: bool, sent_at: Optional[float] = None) -> None:
+    """Report a call outcome to the circuit breaker; any answer below 500 shows Enlite is up."""
+    if breaker is not None:
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success(sent_at)
+
+def _hedge_won(status: int) -> bool:
+    """Whether a finished request can end a hedged call; a 429 or 5xx waits for the other copy."""
+    return _limiter_outcome(status) != 'overload'
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds from a numeric Retry-After header, else None."""
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class BestFirstQueue:
+    """Task queue with the deque interface the analyzer uses, largest effective % first.
+
+    Ties keep insertion order, so equal holdings are processed breadth-first.
+    """
+    
+    def __init__(self, tasks=()):
+        self._heap = []
+        self._order = itertools.count()
+        for task in tasks:
+            self.append(task)
+    
+    def append(self, task: Tuple[str, float, int, List[Dict[str, Any]]]) -> None:
+        heapq.heappush(self._heap, (-task[1], next(self._order), task))
+    
+    def popleft(self) -> Tuple[str, float, int, List[Dict[str, Any]]]:
+        return heapq.heappop(self._heap)[2]
+    
+    appendleft = append  # Position depends only on the effective percentage
+    
+    def __iter__(self):
+        """Iterate in processing order."""
+        return (entry[2] for entry in sorted(self._heap))
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+
 @dataclass
 class Shareholder:
     """Shareholder data model."""
@@ -47,6 +150,7 @@ class UBOCandidate:
     nationality: Optional[str] = None
     is_director: bool = False
     path_details: List[Dict[str, Any]] = None  # Detailed path calculation info
+    path_count: Optional[int] = None  # Set when paths were aggregated without being listed
     
     def __post_init__(self):
         if self.path_details is None:
@@ -66,35 +170,28 @@ class UBOAnalysisResult:
     total_companies_checked: int
     max_level_reached: int
     check_date: str
+    traversal: str = 'bfs'
+    coverage_percentage: float = 100.0  # Ownership mass resolved; the rest was left queued or pruned
+    budget_exhausted: Optional[str] = None  # 'time', 'calls' or 'companies' when a budget stopped the traversal
+    partial: bool = False  # True when a budget stopped the traversal or a company could not be fetched
+    unexplored: List[Dict[str, Any]] = field(default_factory=list)  # Largest unexplored branches, by effective %
+    enlite_health: Dict[str, Any] = field(default_factory=dict)  # Retries, failed fetches and circuit-breaker state
 
-class FinalEnliteAPIClient:
-    """Thin client for the Enlite SOAP API."""
-    
-    def __init__(self, api_key: str, base_url: str = "https://enlite.lhb.co.th"):
-        self.api_key = api_key
-        self.base_url = base_url
-        self.session = requests.Session()
-        self.session.headers.update({
-            'x-api-key': api_key,
-            'Content-Type': 'text/xml',
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Cache-Control': 'no-cache',
-            'User-Agent': 'Final-UBO-System/1.0'
-        })
-        self.cache = {}
-        self.rate_limit_delay = 0.5
-    
-    def get_company_data(self, registration_id: str, language: str = "EN") -> Optional[Dict[str, Any]]:
-        """Fetch company data from the Enlite API."""
-        if registration_id in self.cache:
-            logger.info(f"Using cached data for {registration_id}")
-            return self.cache[registration_id]
-        
-        try:
-            # Build SOAP request payload
-            soap_body = f"""<?xml version="1.0" encoding="utf-8"?>
+def build_request_headers(api_key: str) -> Dict[str, str]:
+    """HTTP headers shared by the sync and async Enlite clients."""
+    return {
+        'x-api-key': api_key,
+        'Content-Type': 'text/xml',
+        'Accept': '*/*',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Cache-Control': 'no-cache',
+        'User-Agent': 'Final-UBO-System/1.0'
+    }
+
+def build_soap_request(registration_id: str) -> str:
+    """Build the getDataEnlite SOAP envelope for a registration ID."""
+    return f"""<?xml version="1.0" encoding="utf-8"?>
 <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:eh="http://eh.actimize.com" xmlns:view="http://view.bol.com/">
     <soapenv:Header/>
     <soapenv:Body>
@@ -104,38 +201,112 @@ class FinalEnliteAPIClient:
         </view:getDataEnlite>
     </soapenv:Body>
 </soapenv:Envelope>"""
-            
-            url = f"{self.base_url}/enlitews/companyData"
-            logger.info(f"Making API request to: {url} for {registration_id}")
-            
-            timeout = int(os.getenv('ENLITE_API_TIMEOUT', '60'))
-            response = self.session.post(url, data=soap_body, timeout=timeout)
-            logger.info(f"Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                # Force UTF-8 encoding for Thai text
-                response_text = response.content.decode('utf-8')
-                data = self._parse_company_data(response_text)
-                self.cache[registration_id] = data
-                return data
-            else:
-                logger.error(f"API request failed with status {response.status_code}")
-                return None
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout error for {registration_id} - API took too long to respond")
-            return None
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Connection error for {registration_id} - Unable to connect to API")
-            return None
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error for {registration_id}: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error for {registration_id}: {e}")
-            return None
+
+# Responses this large are stream-parsed: about a third of the tree parser's peak memory for 10-40% more CPU
+STREAM_PARSE_MIN_BYTES = 1024 * 1024
+
+# Elements the streaming parser reacts to (lets lxml skip events for everything else)
+STREAM_PARSE_TAGS = ('return', 'profileSummary', 'officialSignatory', 'director', 'heldBy', 'levelHeldBy', 'data')
+
+# Field extraction tables (XML child tag -> output key), filled by a single child walk
+PROFILE_FIELDS = {
+    'nameThFull': 'name_th_full',
+    'nameTh': 'name_th',
+    'businessTypeTh': 'business_type_th',
+    'nameEnFull': 'name_en_full',
+    'nameEn': 'name_en',
+    'businessTypeEn': 'business_type_en',
+    'regisId': 'regis_id',
+    'companyStatus': 'company_status',
+    'capital': 'capital',
+    'regisDate': 'regis_date',
+    'setSymbol': 'set_symbol'
+}
+ADDRESS_FIELDS = {
+    'addressNo': 'address_no',
+    'moo': 'moo',
+    'buildingEn': 'building_en',
+    'buildingTh': 'building_th',
+    'floor': 'floor',
+    'soiEn': 'soi_en',
+    'soiTh': 'soi_th',
+    'roadEn': 'road_en',
+    'roadTh': 'road_th',
+    'mooBanEn': 'moo_ban_en',
+    'mooBanTh': 'moo_ban_th',
+    'subDistrict': 'sub_district',
+    'district': 'district',
+    'province': 'province',
+    'postcode': 'postcode',
+    'room': 'room',
+    'roomEn': 'room_en'
+}
+DIRECTOR_FIELDS = {
+    'title': 'title',
+    'firstname': 'firstname',
+    'lastname': 'lastname'
+}
+SHAREHOLDER_FIELDS = {
+    'regisIdHeldBy': 'regis_id_held_by',
+    'businessStatus': 'business_status',
+    'numOfSH': 'num_of_sh',
+    'shareAmount': 'share_amount',
+    'percent': 'percent',
+    'nationality': 'nationality',
+    'directorShip': 'directorship',
+    'directorUpdDate': 'director_upd_date'
+}
+SHAREHOLDER_DETAIL_FIELDS = {
+    'title': 'title',
+    'firstname': 'firstname',
+    'lastname': 'lastname',
+    'businessType': 'business_type'
+}
+
+def extract_fields(element, field_map: Dict[str, str]) -> Dict[str, str]:
+    """Fill ``field_map`` keys from the element's direct children in one walk.
+
+    Matches ``element.find(tag)`` semantics: the first child with a tag wins and
+    missing or empty elements yield "".
+    """
+    found = {}
+    for child in element:
+        key = field_map.get(child.tag)
+        if key is not None and key not in found:
+            found[key] = child.text or ""
+    result = dict.fromkeys(field_map.values(), "")
+    result.update(found)
+    return result
+
+def _first_child(element, tag: str):
+    """Return the first direct child with ``tag``, else the first descendant."""
+    for child in element:
+        if child.tag == tag:
+            return child
+    return element.find('.//' + tag)
+
+class EnliteResponseParser:
+    """Parsing and caching helpers shared by the sync and async Enlite clients."""
+    
+    def _store_lookup(self, registration_id: str,
+                      data: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Cache a fetched company, or negatively cache why there is none: (data, reason)."""
+        reason = _lookup_failure(data)
+        if reason is None:
+            self.cache.set(registration_id, data)
+            self.negative_cache.delete(registration_id)
+            return data, None
+        logger.warning(f"No company data for {registration_id}: {reason}")
+        self.negative_cache.set(registration_id, reason)
+        return None, reason
     
-    def _parse_company_data(self, xml_response: str) -> Dict[str, Any]:
+    def _parse_response(self, content: bytes) -> Dict[str, Any]:
+        """Parse raw response bytes, streaming only large shareholder registers."""
+        if len(content) >= STREAM_PARSE_MIN_BYTES:
+            return self._parse_company_data_stream(content)
+        return self._parse_company_data(content)
+    
+    def _parse_company_data(self, xml_response: Union[str, bytes]) -> Dict[str, Any]:
         """Parse XML response to structured format"""
         try:
             root = ET.fromstring(xml_response)
@@ -150,38 +321,15 @@ class FinalEnliteAPIClient:
             # Parse profile summary
             profile = return_data.find('.//profileSummary')
             if profile is not None:
-                data['profile'] = {
-                    'name_th_full': self._get_text(profile, 'nameThFull'),
-                    'name_th': self._get_text(profile, 'nameTh'),
-                    'business_type_th': self._get_text(profile, 'businessTypeTh'),
-                    'name_en_full': self._get_text(profile, 'nameEnFull'),
-                    'name_en': self._get_text(profile, 'nameEn'),
-                    'business_type_en': self._get_text(profile, 'businessTypeEn'),
-                    'regis_id': self._get_text(profile, 'regisId'),
-                    'company_status': self._get_text(profile, 'companyStatus'),
-                    'capital': self._get_text(profile, 'capital'),
-                    'regis_date': self._get_text(profile, 'regisDate'),
-                    'set_symbol': self._get_text(profile, 'setSymbol'),
-                    'address': self._parse_address(profile.find('.//address'))
-                }
+                data['profile'] = self._parse_profile(profile)
             
             # Parse officialSignatory
-            official_signatory = return_data.find('.//officialSignatory')
-            if official_signatory is not None and official_signatory.text:
-                data['official_signatory'] = official_signatory.text.strip()
-            else:
-                data['official_signatory'] = ''
+            data['official_signatory'] = self._parse_signatory(return_data.find('.//officialSignatory'))
             
             # Parse directors
             directors = return_data.find('.//director')
             if directors is not None:
-                data['directors'] = []
-                for director in directors.findall('.//list'):
-                    data['directors'].append({
-                        'title': self._get_text(director, 'title'),
-                        'firstname': self._get_text(director, 'firstname'),
-                        'lastname': self._get_text(director, 'lastname')
-                    })
+                data['directors'] = self._parse_directors(directors)
             
             # Parse shareholders (levelHeldBy level="1" only)
             held_by = return_data.find('.//heldBy')
@@ -192,37 +340,7 @@ class FinalEnliteAPIClient:
                 level_held = held_by.find('.//levelHeldBy[@level="1"]')
                 if level_held is not None:
                     for shareholder_data in level_held.findall('.//data'):
-                        shareholder = {
-                            'regis_id_held_by': self._get_text(shareholder_data, 'regisIdHeldBy'),
-                            'business_status': self._get_text(shareholder_data, 'businessStatus'),
-                            'num_of_sh': self._get_text(shareholder_data, 'numOfSH'),
-                            'share_amount': self._get_text(shareholder_data, 'shareAmount'),
-                            'percent': self._get_text(shareholder_data, 'percent'),
-                            'nationality': self._get_text(shareholder_data, 'nationality'),
-                            'directorship': self._get_text(shareholder_data, 'directorShip'),
-                            'director_upd_date': self._get_text(shareholder_data, 'directorUpdDate'),
-                            'shareholder_type': 'personal'  # Default
-                        }
-                        
-                        # Parse shareholder details
-                        shareholder_elem = shareholder_data.find('.//shareholder')
-                        if shareholder_elem is not None:
-                            shareholder.update({
-                                'title': self._get_text(shareholder_elem, 'title'),
-                                'firstname': self._get_text(shareholder_elem, 'firstname'),
-                                'lastname': self._get_text(shareholder_elem, 'lastname'),
-                                'business_type': self._get_text(shareholder_elem, 'businessType'),
-                                'shareholder_type': shareholder_elem.get('type', 'personal')
-                            })
-                        
-                        # If it's a company and no name, use regis_id_held_by
-                        if shareholder.get('shareholder_type') == 'company' and not shareholder.get('firstname'):
-                            regis_id = shareholder.get('regis_id_held_by', '')
-                            if regis_id:
-                                shareholder['firstname'] = f"Company {regis_id}"
-                                shareholder['lastname'] = ""
-                        
-                        data['shareholders'].append(shareholder)
+                        data['shareholders'].append(self._parse_shareholder(shareholder_data))
             
             return data
             
@@ -230,49 +348,606 @@ class FinalEnliteAPIClient:
             logger.error(f"Error parsing XML response: {e}")
             return {}
     
-    def _get_text(self, element, tag: str) -> str:
-        """Helper method to get text from XML element"""
-        if element is None:
-            return ""
-        elem = element.find(tag)
-        return elem.text if elem is not None and elem.text else ""
+    def _parse_company_data_stream(self, xml_bytes: bytes) -> Dict[str, Any]:
+        """Parse the raw response in one streaming pass (same output as _parse_company_data).
+
+        Shareholder ``<data>`` rows are converted and freed as soon as they end, so
+        large shareholder registers never exist as a complete tree in memory. Peak
+        memory is about a third of the tree parser's, but the per-event work costs
+        10-40% more CPU, so _parse_response uses it only for large responses.
+        """
+        try:
+            if LET is not None:
+                events = LET.iterparse(io.BytesIO(xml_bytes), events=('start', 'end'), tag=STREAM_PARSE_TAGS,
+                                       resolve_entities=False, huge_tree=True)
+            else:
+                events = ET.iterparse(io.BytesIO(xml_bytes), events=('start', 'end'))
+            
+            return_data = None
+            profile = None
+            signatory = None
+            directors = None
+            shareholders = None
+            held_by = None
+            level_held = None
+            done_level_held = False
+            
+            for event, elem in events:
+                tag = elem.tag
+                if return_data is None:
+                    if event == 'start' and tag == 'return':
+                        return_data = elem
+                    continue
+                
+                if event == 'start':
+                    if tag == 'heldBy' and held_by is None and shareholders is None:
+                        held_by = elem
+                        shareholders = []
+                    elif (tag == 'levelHeldBy' and held_by is not None and level_held is None
+                          and not done_level_held and elem.get('level') == '1'):
+                        level_held = elem
+                    continue
+                
+                # event == 'end'
+                if elem is return_data:
+                    break
+                if tag == 'data' and level_held is not None:
+                    shareholders.append(self._parse_shareholder(elem))
+                    self._release_element(elem)
+                elif elem is level_held:
+                    level_held = None
+                    done_level_held = True
+                elif elem is held_by:
+                    held_by = None
+                elif tag == 'profileSummary' and profile is None:
+                    profile = self._parse_profile(elem)
+                    self._release_element(elem)
+                elif tag == 'officialSignatory' and signatory is None:
+                    signatory = self._parse_signatory(elem)
+                elif tag == 'director' and directors is None:
+                    directors = self._parse_directors(elem)
+                    self._release_element(elem)
+            
+            if return_data is None:
+                logger.error("No return data found in response")
+                return {}
+            
+            data = {}
+            if profile is not None:
+                data['profile'] = profile
+            data['official_signatory'] = signatory or ''
+            if directors is not None:
+                data['directors'] = directors
+            if shareholders is not None:
+                data['shareholders'] = shareholders
+            return data
+            
+        except Exception as e:
+            logger.error(f"Error parsing XML response: {e}")
+            return {}
+    
+    def _release_element(self, elem) -> None:
+        """Free a processed element (and, under lxml, its already-processed siblings)."""
+        elem.clear()
+        if LET is not None:
+            parent = elem.getparent()
+            while parent is not None and elem.getprevious() is not None:
+                del parent[0]
+    
+    def _parse_profile(self, profile) -> Dict[str, Any]:
+        """Parse the profileSummary block"""
+        data = extract_fields(profile, PROFILE_FIELDS)
+        data['address'] = self._parse_address(_first_child(profile, 'address'))
+        return data
+    
+    def _parse_signatory(self, official_signatory) -> str:
+        """Parse the officialSignatory text"""
+        if official_signatory is not None and official_signatory.text:
+            return official_signatory.text.strip()
+        return ''
+    
+    def _parse_directors(self, directors) -> List[Dict[str, str]]:
+        """Parse the director list"""
+        return [extract_fields(director, DIRECTOR_FIELDS) for director in directors.iter('list') if director is not directors]
+    
+    def _parse_shareholder(self, shareholder_data) -> Dict[str, str]:
+        """Parse one levelHeldBy <data> row"""
+        shareholder = extract_fields(shareholder_data, SHAREHOLDER_FIELDS)
+        shareholder['shareholder_type'] = 'personal'  # Default
+        
+        # Parse shareholder details
+        shareholder_elem = _first_child(shareholder_data, 'shareholder')
+        if shareholder_elem is not None:
+            shareholder.update(extract_fields(shareholder_elem, SHAREHOLDER_DETAIL_FIELDS))
+            shareholder['shareholder_type'] = shareholder_elem.get('type', 'personal')
+        
+        # If it's a company and no name, use regis_id_held_by
+        if shareholder.get('shareholder_type') == 'company' and not shareholder.get('firstname'):
+            regis_id = shareholder.get('regis_id_held_by', '')
+            if regis_id:
+                shareholder['firstname'] = f"Company {regis_id}"
+                shareholder['lastname'] = ""
+        
+        return shareholder
     
     def _parse_address(self, address_elem) -> Dict[str, str]:
         """Parse address information"""
         if address_elem is None:
             return {}
         
-        return {
-            'address_no': self._get_text(address_elem, 'addressNo'),
-            'moo': self._get_text(address_elem, 'moo'),
-            'building_en': self._get_text(address_elem, 'buildingEn'),
-            'building_th': self._get_text(address_elem, 'buildingTh'),
-            'floor': self._get_text(address_elem, 'floor'),
-            'soi_en': self._get_text(address_elem, 'soiEn'),
-            'soi_th': self._get_text(address_elem, 'soiTh'),
-            'road_en': self._get_text(address_elem, 'roadEn'),
-            'road_th': self._get_text(address_elem, 'roadTh'),
-            'moo_ban_en': self._get_text(address_elem, 'mooBanEn'),
-            'moo_ban_th': self._get_text(address_elem, 'mooBanTh'),
-            'sub_district': self._get_text(address_elem, 'subDistrict'),
-            'district': self._get_text(address_elem, 'district'),
-            'province': self._get_text(address_elem, 'province'),
-            'postcode': self._get_text(address_elem, 'postcode'),
-            'room': self._get_text(address_elem, 'room'),
-            'room_en': self._get_text(address_elem, 'roomEn')
-        }
+        return extract_fields(address_elem, ADDRESS_FIELDS)
+
+def _limiter_outcome(status: Optional[int] = None, overloaded: bool = False) -> str:
+    """Classify a finished Enlite call for the adaptive limiter."""
+    if overloaded or status == 429 or (status is not None and status >= 500):
+        return 'overload'
+    return 'ok' if status == 200 else 'error'
+
+class FinalEnliteAPIClient(EnliteResponseParser):
+    """Thin client for the Enlite SOAP API.
+
+    With a ``limiter`` (shared process-wide), calls wait for a slot so the
+    number in flight adapts to Enlite's latency and throttling. Connection
+    errors (including connect timeouts), 429 and 5xx are retried per
+    ``retry_policy``; read timeouts are not. A ``breaker`` makes calls fail
+    fast while Enlite is down. With ``hedging``,
+    a call outliving the recent latency percentile gets a duplicate request
+    and the first answer wins.
+    """
+    
+    def __init__(self, api_key: str, base_url: str = "https://enlite.lhb.co.th",
+                 cache: Optional[CompanyDataCache] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedging: Optional[HedgingPolicy] = None,
+                 negative_cache: Optional[NegativeCompanyCache] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers.update(build_request_headers(api_key))
+        self.cache = cache if cache is not None else InMemoryCompanyCache()
+        self.negative_cache = negative_cache if negative_cache is not None else NegativeCompanyCache()
+        self.limiter = limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = breaker
+        self.hedging = hedging
+        # Hedged calls run both copies here; the limiter bounds the primaries
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=2 * (limiter.max_limit if limiter is not None else 32), thread_name_prefix='enlite-hedge'
+        ) if hedging is not None else None
+        self.singleflight = SingleFlight()  # Deduplicates concurrent lookups per registration ID
+    
+    def get_company_data(self, registration_id: str, language: str = "EN") -> Optional[Dict[str, Any]]:
+        """Fetch company data, serving stale cache entries while they refresh."""
+        cached, is_stale = self.cache.lookup(registration_id)
+        if cached is not None:
+            if is_stale:
+                logger.info(f"Serving stale data for {registration_id}, refreshing in background")
+                count('cache_stale_hits')
+                CACHE_LOOKUPS.inc('stale')
+                self._refresh_in_background(registration_id)
+            else:
+                logger.info(f"Using cached data for {registration_id}")
+                count('cache_hits')
+                CACHE_LOOKUPS.inc('hit')
+            return cached
+        
+        reason = self.negative_cache.get(registration_id)
+        if reason is not None:
+            logger.info(f"Skipping {registration_id}: looked up recently without data ({reason})")
+            count('negative_cache_hits')
+            CACHE_LOOKUPS.inc('negative')
+            _note_lookup_failure(registration_id, reason)
+            return None
+        
+        count('cache_misses')
+        CACHE_LOOKUPS.inc('miss')
+        data, reason = self.singleflight.do(registration_id, self._fetch_company_data, registration_id)
+        if reason is not None:
+            _note_lookup_failure(registration_id, reason)
+        return data
+    
+    def _refresh_in_background(self, registration_id: str) -> None:
+        """Re-fetch a stale entry on a daemon thread unless a request is already running."""
+        if self.singleflight.in_flight(registration_id):
+            return
+        threading.Thread(
+            target=self.singleflight.do, args=(registration_id, self._fetch_company_data, registration_id),
+            name=f"enlite-refresh-{registration_id}", daemon=True
+        ).start()
+    
+    def _fetch_company_data(self, registration_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Call the Enlite API, retrying transient failures: (company data, reason when there is none)."""
+        data, retry_after = None, None
+        for attempt in range(self.retry_policy.retries + 1):
+            if attempt:
+                delay = self.retry_policy.delay(attempt - 1, retry_after)
+                logger.warning(f"Retrying {registration_id} in {delay:.2f}s (attempt {attempt + 1})")
+                _note_fetch('enlite_retries')
+                time.sleep(delay)
+            if self.breaker is not None and not self.breaker.allow():
+                logger.warning(f"Enlite circuit open, skipping {registration_id}")
+                _note_fetch('breaker_rejections')
+                return None, UPSTREAM_ERROR  # Not negatively cached: the breaker already fails fast
+            data, retryable, retry_after = self._fetch_once(registration_id)
+            if not retryable:
+                break
+        return self._store_lookup(registration_id, data)
+    
+    def _post(self, url: str, soap_body: str, timeout: Tuple[float, float]) -> requests.Response:
+        """POST to Enlite, sending a hedge if the call outlives the hedging delay."""
+        delay = self.hedging.start_call() if self.hedging is not None else None
+        if delay is None:
+            return self._post_once(url, soap_body, timeout)
+        primary = self._hedge_executor.submit(self._post_once, url, soap_body, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.hedging.try_hedge():
+            return primary.result()
+        logger.info(f"Hedging Enlite call still running after {delay:.2f}s")
+        _note_fetch('enlite_hedges')
+        hedge = self._hedge_executor.submit(self._post_once, url, soap_body, timeout)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and _hedge_won(future.result().status_code):
+                    if future is hedge:
+                        self.hedging.record_win()
+                    return future.result()  # The loser finishes in the background
+        return primary.result()  # Neither succeeded: report the primary's outcome
+    
+    def _post_once(self, url: str, soap_body: str, timeout: Tuple[float, float]) -> requests.Response:
+        started = time.perf_counter()
+        response = self.session.post(url, data=soap_body, timeout=timeout)
+        if self.hedging is not None:
+            self.hedging.record(time.perf_counter() - started)
+        return response
+    
+    def _fetch_once(self, registration_id: str) -> Tuple[Optional[Dict[str, Any]], bool, Optional[float]]:
+        """One Enlite call: (parsed data or None, retryable, Retry-After seconds)."""
+        breaker_failed = True  # Until Enlite answers below 500; also covers unexpected errors
+        sent_at = time.monotonic()  # Lets the breaker ignore answers to calls sent before it opened
+        try:
+            # Build SOAP request payload
+            soap_body = build_soap_request(registration_id)
+            
+            url = f"{self.base_url}/enlitews/companyData"
+            logger.info(f"Making API request to: {url} for {registration_id}")
+            
+            # Split timeouts: a dead host fails within the connect timeout instead of the full read timeout
+            timeout = (float(os.getenv('ENLITE_CONNECT_TIMEOUT', '5')), float(os.getenv('ENLITE_API_TIMEOUT', '60')))
+            if self.limiter is not None:
+                with timed_stage('enlite_wait'):
+                    self.limiter.acquire()
+            _note_fetch('api_calls')  # Cache hits never get here, so call budgets count real Enlite calls
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                with timed_stage('enlite_api'):
+                    response = self._post(url, soap_body, timeout)
+                outcome = _limiter_outcome(response.status_code)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                outcome = _limiter_outcome(overloaded=True)
+                record_enlite_request(started, type(e).__name__)
+                raise
+            except Exception as e:
+                record_enlite_request(started, type(e).__name__)
+                raise
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(outcome, time.perf_counter() - started)
+            record_enlite_request(started, str(response.status_code), len(response.content))
+            logger.info(f"Response status: {response.status_code}")
+            count('response_bytes', len(response.content))
+            breaker_failed = response.status_code >= 500
+            
+            if response.status_code == 200:
+                # Parse the raw bytes (UTF-8 for Thai text)
+                with timed_stage('xml_parse'):
+                    data = self._parse_response(response.content)
+                return data, False, None
+            else:
+                logger.error(f"API request failed with status {response.status_code}")
+                return None, outcome == 'overload', _retry_after(response.headers)
+                
+        except requests.exceptions.ConnectionError:  # Includes ConnectTimeout
+            logger.error(f"Connection error for {registration_id} - Unable to connect to API")
+            return None, True, None
+        except requests.exceptions.Timeout:
+            # Not retried: a hung read would cost ENLITE_API_TIMEOUT again per attempt
+            logger.error(f"Timeout error for {registration_id} - API took too long to respond")
+            return None, False, None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error for {registration_id}: {e}")
+            return None, False, None
+        except Exception as e:
+            logger.error(f"Unexpected error for {registration_id}: {e}")
+            return None, False, None
+        finally:
+            # Every exit reports to the breaker, so a half-open probe always resolves
+            _record_breaker(self.breaker, breaker_failed, sent_at)
+
+class AsyncEnliteAPIClient(EnliteResponseParser):
+    """asyncio sibling of FinalEnliteAPIClient built on aiohttp.
+
+    Keeps many Enlite calls in flight on one event loop, capped per host by
+    ``max_connections`` (ENLITE_MAX_CONNECTIONS) with per-request timeouts
+    from ENLITE_CONNECT_TIMEOUT / ENLITE_API_TIMEOUT, and by the shared adaptive
+    ``limiter`` if given. Retries, the circuit breaker and hedging work as in
+    the sync client; a losing hedge is cancelled.
+    """
+    
+    def __init__(self, api_key: str, base_url: str = "https://enlite.lhb.co.th",
+                 max_connections: Optional[int] = None,
+                 cache: Optional[CompanyDataCache] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedging: Optional[HedgingPolicy] = None,
+                 negative_cache: Optional[NegativeCompanyCache] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections or int(os.getenv('ENLITE_MAX_CONNECTIONS', '10'))
+        self.cache = cache if cache is not None else InMemoryCompanyCache()
+        self.negative_cache = negative_cache if negative_cache is not None else NegativeCompanyCache()
+        self.limiter = limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = breaker
+        self.hedging = hedging
+        self.singleflight = AsyncSingleFlight()
+        self._refreshes = set()  # Background refresh tasks, referenced until they finish
+        self._session = None
+        self._session_loop = None
+    
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        """Return an aiohttp session bound to the running event loop."""
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for AsyncEnliteAPIClient (pip install aiohttp)")
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_connections)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=float(os.getenv('ENLITE_CONNECT_TIMEOUT', '5')),
+                                            sock_read=float(os.getenv('ENLITE_API_TIMEOUT', '60')))
+            self._session = aiohttp.ClientSession(
+                headers=build_request_headers(self.api_key),
+                connector=connector,
+                timeout=timeout
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def close(self) -> None:
+        """Close the underlying aiohttp session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
+    async def get_company_data(self, registration_id: str, language: str = "EN") -> Optional[Dict[str, Any]]:
+        """Fetch company data without blocking the event loop, serving stale cache entries while they refresh."""
+        cached, is_stale = self.cache.lookup(registration_id)
+        if cached is not None:
+            if is_stale:
+                logger.info(f"Serving stale data for {registration_id}, refreshing in background")
+                count('cache_stale_hits')
+                CACHE_LOOKUPS.inc('stale')
+                self._refresh_in_background(registration_id)
+            else:
+                logger.info(f"Using cached data for {registration_id}")
+                count('cache_hits')
+                CACHE_LOOKUPS.inc('hit')
+            return cached
+        
+        reason = self.negative_cache.get(registration_id)
+        if reason is not None:
+            logger.info(f"Skipping {registration_id}: looked up recently without data ({reason})")
+            count('negative_cache_hits')
+            CACHE_LOOKUPS.inc('negative')
+            _note_lookup_failure(registration_id, reason)
+            return None
+        
+        count('cache_misses')
+        CACHE_LOOKUPS.inc('miss')
+        data, reason = await self.singleflight.do(registration_id, self._fetch_company_data, registration_id)
+        if reason is not None:
+            _note_lookup_failure(registration_id, reason)
+        return data
+    
+    def _refresh_in_background(self, registration_id: str) -> None:
+        """Re-fetch a stale entry in a task of its own unless a request is already running."""
+        if self.singleflight.in_flight(registration_id):
+            return
+        # An empty context keeps the refresh out of the running analysis, as the sync client's thread does
+        task = contextvars.Context().run(asyncio.ensure_future, self.singleflight.do(
+            registration_id, self._fetch_company_data, registration_id))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+    
+    async def _fetch_company_data(self, registration_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Call the Enlite API, retrying transient failures: (company data, reason when there is none)."""
+        data, retry_after = None, None
+        for attempt in range(self.retry_policy.retries + 1):
+            if attempt:
+                delay = self.retry_policy.delay(attempt - 1, retry_after)
+                logger.warning(f"Retrying {registration_id} in {delay:.2f}s (attempt {attempt + 1})")
+                _note_fetch('enlite_retries')
+                await asyncio.sleep(delay)
+            if self.breaker is not None and not self.breaker.allow():
+                logger.warning(f"Enlite circuit open, skipping {registration_id}")
+                _note_fetch('breaker_rejections')
+                return None, UPSTREAM_ERROR  # Not negatively cached: the breaker already fails fast
+            data, retryable, retry_after = await self._fetch_once(registration_id)
+            if not retryable:
+                break
+        return self._store_lookup(registration_id, data)
+    
+    async def _post(self, session: 'aiohttp.ClientSession', url: str, soap_body: str) -> Tuple[int, Any, bytes]:
+        """POST to Enlite: (status, headers, body), hedged like the sync client."""
+        delay = self.hedging.start_call() if self.hedging is not None else None
+        if delay is None:
+            return await self._post_once(session, url, soap_body)
+        tasks = [asyncio.ensure_future(self._post_once(session, url, soap_body))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.hedging.try_hedge():
+                return await tasks[0]
+            logger.info(f"Hedging Enlite call still running after {delay:.2f}s")
+            _note_fetch('enlite_hedges')
+            tasks.append(asyncio.ensure_future(self._post_once(session, url, soap_body)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and _hedge_won(task.result()[0]):
+                        if task is tasks[1]:
+                            self.hedging.record_win()
+                        return task.result()
+            return tasks[0].result()  # Neither succeeded: report the primary's outcome
+        finally:
+            for task in tasks:
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()  # Mark a losing failure as retrieved
+                else:
+                    task.cancel()  # Frees the loser's connection
+    
+    async def _post_once(self, session: 'aiohttp.ClientSession', url: str, soap_body: str) -> Tuple[int, Any, bytes]:
+        started = time.perf_counter()
+        async with session.post(url, data=soap_body) as response:
+            content = await response.read()
+        if self.hedging is not None:
+            self.hedging.record(time.perf_counter() - started)
+        return response.status, response.headers, content
+    
+    async def _fetch_once(self, registration_id: str) -> Tuple[Optional[Dict[str, Any]], bool, Optional[float]]:
+        """One Enlite call: (parsed data or None, retryable, Retry-After seconds)."""
+        breaker_failed = True  # Until Enlite answers below 500; also covers cancellation
+        sent_at = time.monotonic()  # Lets the breaker ignore answers to calls sent before it opened
+        try:
+            url = f"{self.base_url}/enlitews/companyData"
+            logger.info(f"Making async API request to: {url} for {registration_id}")
+            
+            session = self._get_session()
+            if self.limiter is not None:
+                with timed_stage('enlite_wait'):
+                    await self.limiter.acquire_async()
+            _note_fetch('api_calls')  # Cache hits never get here, so call budgets count real Enlite calls
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                with timed_stage('enlite_api'):
+                    status, headers, content = await self._post(session, url, build_soap_request(registration_id))
+                logger.info(f"Response status: {status}")
+                outcome = _limiter_outcome(status)
+                breaker_failed = status >= 500
+                if status != 200:
+                    record_enlite_request(started, str(status))
+                    logger.error(f"API request failed with status {status}")
+                    return None, outcome == 'overload', _retry_after(headers)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                outcome = _limiter_outcome(overloaded=True)
+                record_enlite_request(started, type(e).__name__)
+                raise
+            except Exception as e:
+                record_enlite_request(started, type(e).__name__)
+                raise
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(outcome, time.perf_counter() - started)
+            record_enlite_request(started, str(status), len(content))
+            count('response_bytes', len(content))
+            
+            # Parse the raw bytes (UTF-8 for Thai text)
+            with timed_stage('xml_parse'):
+                data = self._parse_response(content)
+            return data, False, None
+        
+        except AIOHTTP_CONNECT_TIMEOUT:
+            logger.error(f"Connection timeout for {registration_id} - Unable to connect to API")
+            return None, True, None
+        except asyncio.TimeoutError:
+            # Not retried: a hung read would cost ENLITE_API_TIMEOUT again per attempt
+            logger.error(f"Timeout error for {registration_id} - API took too long to respond")
+            return None, False, None
+        except aiohttp.ClientConnectionError:
+            logger.error(f"Connection error for {registration_id} - Unable to connect to API")
+            return None, True, None
+        except aiohttp.ClientError as e:
+            logger.error(f"Request error for {registration_id}: {e}")
+            return None, False, None
+        except Exception as e:
+            logger.error(f"Unexpected error for {registration_id}: {e}")
+            return None, False, None
+        finally:
+            # Every exit reports to the breaker, so a half-open probe always resolves
+            _record_breaker(self.breaker, breaker_failed, sent_at)
+
+UNEXPLORED_LIMIT = 500  # Branches listed on a partial result
+
+@dataclass
+class AnalysisContext:
+    """Mutable state of one analysis.
+
+    Every analyze call works on its own context, so one FinalUBOAnalyzer (which
+    holds configuration only) can serve concurrent analyses from threaded,
+    gevent or asyncio workers. Pass a context in to watch a running analysis.
+    """
+    ubo_results: Dict[str, UBOCandidate] = field(default_factory=dict)  # Aggregated UBO candidates (PERSONAL ONLY)
+    hierarchy: Dict[str, Any] = field(default_factory=dict)  # Shareholding hierarchy map
+    visited_companies: set = field(default_factory=set)  # Track visited companies to avoid loops
+    total_companies_checked: int = 0
+    max_level_reached: int = 0
+    pruning: bool = False
+    pruned_tasks: List[Tuple[str, float, int, List[Dict[str, Any]]]] = field(default_factory=list)  # Restorable
+    pruned_percentage: float = 0.0  # Effective ownership held by the pruned branches
+    shallower_path_percentage: float = 0.0  # Reached a company by a shallower path than the one expanded
+    max_below_threshold: float = 0.0  # Upper bound on the largest candidate total under 15%
+    api_calls: int = 0  # Enlite calls made for this analysis, reported by the client
+    budget_exhausted: Optional[str] = None
+    coverage_percentage: float = 100.0
+    failed_tasks: List[Tuple[str, float, int, List[Dict[str, Any]]]] = field(default_factory=list)  # Fetch returned nothing
+    enlite_retries: int = 0
+    enlite_hedges: int = 0
+    breaker_rejections: int = 0
+    breaker_state: Optional[str] = None
+    failure_reasons: Dict[str, str] = field(default_factory=dict)  # company_id -> not_found / parse_error / upstream_error
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def note(self, counter: str, amount: int = 1) -> None:
+        """Increment a fetch counter; prefetch threads report concurrently."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def note_failure(self, company_id: str, reason: str) -> None:
+        with self._lock:
+            self.failure_reasons[company_id] = reason
+
+    def failure_counts(self) -> Dict[str, int]:
+        """Failed fetches by reason; clients that give no reason count as upstream errors."""
+        counts = {NOT_FOUND: 0, PARSE_ERROR: 0, UPSTREAM_ERROR: 0}
+        for company_id, *_ in self.failed_tasks:
+            reason = self.failure_reasons.get(company_id, UPSTREAM_ERROR)
+            counts[reason] = counts.get(reason, 0) + 1
+        return counts
 
 class FinalUBOAnalyzer:
-    """Queue-based UBO analyzer following the requested algorithm."""
+    """Queue-based UBO analyzer following the requested algorithm.
+
+    Holds configuration only; per-analysis state lives in AnalysisContext.
+    """
     
     def __init__(self):
         self.threshold_15 = 15.0  # Method 1 threshold (>=15%)
         self.max_levels = 7  # Traverse up to level 6 (0=main, 1=tier1, 2=tier2, 3=tier3, 4=tier4, 5=tier5, 6=tier6)
-        self.ubo_results = {}  # Aggregated UBO candidates (PERSONAL ONLY)
-        self.hierarchy = {}  # Shareholding hierarchy map
-        self.visited_companies = set()  # Track visited companies to avoid loops
-        self.total_companies_checked = 0
-        self.max_level_reached = 0
+        self.max_workers = int(os.getenv('ENLITE_MAX_WORKERS', '1'))  # >1 enables level-parallel fetching
+        self.prune = os.getenv('UBO_PRUNE', '0').strip().lower() in ('1', 'true', 'yes')  # Threshold-aware pruning
+        self.prune_max_branch = float(os.getenv('UBO_PRUNE_MAX_BRANCH', '1.0'))  # Largest effective % a pruned branch may carry
+        self.traversal = os.getenv('UBO_TRAVERSAL', 'bfs').strip().lower()  # 'bfs' or 'best_first'
+        # Default per-analysis budgets (unset = unbounded); arguments to analyze_company_hierarchy override
+        self.max_seconds = float(os.getenv('UBO_MAX_SECONDS', '0')) or None
+        self.max_calls = int(os.getenv('UBO_MAX_CALLS', '0')) or None
+        self.max_companies = int(os.getenv('UBO_MAX_COMPANIES', '0')) or None
     
     def _sanitize_label(self, text: Optional[str], fallback: str = "") -> str:
         """Return a clean label, supporting Thai and other Unicode characters."""
@@ -285,25 +960,168 @@ class FinalUBOAnalyzer:
         ).strip()
         return cleaned if cleaned else fallback
 
-    def analyze_company_hierarchy(self, api_client: FinalEnliteAPIClient, 
-                                 start_company_id: str) -> UBOAnalysisResult:
-        """Perform queue-based traversal across shareholding layers."""
-        logger.info(f"Starting FINAL UBO analysis for company: {start_company_id}")
-        
-        # Reset data structures
-        self.ubo_results = {}
-        self.hierarchy = {}
-        self.visited_companies = set()
-        self.total_companies_checked = 0
-        self.max_level_reached = 0
-        
-        # Initialize processing queue
-        processing_queue = deque([(start_company_id, 100.0, 0, [])])
-        
-        # Processing Loop
+    def _shareholder_name(self, sh_data: Dict[str, Any]) -> str:
+        """Display name of a parsed shareholder row (company or person)."""
+        regis_id_held_by = sh_data.get('regis_id_held_by', '')
+        # ✅ สำหรับบริษัท ใช้ companyName หรือ companyNameFull จาก API
+        if sh_data.get('shareholder_type', 'personal') == 'company':
+            company_name_full = sh_data.get('companyNameFull', '').strip()
+            company_name = sh_data.get('companyName', '').strip()
+            shareholder_name_raw = company_name_full or company_name or f"{sh_data.get('firstname', '')} {sh_data.get('lastname', '')}".strip()
+            # ใช้ชื่อภาษาอังกฤษจาก API (ไม่ต้อง sanitize)
+            return self._sanitize_label(shareholder_name_raw, fallback=f"Company {regis_id_held_by}" if regis_id_held_by else "Corporate Shareholder")
+        shareholder_name_raw = f"{sh_data.get('firstname', '')} {sh_data.get('lastname', '')}".strip()
+        return self._sanitize_label(shareholder_name_raw, fallback="Individual Shareholder")
+
+    def _start_queue(self, start_company_id: str, traversal: Optional[str], budgeted: bool = True):
+        """Initial task queue: FIFO for 'bfs', a max-heap on effective % for 'best_first'.
+
+        Best-first only pays off when a budget can stop the traversal. A company
+        reached through several paths is expanded from the first one popped, so
+        best-first can pick a deeper path than BFS and ``max_levels`` then cuts
+        differently; without a budget the FIFO queue is used so the result
+        matches BFS.
+        """
+        traversal = (traversal or self.traversal).lower()
+        if traversal not in ('bfs', 'best_first'):
+            raise ValueError(f"Unknown traversal '{traversal}', expected 'bfs' or 'best_first'")
+        tasks = [(start_company_id, 100.0, 0, [])]
+        if traversal == 'best_first' and not budgeted:
+            logger.info("No budget set, traversing best_first breadth-first")
+        return BestFirstQueue(tasks) if traversal == 'best_first' and budgeted else deque(tasks)
+
+    def _check_budget(self, ctx: AnalysisContext, processing_queue, started: float, max_seconds: Optional[float],
+                      max_companies: Optional[int] = None) -> bool:
+        """Record and return whether the time or company budget stops the traversal before the next company.
+
+        Budgets are checked between companies, so a slow fetch in progress can
+        overrun ``max_seconds`` by one lookup: up to ENLITE_API_TIMEOUT for a
+        hung read (not retried), plus ENLITE_RETRIES connect timeouts and
+        backoffs when Enlite is unreachable.
+        """
+        if not processing_queue or ctx.budget_exhausted:
+            return ctx.budget_exhausted is not None
+        if max_seconds is not None and time.perf_counter() - started >= max_seconds:
+            self._stop(ctx, 'time', processing_queue)
+        elif max_companies is not None and ctx.total_companies_checked >= max_companies:
+            self._stop(ctx, 'companies', processing_queue)
+        return ctx.budget_exhausted is not None
+
+    def _calls_exhausted(self, ctx: AnalysisContext, task, processing_queue, max_calls: Optional[int]) -> bool:
+        """Whether fetching ``task`` would exceed the call budget; if so, put it back and stop.
+
+        Only new fetches count, so companies already prefetched are still processed.
+        """
+        if max_calls is None or ctx.api_calls < max_calls:
+            return False
+        ctx.visited_companies.discard(task[0])
+        processing_queue.appendleft(task)
+        self._stop(ctx, 'calls', processing_queue)
+        return True
+
+    def _budgets(self, max_seconds: Optional[float], max_calls: Optional[int],
+                 max_companies: Optional[int]) -> Tuple[Optional[float], Optional[int], Optional[int]]:
+        """Fill unset budgets from the analyzer defaults."""
+        return (self.max_seconds if max_seconds is None else max_seconds,
+                self.max_calls if max_calls is None else max_calls,
+                self.max_companies if max_companies is None else max_companies)
+
+    def _stop(self, ctx: AnalysisContext, reason: str, processing_queue) -> None:
+        ctx.budget_exhausted = reason
+        logger.info(f"Stopping traversal: {reason} budget exhausted after "
+                    f"{ctx.api_calls} calls, {len(processing_queue)} tasks left")
+
+    def _fetch_limit(self, ctx: AnalysisContext, processing_queue, prefetched: Dict[str, Any],
+                     max_calls: Optional[int], max_companies: Optional[int], workers: int) -> Optional[int]:
+        """How many companies one prefetch may fetch (None = the whole tier).
+
+        Batches stop at the remaining call and company budgets, so a parallel
+        run fetches about as much as the sequential one before a budget stops it.
+        """
+        limit = max(1, workers) if isinstance(processing_queue, BestFirstQueue) else None
+        remaining = []
+        if max_calls is not None:
+            remaining.append(max_calls - ctx.api_calls)
+        if max_companies is not None:
+            remaining.append(max_companies - ctx.total_companies_checked - len(prefetched))
+        if remaining:
+            remaining = max(1, min(remaining))
+            limit = remaining if limit is None else min(limit, remaining)
+        return limit
+
+    def _unexplored_percentage(self, ctx: AnalysisContext, processing_queue) -> float:
+        """Effective % still queued (and not going to be skipped) plus pruned, failed-fetch and shallower-path mass."""
+        queued = sum(percentage for company_id, percentage, level, _ in processing_queue
+                     if level < self.max_levels and company_id not in ctx.visited_companies)
+        return (queued + ctx.pruned_percentage + sum(task[1] for task in ctx.failed_tasks)
+                + ctx.shallower_path_percentage)
+
+    def _unexplored_tasks(self, ctx: AnalysisContext, processing_queue, limit: int = UNEXPLORED_LIMIT) -> List[Dict[str, Any]]:
+        """Queued and pruned branches left when a budget stopped the traversal, largest first."""
+        branches = [(task, False) for task in processing_queue] + [(task, True) for task in ctx.pruned_tasks]
+        unexplored = [{
+            'company_id': company_id,
+            'name': path_chain[-1].get('entity_name', company_id) if path_chain else company_id,
+            'effective_percentage': round(percentage, 6),
+            'level': level,
+            'path': [step.get('entity_id') for step in path_chain],
+            'pruned': pruned
+        } for (company_id, percentage, level, path_chain), pruned in branches
+            if level < self.max_levels and company_id not in ctx.visited_companies]
+        unexplored.sort(key=lambda branch: branch['effective_percentage'], reverse=True)
+        return unexplored[:limit]
+
+    def _should_prune(self, ctx: AnalysisContext, company_id: str, effective_percentage: float, level: int) -> bool:
+        """Whether a corporate branch can be skipped without changing who reaches 15%.
+
+        Any one person can own at most the branch's effective percentage through
+        it, so while the pruned mass stays below the gap between 15% and the
+        largest sub-threshold total, no candidate can cross the threshold.
+        Totals only grow, so the bound is rechecked in _restore_pruned.
+
+        The bound holds against true ownership, not against the totals this
+        traversal reports: each company is expanded from the first path that
+        reaches it, and skipping a branch can change which path that is, so
+        reported totals may differ from an unpruned run. Restored branches
+        that reach a company by a shallower path than the one expanded are
+        counted in shallower_path_percentage and lower the coverage.
+        """
+        if not ctx.pruning or effective_percentage > self.prune_max_branch:
+            return False
+        if level >= self.max_levels or company_id in ctx.visited_companies:
+            return False  # Would be skipped anyway; not unexplored mass
+        return ctx.pruned_percentage + effective_percentage < self.threshold_15 - ctx.max_below_threshold
+
+    def _restore_pruned(self, ctx: AnalysisContext, processing_queue: deque) -> bool:
+        """Re-queue pruned branches, largest first, until the pruning bound holds.
+
+        Returns True when branches were re-queued and the traversal must continue.
+        """
+        if not ctx.pruned_tasks:
+            return False
+        below = [c.total_percentage for c in ctx.ubo_results.values() if c.total_percentage < self.threshold_15]
+        ctx.max_below_threshold = max(below, default=0.0)
+        margin = self.threshold_15 - ctx.max_below_threshold
+        if ctx.pruned_percentage < margin:
+            return False
+        ctx.pruned_tasks.sort(key=lambda task: task[1])
+        while ctx.pruned_tasks and ctx.pruned_percentage >= margin:
+            task = ctx.pruned_tasks.pop()
+            ctx.pruned_percentage -= task[1]
+            processing_queue.append(task)
+            count('branches_restored')
+        if not ctx.pruned_tasks:
+            ctx.pruned_percentage = 0.0  # Drop float residue
+        logger.info(f"Pruning bound not met (margin {margin:.4f}%), restored branches; "
+                    f"{len(ctx.pruned_tasks)} remain pruned")
+        return True
+
+    def _next_task(self, ctx: AnalysisContext, processing_queue: deque) -> Optional[Tuple[str, float, int, List[Dict[str, Any]]]]:
+        """Pop the next task that still needs an API call and mark it visited."""
         while processing_queue:
             # Get Task
-            current_company_id, current_percentage, current_level, path_chain = processing_queue.popleft()
+            task = processing_queue.popleft()
+            current_company_id, _, current_level, _ = task
             
             # Check Depth
             if current_level >= self.max_levels:
@@ -311,205 +1129,452 @@ class FinalUBOAnalyzer:
                 continue
             
             # Check Visited
-            if current_company_id in self.visited_companies:
+            if current_company_id in ctx.visited_companies:
                 logger.info(f"Company {current_company_id} already visited, skipping")
+                visited = ctx.hierarchy.get(current_company_id)
+                if visited is not None and current_level < visited['level']:
+                    # BFS would have expanded this path, deeper before max_levels; count it as unresolved
+                    ctx.shallower_path_percentage += task[1]
                 continue
             
             # Mark as Visited
-            self.visited_companies.add(current_company_id)
-            
-            # API Call
-            company_data = api_client.get_company_data(current_company_id)
-            if not company_data:
-                logger.warning(f"Failed to get data for company {current_company_id}")
+            ctx.visited_companies.add(current_company_id)
+            return task
+        return None
+
+    def _tier_company_ids(self, ctx: AnalysisContext, current_company_id: str, processing_queue: deque,
+                          prefetched: Dict[str, Any], limit: Optional[int] = None) -> List[str]:
+        """List the current company plus every unvisited company still queued.
+
+        When the first company of a tier is popped, the FIFO queue holds the rest of
+        that tier, so the whole tier can be fetched concurrently while processing
+        order (and therefore the result) stays identical to the sequential traversal.
+        ``limit`` caps the list (best-first batches, call budgets).
+        """
+        company_ids = [current_company_id]
+        seen = {current_company_id}
+        for company_id, _, level, _ in processing_queue:
+            if limit is not None and len(company_ids) >= limit:
+                break
+            if (level >= self.max_levels or company_id in seen
+                    or company_id in ctx.visited_companies or company_id in prefetched):
                 continue
-            
-            self.total_companies_checked += 1
-            self.max_level_reached = max(self.max_level_reached, current_level)
-            
-            # Parse company profile and related data
-            profile = company_data.get('profile', {})
-            shareholders_data = company_data.get('shareholders', [])
-            directors_data = company_data.get('directors', [])
-            
-            # Prepare English-first metadata
-            company_name_en = self._sanitize_label(
-                profile.get('name_en_full')
-                or profile.get('name_en')
-                or profile.get('name_th_full')
-                or profile.get('name_th')
-                or current_company_id,
-                fallback=current_company_id
-            )
-            company_name_th = self._sanitize_label(
-                profile.get('name_th_full') or profile.get('name_th'),
-                fallback=""
-            )
-            business_type_en = self._sanitize_label(
-                profile.get('business_type_en') or profile.get('business_type_th'),
-                fallback="Unknown"
-            )
-            business_type_th = self._sanitize_label(profile.get('business_type_th'), fallback="")
-
-            # Store company node within the hierarchy (English-first fields)
-            self.hierarchy[current_company_id] = {
-                'name_en': company_name_en,
-                'name_th': company_name_th,
-                'display_name': company_name_en or company_name_th or current_company_id,
-                'level': current_level,
-                'parent_percentage': current_percentage,
-                'shareholders': [],
-                'directors': directors_data,
-                'official_signatory': company_data.get('official_signatory', ''),
-                'company_id': current_company_id,
-                'status': profile.get('company_status', 'Active'),
-                'capital': profile.get('capital', ''),
-                'regis_date': profile.get('regis_date', ''),
-                'address': profile.get('address', {}),
-                'business_type': business_type_en,
-                'business_type_en': business_type_en,
-                'business_type_th': business_type_th
-            }
-            
-            # Parse Shareholders (Level 1 from current_company_id)
-            current_display_name = self.hierarchy[current_company_id]['display_name']
+            seen.add(company_id)
+            company_ids.append(company_id)
+        return company_ids
 
-            for sh_data in shareholders_data:
-                try:
-                    share_amount = int(sh_data.get('share_amount', '0').replace(',', ''))
-                    direct_percentage = float(sh_data.get('percent', '0'))
-                    
-                    # Calculate Effective Percentage
-                    effective_percentage = (current_percentage / 100.0) * direct_percentage
-                    
-                    shareholder_type = sh_data.get('shareholder_type', 'personal')
-                    regis_id_held_by = sh_data.get('regis_id_held_by', '')
-                    
-                    # ✅ สำหรับบริษัท ใช้ companyName หรือ companyNameFull จาก API
-                    if shareholder_type == 'company':
-                        company_name_full = sh_data.get('companyNameFull', '').strip()
-                        company_name = sh_data.get('companyName', '').strip()
-                        shareholder_name_raw = company_name_full or company_name or f"{sh_data.get('firstname', '')} {sh_data.get('lastname', '')}".strip()
-                        # ใช้ชื่อภาษาอังกฤษจาก API (ไม่ต้อง sanitize)
-                        shareholder_name = self._sanitize_label(shareholder_name_raw, fallback=f"Company {regis_id_held_by}" if regis_id_held_by else "Corporate Shareholder")
-                    else:
-                        shareholder_name_raw = f"{sh_data.get('firstname', '')} {sh_data.get('lastname', '')}".strip()
-                        shareholder_name = self._sanitize_label(shareholder_name_raw, fallback="Individual Shareholder")
-                    
-                    # Build shareholder object
-                    sanitized_nationality = self._sanitize_label(sh_data.get('nationality', ''), fallback='')
-
-                    shareholder = Shareholder(
-                        name=shareholder_name,
-                        firstname=sh_data.get('firstname', ''),
-                        lastname=sh_data.get('lastname', ''),
-                        nationality=sanitized_nationality,
-                        share_amount=share_amount,
-                        percent=direct_percentage,
-                        shareholder_type=shareholder_type,
-                        regis_id=regis_id_held_by,
-                        business_status=sh_data.get('business_status'),
-                        directorship=sh_data.get('directorship'),
-                        director_update_date=sh_data.get('director_upd_date'),
-                        effective_percentage=effective_percentage,
-                        path=[current_company_id]
-                    )
-                    
-                    shareholder_dict = asdict(shareholder)
-                    shareholder_dict['display_name'] = shareholder_name or (regis_id_held_by or 'Unknown')
-                    shareholder_dict['type_label'] = 'Company' if shareholder_type == 'company' else 'Individual'
-                    shareholder_dict['direct_percent'] = direct_percentage
-                    shareholder_path = path_chain + [{
-                        'entity_id': regis_id_held_by or shareholder_name,
-                        'entity_name': shareholder_name,
-                        'share_percent': direct_percentage
-                    }]
-                    shareholder_dict['ubo_path'] = shareholder_path
-                    shareholder_dict['ubo_factors'] = [step.get('share_percent', 0) for step in shareholder_path]
-                    
-                    # Persist shareholder into hierarchy
-                    self.hierarchy[current_company_id]['shareholders'].append(shareholder_dict)
-                    
-                    # Check Shareholder Type
-                    if shareholder_type == 'personal':
-                        # Add/Update ubo_results
-                        if shareholder_name not in self.ubo_results:
-                            self.ubo_results[shareholder_name] = UBOCandidate(
-                                name=shareholder_name,
-                                total_percentage=0.0,
-                                paths=[],
-                                path_details=[],
-                                method=1,
-                                nationality=sanitized_nationality or None,
-                                is_director=(shareholder.directorship or '').upper() == 'YES'
-                            )
-                        
-                        self.ubo_results[shareholder_name].total_percentage += effective_percentage
-                        self.ubo_results[shareholder_name].paths.append([step.get('entity_id') for step in shareholder_path])
-                        
-                        # Add detailed path calculation
-                        path_factors = [step.get('share_percent', 0) for step in shareholder_path]
-                        path_names = [step.get('entity_name', 'Unknown') for step in shareholder_path]
-                        path_detail = {
-                            'factors': path_factors,
-                            'names': path_names,
-                            'result': effective_percentage,
-                            'calculation': ' × '.join([f"{f:.2f}%" for f in path_factors]) + f" = {effective_percentage:.3f}%"
-                        }
-                        self.ubo_results[shareholder_name].path_details.append(path_detail)
-                        
-                        candidate = self.ubo_results[shareholder_name]
-                        if not candidate.nationality and sanitized_nationality:
-                            candidate.nationality = sanitized_nationality
-                        if (shareholder.directorship or '').upper() == 'YES':
-                            candidate.is_director = True
-                        
-                        logger.info(f"Found individual shareholder: {shareholder_name} with {effective_percentage:.2f}%")
-                    
-                    elif shareholder_type == 'corporate' or regis_id_held_by:
-                        # ✅ Corporate shareholders: เพิ่มเข้า queue เพื่อหาผู้ถือหุ้นต่อ
-                        # แต่ไม่นับบริษัทเป็น UBO (UBO ต้องเป็น Person เท่านั้น)
-                        if regis_id_held_by:
-                            new_task_path = path_chain + [{
-                                'entity_id': regis_id_held_by,
-                                'entity_name': shareholder_name,
-                                'share_percent': direct_percentage
-                            }]
-                            new_task = (regis_id_held_by, effective_percentage, current_level + 1, new_task_path)
-                            processing_queue.append(new_task)
-                            logger.info(f"Added corporate shareholder {regis_id_held_by} to queue for level {current_level + 1}")
-                        else:
-                            # If no regis_id_held_by, still try to process as corporate
-                            logger.warning(f"Corporate shareholder {shareholder_name} has no regis_id_held_by")
+    def _prefetch_tier(self, ctx: AnalysisContext, executor: ThreadPoolExecutor, api_client: FinalEnliteAPIClient,
+                       current_company_id: str, processing_queue: deque,
+                       prefetched: Dict[str, Any], limit: Optional[int] = None) -> None:
+        """Fetch a whole tier through the worker pool."""
+        company_ids = self._tier_company_ids(ctx, current_company_id, processing_queue, prefetched, limit)
+        logger.info(f"Fetching {len(company_ids)} companies concurrently")
+        # Each worker runs in a copy of this context so instrumentation reaches the active analysis
+        futures = [executor.submit(contextvars.copy_context().run, api_client.get_company_data, company_id)
+                   for company_id in company_ids]
+        prefetched.update(zip(company_ids, (future.result() for future in futures)))
+
+    async def _prefetch_tier_async(self, ctx: AnalysisContext, api_client: 'AsyncEnliteAPIClient',
+                                   current_company_id: str, processing_queue: deque,
+                                   prefetched: Dict[str, Any], limit: Optional[int] = None) -> None:
+        """Fetch a whole tier concurrently on the running event loop."""
+        company_ids = self._tier_company_ids(ctx, current_company_id, processing_queue, prefetched, limit)
+        logger.info(f"Fetching {len(company_ids)} companies concurrently (async)")
+        results = await asyncio.gather(*(api_client.get_company_data(company_id) for company_id in company_ids))
+        prefetched.update(zip(company_ids, results))
+
+    def analyze_company_hierarchy(self, api_client: FinalEnliteAPIClient, 
+                                 start_company_id: str,
+                                 max_workers: Optional[int] = None,
+                                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                 prune: Optional[bool] = None,
+                                 traversal: Optional[str] = None,
+                                 max_calls: Optional[int] = None,
+                                 max_seconds: Optional[float] = None,
+                                 max_companies: Optional[int] = None,
+                                 context: Optional[AnalysisContext] = None) -> UBOAnalysisResult:
+        """Perform queue-based traversal across shareholding layers.
+
+        ``max_workers`` > 1 fetches each tier through a bounded thread pool
+        (defaults to ``ENLITE_MAX_WORKERS``); the result matches the sequential run.
+        ``progress_callback`` receives a progress dict after every company and may
+        raise AnalysisCancelled to stop the traversal. ``prune`` (defaults to
+        ``UBO_PRUNE``) skips small corporate branches that provably cannot change
+        which candidates reach 15%; the skipped mass is reported in the checklist.
+        ``traversal='best_first'`` (defaults to ``UBO_TRAVERSAL``) processes the
+        largest effective holdings first, so when ``max_calls`` or ``max_seconds``
+        stops the traversal early the answer covers the most ownership mass;
+        ``coverage_percentage`` on the result reports how much was resolved.
+        ``max_seconds``, ``max_calls`` and ``max_companies`` default to the
+        UBO_MAX_* settings; when one is hit the result is flagged ``partial`` and
+        lists the ``unexplored`` branches. ``max_calls`` counts calls that reach
+        Enlite (retries included); cache hits are free. State is kept in
+        ``context`` (a fresh AnalysisContext by default), so concurrent calls on
+        one analyzer are safe.
+        """
+        logger.info(f"Starting FINAL UBO analysis for company: {start_company_id}")
+        workers = self.max_workers if max_workers is None else max_workers
+        
+        # Per-analysis data structures
+        ctx = context if context is not None else AnalysisContext()
+        ctx.pruning = self.prune if prune is None else prune
+        max_seconds, max_calls, max_companies = self._budgets(max_seconds, max_calls, max_companies)
+        analysis_token = _current_analysis.set(ctx)  # Client retries report into this analysis
+        
+        # Initialize processing queue
+        processing_queue = self._start_queue(start_company_id, traversal,
+                                             any(budget is not None for budget in (max_seconds, max_calls, max_companies)))
+        prefetched = {}
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enlite-fetch') if workers > 1 else None
+        started = time.perf_counter()
+        outcome = 'error'
+        ANALYSES_IN_FLIGHT.inc()
+        
+        # Processing Loop
+        try:
+            while not self._check_budget(ctx, processing_queue, started, max_seconds, max_companies):
+                task = self._next_task(ctx, processing_queue)
+                if task is None:
+                    if self._restore_pruned(ctx, processing_queue):
+                        continue
+                    break
+                current_company_id, current_percentage, current_level, path_chain = task
                 
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Error parsing shareholder data: {e}")
+                # API Call (whole tier at once in parallel mode)
+                if current_company_id not in prefetched and self._calls_exhausted(ctx, task, processing_queue, max_calls):
+                    break
+                if executor is not None:
+                    if current_company_id not in prefetched:
+                        self._prefetch_tier(ctx, executor, api_client, current_company_id, processing_queue, prefetched,
+                                            self._fetch_limit(ctx, processing_queue, prefetched, max_calls,
+                                                              max_companies, workers))
+                    company_data = prefetched.pop(current_company_id)
+                else:
+                    company_data = api_client.get_company_data(current_company_id)
+                if not company_data:
+                    logger.warning(f"Failed to get data for company {current_company_id}")
+                    ctx.failed_tasks.append(task)
                     continue
+                
+                with timed_stage('bfs'):
+                    self._process_company(ctx, current_company_id, company_data, current_percentage,
+                                          current_level, path_chain, processing_queue)
+                if progress_callback is not None:
+                    progress_callback(self._progress(ctx, current_company_id, current_level, processing_queue))
+            ctx.coverage_percentage = max(0.0, 100.0 - self._unexplored_percentage(ctx, processing_queue))
+            ctx.breaker_state = api_client.breaker.state if getattr(api_client, 'breaker', None) else None
+            result = self._build_result(ctx, start_company_id, processing_queue)
+            outcome = 'success'
+        except AnalysisCancelled:
+            outcome = 'cancelled'
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            _current_analysis.reset(analysis_token)
+            ANALYSES_IN_FLIGHT.dec()
+            record_analysis(started, outcome, ctx.total_companies_checked, ctx.max_level_reached)
         
-        # Final Calculation (Personal shareholders only)
-        final_ubos = self._identify_final_ubos()
+        return result
+
+    async def analyze_company_hierarchy_async(self, api_client: 'AsyncEnliteAPIClient',
+                                              start_company_id: str,
+                                              progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                              prune: Optional[bool] = None,
+                                              traversal: Optional[str] = None,
+                                              max_calls: Optional[int] = None,
+                                              max_seconds: Optional[float] = None,
+                                              max_companies: Optional[int] = None,
+                                              context: Optional[AnalysisContext] = None) -> UBOAnalysisResult:
+        """Async variant of analyze_company_hierarchy; each tier is fetched with asyncio.gather.
+
+        Best-first batches are as large as the client's ``max_connections``
+        (ENLITE_MAX_CONNECTIONS), not ENLITE_MAX_WORKERS, which sizes thread pools.
+        """
+        logger.info(f"Starting async UBO analysis for company: {start_company_id}")
         
-        # Build compliance checklist summary
-        checklist = self._create_checklist(final_ubos)
+        ctx = context if context is not None else AnalysisContext()
+        ctx.pruning = self.prune if prune is None else prune
+        max_seconds, max_calls, max_companies = self._budgets(max_seconds, max_calls, max_companies)
+        analysis_token = _current_analysis.set(ctx)  # Client retries report into this analysis
+        processing_queue = self._start_queue(start_company_id, traversal,
+                                             any(budget is not None for budget in (max_seconds, max_calls, max_companies)))
+        prefetched = {}
+        batch_size = getattr(api_client, 'max_connections', None) or self.max_workers
+        started = time.perf_counter()
+        outcome = 'error'
+        ANALYSES_IN_FLIGHT.inc()
+        
+        try:
+            while not self._check_budget(ctx, processing_queue, started, max_seconds, max_companies):
+                task = self._next_task(ctx, processing_queue)
+                if task is None:
+                    if self._restore_pruned(ctx, processing_queue):
+                        continue
+                    break
+                current_company_id, current_percentage, current_level, path_chain = task
+                
+                if current_company_id not in prefetched:
+                    if self._calls_exhausted(ctx, task, processing_queue, max_calls):
+                        break
+                    await self._prefetch_tier_async(ctx, api_client, current_company_id, processing_queue, prefetched,
+                                                    self._fetch_limit(ctx, processing_queue, prefetched, max_calls,
+                                                                      max_companies, batch_size))
+                company_data = prefetched.pop(current_company_id)
+                if not company_data:
+                    logger.warning(f"Failed to get data for company {current_company_id}")
+                    ctx.failed_tasks.append(task)
+                    continue
+                
+                with timed_stage('bfs'):
+                    self._process_company(ctx, current_company_id, company_data, current_percentage,
+                                          current_level, path_chain, processing_queue)
+                if progress_callback is not None:
+                    progress_callback(self._progress(ctx, current_company_id, current_level, processing_queue))
+            ctx.coverage_percentage = max(0.0, 100.0 - self._unexplored_percentage(ctx, processing_queue))
+            ctx.breaker_state = api_client.breaker.state if getattr(api_client, 'breaker', None) else None
+            result = self._build_result(ctx, start_company_id, processing_queue)
+            outcome = 'success'
+        except AnalysisCancelled:
+            outcome = 'cancelled'
+            raise
+        finally:
+            _current_analysis.reset(analysis_token)
+            ANALYSES_IN_FLIGHT.dec()
+            record_analysis(started, outcome, ctx.total_companies_checked, ctx.max_level_reached)
         
-        # Determine risk/compliance summary
-        risk_level, compliance_status = self._determine_risk_and_compliance(final_ubos)
+        return result
+
+    def _progress(self, ctx: AnalysisContext, current_company_id: str, current_level: int, processing_queue: deque) -> Dict[str, Any]:
+        """Snapshot of traversal progress for progress callbacks."""
+        return {
+            'current_company_id': current_company_id,
+            'tier': current_level,
+            'companies_checked': ctx.total_companies_checked,
+            'queue_length': len(processing_queue),
+            'max_level_reached': ctx.max_level_reached
+        }
+
+    def _build_result(self, ctx: AnalysisContext, start_company_id: str, processing_queue=()) -> UBOAnalysisResult:
+        """Run the final calculation and package the analysis result."""
+        with timed_stage('ubo_calculation'):
+            # Final Calculation (Personal shareholders only)
+            final_ubos = self._identify_final_ubos(ctx)
+            
+            # Build compliance checklist summary
+            checklist = self._create_checklist(ctx, final_ubos)
+            
+            # Determine risk/compliance summary
+            risk_level, compliance_status = self._determine_risk_and_compliance(ctx, final_ubos)
         
         return UBOAnalysisResult(
             registration_id=start_company_id,
-            company_name=self.hierarchy.get(start_company_id, {}).get('display_name', ''),
-            ubo_candidates=list(self.ubo_results.values()),
+            company_name=ctx.hierarchy.get(start_company_id, {}).get('display_name', ''),
+            ubo_candidates=list(ctx.ubo_results.values()),
             final_ubos=final_ubos,
-            hierarchy=self.hierarchy,
+            hierarchy=ctx.hierarchy,
             checklist=checklist,
             risk_level=risk_level,
             compliance_status=compliance_status,
-            total_companies_checked=self.total_companies_checked,
-            max_level_reached=self.max_level_reached,
-            check_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            total_companies_checked=ctx.total_companies_checked,
+            max_level_reached=ctx.max_level_reached,
+            check_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            traversal='best_first' if isinstance(processing_queue, BestFirstQueue) else 'bfs',
+            coverage_percentage=round(ctx.coverage_percentage, 6),
+            budget_exhausted=ctx.budget_exhausted,
+            partial=ctx.budget_exhausted is not None or bool(ctx.failed_tasks),
+            unexplored=self._unexplored_tasks(ctx, processing_queue) if ctx.budget_exhausted else [],
+            enlite_health=self._enlite_health(ctx)
         )
+
+    def _enlite_health(self, ctx: AnalysisContext) -> Dict[str, Any]:
+        """Fetch problems behind the result, so missing branches are not read as absent owners."""
+        failed = sorted(ctx.failed_tasks, key=lambda task: task[1], reverse=True)
+        return {
+            'retries': ctx.enlite_retries,
+            'hedges': ctx.enlite_hedges,
+            'breaker_rejections': ctx.breaker_rejections,
+            'circuit_breaker': ctx.breaker_state,
+            'failed_percentage': round(sum(task[1] for task in failed), 6),
+            'failed_by_reason': ctx.failure_counts(),
+            'failed_companies': [{
+                'company_id': company_id,
+                'reason': ctx.failure_reasons.get(company_id, UPSTREAM_ERROR),
+                'effective_percentage': round(percentage, 6),
+                'level': level,
+                'path': [step.get('entity_id') for step in path_chain]
+            } for company_id, percentage, level, path_chain in failed[:UNEXPLORED_LIMIT]]
+        }
     
-    def _identify_final_ubos(self) -> List[UBOCandidate]:
+    def _process_company(self, ctx: AnalysisContext, current_company_id: str, company_data: Dict[str, Any],
+                         current_percentage: float, current_level: int,
+                         path_chain: List[Dict[str, Any]], processing_queue: deque) -> None:
+        """Record one fetched company and queue its corporate shareholders."""
+        ctx.total_companies_checked += 1
+        ctx.max_level_reached = max(ctx.max_level_reached, current_level)
+        
+        # Parse company profile and related data
+        profile = company_data.get('profile', {})
+        shareholders_data = company_data.get('shareholders', [])
+        directors_data = company_data.get('directors', [])
+        count('companies_visited')
+        count('shareholders_parsed', len(shareholders_data))
+        
+        # Prepare English-first metadata
+        company_name_en = self._sanitize_label(
+            profile.get('name_en_full')
+            or profile.get('name_en')
+            or profile.get('name_th_full')
+            or profile.get('name_th')
+            or current_company_id,
+            fallback=current_company_id
+        )
+        company_name_th = self._sanitize_label(
+            profile.get('name_th_full') or profile.get('name_th'),
+            fallback=""
+        )
+        business_type_en = self._sanitize_label(
+            profile.get('business_type_en') or profile.get('business_type_th'),
+            fallback="Unknown"
+        )
+        business_type_th = self._sanitize_label(profile.get('business_type_th'), fallback="")
+
+        # Store company node within the hierarchy (English-first fields)
+        ctx.hierarchy[current_company_id] = {
+            'name_en': company_name_en,
+            'name_th': company_name_th,
+            'display_name': company_name_en or company_name_th or current_company_id,
+            'level': current_level,
+            'parent_percentage': current_percentage,
+            'shareholders': [],
+            'directors': directors_data,
+            'official_signatory': company_data.get('official_signatory', ''),
+            'company_id': current_company_id,
+            'status': profile.get('company_status', 'Active'),
+            'capital': profile.get('capital', ''),
+            'regis_date': profile.get('regis_date', ''),
+            'address': profile.get('address', {}),
+            'business_type': business_type_en,
+            'business_type_en': business_type_en,
+            'business_type_th': business_type_th
+        }
+        
+        # Parse Shareholders (Level 1 from current_company_id)
+        current_display_name = ctx.hierarchy[current_company_id]['display_name']
+
+        for sh_data in shareholders_data:
+            try:
+                share_amount = int(sh_data.get('share_amount', '0').replace(',', ''))
+                direct_percentage = float(sh_data.get('percent', '0'))
+                
+                # Calculate Effective Percentage
+                effective_percentage = (current_percentage / 100.0) * direct_percentage
+                
+                shareholder_type = sh_data.get('shareholder_type', 'personal')
+                regis_id_held_by = sh_data.get('regis_id_held_by', '')
+                
+                shareholder_name = self._shareholder_name(sh_data)
+                
+                # Build shareholder object
+                sanitized_nationality = self._sanitize_label(sh_data.get('nationality', ''), fallback='')
+
+                shareholder = Shareholder(
+                    name=shareholder_name,
+                    firstname=sh_data.get('firstname', ''),
+                    lastname=sh_data.get('lastname', ''),
+                    nationality=sanitized_nationality,
+                    share_amount=share_amount,
+                    percent=direct_percentage,
+                    shareholder_type=shareholder_type,
+                    regis_id=regis_id_held_by,
+                    business_status=sh_data.get('business_status'),
+                    directorship=sh_data.get('directorship'),
+                    director_update_date=sh_data.get('director_upd_date'),
+                    effective_percentage=effective_percentage,
+                    path=[current_company_id]
+                )
+                
+                shareholder_dict = asdict(shareholder)
+                shareholder_dict['display_name'] = shareholder_name or (regis_id_held_by or 'Unknown')
+                shareholder_dict['type_label'] = 'Company' if shareholder_type == 'company' else 'Individual'
+                shareholder_dict['direct_percent'] = direct_percentage
+                shareholder_path = path_chain + [{
+                    'entity_id': regis_id_held_by or shareholder_name,
+                    'entity_name': shareholder_name,
+                    'share_percent': direct_percentage
+                }]
+                shareholder_dict['ubo_path'] = shareholder_path
+                shareholder_dict['ubo_factors'] = [step.get('share_percent', 0) for step in shareholder_path]
+                
+                # Persist shareholder into hierarchy
+                ctx.hierarchy[current_company_id]['shareholders'].append(shareholder_dict)
+                
+                # Check Shareholder Type
+                if shareholder_type == 'personal':
+                    # Add/Update ubo_results
+                    if shareholder_name not in ctx.ubo_results:
+                        ctx.ubo_results[shareholder_name] = UBOCandidate(
+                            name=shareholder_name,
+                            total_percentage=0.0,
+                            paths=[],
+                            path_details=[],
+                            method=1,
+                            nationality=sanitized_nationality or None,
+                            is_director=(shareholder.directorship or '').upper() == 'YES'
+                        )
+                    
+                    ctx.ubo_results[shareholder_name].total_percentage += effective_percentage
+                    total_percentage = ctx.ubo_results[shareholder_name].total_percentage
+                    if ctx.max_below_threshold < total_percentage < self.threshold_15:
+                        ctx.max_below_threshold = total_percentage
+                    ctx.ubo_results[shareholder_name].paths.append([step.get('entity_id') for step in shareholder_path])
+                    
+                    # Add detailed path calculation
+                    path_factors = [step.get('share_percent', 0) for step in shareholder_path]
+                    path_names = [step.get('entity_name', 'Unknown') for step in shareholder_path]
+                    path_detail = {
+                        'factors': path_factors,
+                        'names': path_names,
+                        'result': effective_percentage,
+                        'calculation': ' × '.join([f"{f:.2f}%" for f in path_factors]) + f" = {effective_percentage:.3f}%"
+                    }
+                    ctx.ubo_results[shareholder_name].path_details.append(path_detail)
+                    
+                    candidate = ctx.ubo_results[shareholder_name]
+                    if not candidate.nationality and sanitized_nationality:
+                        candidate.nationality = sanitized_nationality
+                    if (shareholder.directorship or '').upper() == 'YES':
+                        candidate.is_director = True
+                    
+                    logger.info(f"Found individual shareholder: {shareholder_name} with {effective_percentage:.2f}%")
+                
+                elif shareholder_type == 'corporate' or regis_id_held_by:
+                    # ✅ Corporate shareholders: เพิ่มเข้า queue เพื่อหาผู้ถือหุ้นต่อ
+                    # แต่ไม่นับบริษัทเป็น UBO (UBO ต้องเป็น Person เท่านั้น)
+                    if regis_id_held_by:
+                        new_task_path = path_chain + [{
+                            'entity_id': regis_id_held_by,
+                            'entity_name': shareholder_name,
+                            'share_percent': direct_percentage
+                        }]
+                        new_task = (regis_id_held_by, effective_percentage, current_level + 1, new_task_path)
+                        if self._should_prune(ctx, regis_id_held_by, effective_percentage, current_level + 1):
+                            ctx.pruned_tasks.append(new_task)
+                            ctx.pruned_percentage += effective_percentage
+                            count('branches_pruned')
+                            logger.info(f"Pruned corporate shareholder {regis_id_held_by} ({effective_percentage:.4f}%)")
+                        else:
+                            processing_queue.append(new_task)
+                            logger.info(f"Added corporate shareholder {regis_id_held_by} to queue for level {current_level + 1}")
+                    else:
+                        # If no regis_id_held_by, still try to process as corporate
+                        logger.warning(f"Corporate shareholder {shareholder_name} has no regis_id_held_by")
+            
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Error parsing shareholder data: {e}")
+                continue
+    
+    def _identify_final_ubos(self, ctx: AnalysisContext) -> List[UBOCandidate]:
         """Filter UBO candidates using Method 1 (≥15% shareholding).
         
         ✅ UBO ต้องเป็น PERSON (Individual) เท่านั้น - ไม่ใช่บริษัท
@@ -517,7 +1582,7 @@ class FinalUBOAnalyzer:
         final_ubos = []
         
         # Filter for PERSONAL shareholders only where total percentage >= 15.0
-        for candidate in self.ubo_results.values():
+        for candidate in ctx.ubo_results.values():
             if candidate.total_percentage >= self.threshold_15:
                 candidate.name = self._sanitize_label(candidate.name, fallback="Individual Shareholder")
                 final_ubos.append(candidate)
@@ -527,14 +1592,29 @@ class FinalUBOAnalyzer:
         
         return final_ubos
     
-    def _create_checklist(self, final_ubos: List[UBOCandidate]) -> Dict[str, Any]:
+    def _create_checklist(self, ctx: AnalysisContext, final_ubos: List[UBOCandidate]) -> Dict[str, Any]:
         """Build a compliance checklist summary."""
         return {
             'method_1_check': {
                 'checked': True,
                 'found_ubo': len(final_ubos) > 0,
-                'companies_checked': self.total_companies_checked,
-                'max_level_reached': self.max_level_reached
+                'companies_checked': ctx.total_companies_checked,
+                'max_level_reached': ctx.max_level_reached,
+                'coverage_percentage': round(ctx.coverage_percentage, 6),
+                'budget_exhausted': ctx.budget_exhausted,
+                'partial': ctx.budget_exhausted is not None or bool(ctx.failed_tasks),
+                'failed_companies': len(ctx.failed_tasks),
+                'failed_by_reason': ctx.failure_counts(),
+                'enlite_retries': ctx.enlite_retries,
+                'circuit_breaker': ctx.breaker_state,
+                'pruning': {
+                    'enabled': ctx.pruning,
+                    'pruned_branches': len(ctx.pruned_tasks),
+                    'pruned_percentage': round(ctx.pruned_percentage, 6),
+                    'note': ('Every corporate branch was followed' if not ctx.pruning
+                             else 'Bound not verified: the traversal stopped on a budget' if ctx.budget_exhausted
+                             else 'No candidate could reach 15% through the pruned branches')
+                }
             },
             'method_2_check': {
                 'checked': True,
@@ -543,7 +1623,7 @@ class FinalUBOAnalyzer:
             },
             'method_3_check': {
                 'checked': False,
-                'directors_found': sum(len(company.get('directors', [])) for company in self.hierarchy.values()),
+                'directors_found': sum(len(company.get('directors', [])) for company in ctx.hierarchy.values()),
                 'note': 'Consider senior management (MD/CEO) if escalation is needed'
             },
             'exemption_check': {
@@ -553,15 +1633,27 @@ class FinalUBOAnalyzer:
             },
             'final_result': {
                 'ubo_identified': len(final_ubos) > 0,
-                'action': 'Reject customer' if len(final_ubos) == 0 else 'Proceed',
-                'next_step': 'Reject onboarding' if len(final_ubos) == 0 else 'Screen against AMLO watchlist'
+                'action': ('Proceed' if final_ubos else 'Re-run without budget limits' if ctx.budget_exhausted
+                           else self._failure_action(ctx) if ctx.failed_tasks else 'Reject customer'),
+                'next_step': ('Screen against AMLO watchlist' if final_ubos
+                              else 'Analysis incomplete, no conclusion on UBOs' if ctx.budget_exhausted or ctx.failed_tasks
+                              else 'Reject onboarding')
             }
         }
     
-    def _determine_risk_and_compliance(self, final_ubos: List[UBOCandidate]) -> tuple:
+    def _failure_action(self, ctx: AnalysisContext) -> str:
+        """Next action when fetch failures left the result open."""
+        counts = ctx.failure_counts()
+        if counts[NOT_FOUND] == len(ctx.failed_tasks):
+            return 'Investigate shareholders not found in Enlite (e.g. foreign-registered)'
+        return 'Re-run when Enlite data is available'
+    
+    def _determine_risk_and_compliance(self, ctx: AnalysisContext, final_ubos: List[UBOCandidate]) -> tuple:
         """Determine risk level and compliance status summary."""
         if len(final_ubos) > 0:
             return 'HIGH', 'COMPLIANT'
+        elif ctx.budget_exhausted or ctx.failed_tasks:
+            return 'HIGH', 'INCOMPLETE'  # Totals only grow, so a partial run cannot rule UBOs out
         else:
             return 'HIGH', 'NON_COMPLIANT'
 
@@ -577,12 +1669,38 @@ if not ENLITE_API_KEY:
     logging.warning("ENLITE_API_KEY not set! API calls will fail. Set it in .env file or environment variables.")
 ENLITE_API_TIMEOUT = int(os.getenv('ENLITE_API_TIMEOUT', '60'))
 
-api_client = FinalEnliteAPIClient(ENLITE_API_KEY, ENLITE_API_URL)
+company_cache = create_company_cache_from_env()
+enlite_limiter = create_limiter_from_env()  # One budget of in-flight Enlite calls for every analysis in the process
+enlite_breaker = create_breaker_from_env()  # Shared so every analysis fails fast once Enlite is down
+enlite_retry_policy = create_retry_policy_from_env()
+enlite_hedging = create_hedging_from_env()  # One latency window and hedge budget for both clients
+negative_cache = create_negative_cache_from_env()
+api_client = FinalEnliteAPIClient(ENLITE_API_KEY, ENLITE_API_URL, cache=company_cache, limiter=enlite_limiter,
+                                  retry_policy=enlite_retry_policy, breaker=enlite_breaker, hedging=enlite_hedging,
+                                  negative_cache=negative_cache)
+async_api_client = AsyncEnliteAPIClient(ENLITE_API_KEY, ENLITE_API_URL, cache=company_cache, limiter=enlite_limiter,
+                                        retry_policy=enlite_retry_policy, breaker=enlite_breaker,
+                                        hedging=enlite_hedging, negative_cache=negative_cache)
 ubo_analyzer = FinalUBOAnalyzer()
 
-def analyze_company_ubo(registration_id: str) -> UBOAnalysisResult:
+def analyze_company_ubo(registration_id: str, max_workers: Optional[int] = None,
+                        prune: Optional[bool] = None, traversal: Optional[str] = None,
+                        max_calls: Optional[int] = None, max_seconds: Optional[float] = None,
+                        max_companies: Optional[int] = None) -> UBOAnalysisResult:
     """Main entrypoint used by the web layer to analyse a company."""
-    return ubo_analyzer.analyze_company_hierarchy(api_client, registration_id)
+    return ubo_analyzer.analyze_company_hierarchy(api_client, registration_id, max_workers=max_workers, prune=prune,
+                                                  traversal=traversal, max_calls=max_calls, max_seconds=max_seconds,
+                                                  max_companies=max_companies)
+
+async def analyze_company_ubo_async(registration_id: str, prune: Optional[bool] = None,
+                                    traversal: Optional[str] = None, max_calls: Optional[int] = None,
+                                    max_seconds: Optional[float] = None, max_companies: Optional[int] = None,
+                                    context: Optional[AnalysisContext] = None) -> UBOAnalysisResult:
+    """Async entrypoint; analyses keep their own context, so they can share one event loop."""
+    return await ubo_analyzer.analyze_company_hierarchy_async(async_api_client, registration_id, prune=prune,
+                                                              traversal=traversal, max_calls=max_calls,
+                                                              max_seconds=max_seconds, max_companies=max_companies,
+                                                              context=context)
 
 if __name__ == "__main__":
 # Manual test harness
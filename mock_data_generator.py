@@ -19,8 +19,12 @@ UBO Calculation Example:
     TOTAL: 8.595 + 7.894 + 3.174 + 5.0 = 24.66% ≥ 15% → UBO ✅
 """
 
+import random
+from array import array
+from collections.abc import Mapping
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
 
 
 def generate_mock_ubo_data() -> Dict[str, Any]:
@@ -472,6 +476,322 @@ def generate_mock_ubo_data() -> Dict[str, Any]:
     return mock_data
 
 
+# Enlite XML tags for the parsed field names produced by final_ubo_system
+_PROFILE_TAGS = [
+    ('name_th_full', 'nameThFull'), ('name_th', 'nameTh'), ('business_type_th', 'businessTypeTh'),
+    ('name_en_full', 'nameEnFull'), ('name_en', 'nameEn'), ('business_type_en', 'businessTypeEn'),
+    ('regis_id', 'regisId'), ('company_status', 'companyStatus'), ('capital', 'capital'),
+    ('regis_date', 'regisDate'), ('set_symbol', 'setSymbol')
+]
+_ADDRESS_TAGS = [
+    ('address_no', 'addressNo'), ('moo', 'moo'), ('building_en', 'buildingEn'), ('building_th', 'buildingTh'),
+    ('floor', 'floor'), ('soi_en', 'soiEn'), ('soi_th', 'soiTh'), ('road_en', 'roadEn'), ('road_th', 'roadTh'),
+    ('moo_ban_en', 'mooBanEn'), ('moo_ban_th', 'mooBanTh'), ('sub_district', 'subDistrict'),
+    ('district', 'district'), ('province', 'province'), ('postcode', 'postcode'), ('room', 'room'),
+    ('room_en', 'roomEn')
+]
+_SHAREHOLDER_TAGS = [
+    ('regis_id_held_by', 'regisIdHeldBy'), ('business_status', 'businessStatus'), ('num_of_sh', 'numOfSH'),
+    ('share_amount', 'shareAmount'), ('percent', 'percent'), ('nationality', 'nationality'),
+    ('directorship', 'directorShip'), ('director_upd_date', 'directorUpdDate')
+]
+_SHAREHOLDER_DETAIL_TAGS = [
+    ('title', 'title'), ('firstname', 'firstname'), ('lastname', 'lastname'), ('business_type', 'businessType')
+]
+
+
+def _xml_fields(values: Dict[str, Any], tags) -> str:
+    return ''.join(
+        f"<{tag}>{escape(str(values[key]))}</{tag}>"
+        for key, tag in tags
+        if values.get(key) not in (None, '')
+    )
+
+
+def build_enlite_response_xml(profile: Dict[str, Any], shareholders: List[Dict[str, Any]],
+                              directors: Optional[List[Dict[str, Any]]] = None,
+                              official_signatory: str = '') -> str:
+    """Render a getDataEnlite SOAP response from parsed-format company data.
+
+    Takes the same field names that FinalEnliteAPIClient produces, so parsing
+    the returned XML round-trips to the input.
+    """
+    address = profile.get('address') or {}
+    profile_xml = _xml_fields(profile, _PROFILE_TAGS) + f"<address>{_xml_fields(address, _ADDRESS_TAGS)}</address>"
+    directors_xml = ''.join(
+        f"<list>{_xml_fields(director, [('title', 'title'), ('firstname', 'firstname'), ('lastname', 'lastname')])}</list>"
+        for director in (directors or [])
+    )
+    rows = []
+    for sh in shareholders:
+        detail = _xml_fields(sh, _SHAREHOLDER_DETAIL_TAGS)
+        sh_type = quoteattr(sh.get('shareholder_type', 'personal'))
+        rows.append(f"<data>{_xml_fields(sh, _SHAREHOLDER_TAGS)}<shareholder type={sh_type}>{detail}</shareholder></data>")
+
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/"><S:Body>'
+        '<ns2:getDataEnliteResponse xmlns:ns2="http://view.bol.com/"><return>'
+        f"<profileSummary>{profile_xml}</profileSummary>"
+        f"<officialSignatory>{escape(official_signatory)}</officialSignatory>"
+        f"<director>{directors_xml}</director>"
+        f"<heldBy><levelHeldBy level=\"1\">{''.join(rows)}</levelHeldBy></heldBy>"
+        '</return></ns2:getDataEnliteResponse></S:Body></S:Envelope>'
+    )
+
+
+_FIRST_NAMES = ['SOMCHAI', 'SOMSAK', 'WICHAI', 'PRAPHAN', 'NARONG', 'SUDA', 'MALEE', 'ANONG', 'KANYA', 'PORNTIP',
+                'WILLIAM', 'SOPHIA', 'JAMES', 'OLIVIA', 'LUCAS', 'EMMA', 'HIROSHI', 'MEI', 'ARJUN', 'NGUYEN']
+_LAST_NAMES = ['SRISUK', 'CHAROEN', 'WONGSA', 'THONGDEE', 'RATTANA', 'SUKSAWAT', 'PHONGPHAN', 'KAEWKLA',
+               'ANDERSON', 'CHEN', 'TANAKA', 'MARTIN', 'BERGMANN', 'WILSON', 'PATEL', 'RAHMAN']
+_NATIONALITIES = ['THAI', 'THAI', 'THAI', 'SINGAPOREAN', 'JAPANESE', 'AMERICAN', 'CHINESE', 'BRITISH']
+
+
+def _split_percentages(rng: random.Random, count: int, total: float = 100.0) -> List[float]:
+    """Split ``total`` into ``count`` Dirichlet-distributed shares of 2 decimals that sum to it exactly.
+
+    Normalised gamma weights are apportioned in hundredths by largest remainder,
+    so no share is negative and each gets at least 0.01 when ``total`` allows.
+    """
+    weights = [rng.gammavariate(1.5, 1.0) for _ in range(count)]
+    units = round(total * 100)
+    floor = 1 if units >= count else 0
+    spare = units - floor * count
+    scale = spare / sum(weights)
+    exact = [w * scale for w in weights]
+    hundredths = [floor + int(x) for x in exact]
+    by_remainder = sorted(range(count), key=lambda i: exact[i] - int(exact[i]), reverse=True)
+    for i in by_remainder[:units - sum(hundredths)]:
+        hundredths[i] += 1
+    return [h / 100 for h in hundredths]
+
+
+def _company_record(company_id: str, tier: int, index: int) -> Dict[str, Any]:
+    name = f"SYNTHETIC HOLDING T{tier} N{index} CO., LTD."
+    return {
+        'profile': {
+            'name_en_full': name, 'name_en': name, 'name_th_full': f"บริษัท ทดสอบ ชั้น{tier} ลำดับ{index} จำกัด",
+            'business_type_en': 'Holding company', 'regis_id': company_id, 'company_status': 'Active',
+            'capital': f"{(index % 97 + 1) * 1_000_000:,}", 'regis_date': '01/01/2010',
+            'address': {'address_no': str(index % 500 + 1), 'road_en': 'Sukhumvit', 'province': 'Bangkok',
+                        'postcode': '10110'}
+        },
+        'official_signatory': 'นายสมชาย ศรีสุข ลงลายมือชื่อ และประทับตราสำคัญของบริษัท',
+        'directors': [{'title': 'นาย', 'firstname': 'สมชาย', 'lastname': 'ศรีสุข'}],
+        'shareholders': []
+    }
+
+
+def _person(index: int, seed: int) -> Dict[str, str]:
+    mixed = (index * 2654435761 + seed) & 0xFFFFFFFF
+    return {
+        'firstname': f"{_FIRST_NAMES[mixed % len(_FIRST_NAMES)]}{index}",
+        'lastname': _LAST_NAMES[(mixed >> 8) % len(_LAST_NAMES)],
+        'nationality': _NATIONALITIES[(mixed >> 16) % len(_NATIONALITIES)]
+    }
+
+
+def _personal_holder(person: Dict[str, str], percent: float, rng: random.Random) -> Dict[str, Any]:
+    return {
+        'regis_id_held_by': '', 'share_amount': f"{rng.randint(1_000, 5_000_000):,}", 'percent': f"{percent:.2f}",
+        'nationality': person['nationality'], 'directorship': rng.choice(['YES', 'NO']),
+        'director_upd_date': '2024-01-15', 'shareholder_type': 'personal', 'title': 'MR.',
+        'firstname': person['firstname'], 'lastname': person['lastname']
+    }
+
+
+def _company_holder(company_id: str, name: str, percent: float, rng: random.Random) -> Dict[str, Any]:
+    return {
+        'regis_id_held_by': company_id, 'business_status': 'Active',
+        'share_amount': f"{rng.randint(1_000, 50_000_000):,}", 'percent': f"{percent:.2f}",
+        'nationality': 'THAI', 'directorship': 'NO', 'director_upd_date': '', 'shareholder_type': 'company',
+        'firstname': name, 'lastname': ''
+    }
+
+
+class OwnershipNetwork(Mapping):
+    """Seeded synthetic ownership network stored as compact arrays.
+
+    Behaves as a read-only mapping of registration ID to a parsed Enlite record
+    (``profile``, ``official_signatory``, ``directors``, ``shareholders``).
+    Records are built on demand, so a million-company network costs tens of
+    MB rather than GBs. Holder references are stored CSR-style: company ``i``
+    is held by ``refs[offsets[i]:offsets[i + 1]]``, where ``r >= 0`` is a
+    company index and ``r < 0`` is person ``-r - 1``; shares are hundredths
+    of a percent.
+    """
+
+    def __init__(self, root_id: str, tiers: array, offsets: array, refs: array, shares: array,
+                 person_count: int, seed: int):
+        self.root_id = root_id
+        self.tiers = tiers
+        self.offsets = offsets
+        self.refs = refs
+        self.shares = shares
+        self.person_count = person_count
+        self.seed = seed
+        self._base = int(root_id)
+
+    def company_id(self, index: int) -> str:
+        return f"{self._base + index:013d}"
+
+    def index_of(self, company_id: str) -> Optional[int]:
+        try:
+            index = int(company_id) - self._base
+        except (TypeError, ValueError):
+            return None
+        return index if 0 <= index < len(self.tiers) and self.company_id(index) == company_id else None
+
+    def __getitem__(self, company_id: str) -> Dict[str, Any]:
+        index = self.index_of(company_id)
+        if index is None:
+            raise KeyError(company_id)
+        rng = random.Random(self.seed * 1_000_003 + index)
+        record = _company_record(company_id, self.tiers[index], index)
+        shareholders = record['shareholders']
+        for position in range(self.offsets[index], self.offsets[index + 1]):
+            ref, percent = self.refs[position], self.shares[position] / 100.0
+            if ref >= 0:
+                name = f"SYNTHETIC HOLDING T{self.tiers[ref]} N{ref} CO., LTD."
+                shareholders.append(_company_holder(self.company_id(ref), name, percent, rng))
+            else:
+                shareholders.append(_personal_holder(_person(-ref - 1, self.seed), percent, rng))
+        return record
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.company_id(index) for index in range(len(self.tiers)))
+
+    def __len__(self) -> int:
+        return len(self.tiers)
+
+    def __contains__(self, company_id: object) -> bool:
+        return isinstance(company_id, str) and self.index_of(company_id) is not None
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.refs)
+
+    def get_company_data(self, registration_id: str, language: str = "EN") -> Optional[Dict[str, Any]]:
+        """FinalEnliteAPIClient-compatible lookup, so the analyzer can run in-process."""
+        return self.get(registration_id)
+
+    def to_xml(self, company_id: str) -> str:
+        """Render one company as a getDataEnlite SOAP response."""
+        record = self[company_id]
+        return build_enlite_response_xml(record['profile'], record['shareholders'], record['directors'],
+                                         record['official_signatory'])
+
+    def iter_xml(self, limit: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """Yield (registration_id, response XML) pairs in index order."""
+        for index in range(len(self) if limit is None else min(limit, len(self))):
+            company_id = self.company_id(index)
+            yield company_id, self.to_xml(company_id)
+
+    def to_hierarchy(self, root_id: Optional[str] = None, max_levels: Optional[int] = None,
+                     quiet: bool = True) -> Dict[str, Any]:
+        """Run FinalUBOAnalyzer over the network and return its ``hierarchy`` dict.
+
+        This is the structure ``build_network_graph`` and ``build_tree_structure``
+        consume. ``max_levels`` overrides the analyzer's depth limit (7).
+        """
+        import logging
+        from final_ubo_system import FinalUBOAnalyzer
+
+        analyzer = FinalUBOAnalyzer()
+        if max_levels is not None:
+            analyzer.max_levels = max_levels
+        analyzer_logger = logging.getLogger('final_ubo_system')
+        previous_level = analyzer_logger.level
+        if quiet:
+            analyzer_logger.setLevel(logging.WARNING)
+        try:
+            return analyzer.analyze_company_hierarchy(self, root_id or self.root_id, max_workers=1).hierarchy
+        finally:
+            analyzer_logger.setLevel(previous_level)
+
+
+def _power_law_fan_out(rng: random.Random, mean: float, alpha: float, maximum: int) -> int:
+    """Pareto-distributed holder count with roughly the given mean (alpha > 1)."""
+    return max(1, min(maximum, int(rng.paretovariate(alpha) * mean * (alpha - 1) / alpha + 0.5)))
+
+
+def generate_ownership_network(depth: Optional[int] = None, fan_out: int = 3, personal_per_company: int = 3,
+                               cycle_density: float = 0.0, person_pool: Optional[int] = None,
+                               seed: int = 42, root_id: str = '0105500000000',
+                               num_companies: Optional[int] = None, fan_out_alpha: Optional[float] = None,
+                               max_fan_out: int = 200, cross_holding_rate: float = 0.0) -> OwnershipNetwork:
+    """Generate a seeded, reproducible ownership network.
+
+    Companies are allocated breadth-first from the root: each company is held
+    by ``fan_out`` new companies one tier further out, plus individuals drawn
+    from a shared pool (so the same person appears on several paths).
+    Allocation stops at ``depth`` tiers or ``num_companies`` companies; with
+    neither given the network is a full tree of depth 4.
+
+    - ``fan_out_alpha``: draw each company's corporate-holder count from a
+      Pareto distribution with this exponent (> 1) and mean ~``fan_out``,
+      capped at ``max_fan_out``; personal-holder counts then vary as well.
+    - ``cycle_density``: chance that a company is also held by one of its own
+      ancestors, creating circular ownership.
+    - ``cross_holding_rate``: chance that a company is also held by a random
+      company elsewhere in the network, so subsidiaries are shared.
+    """
+    if fan_out_alpha is not None and fan_out_alpha <= 1:
+        raise ValueError("fan_out_alpha must be > 1 for the fan-out mean to exist")
+    if depth is None and num_companies is None:
+        depth = 4
+    if num_companies is None:
+        num_companies = sum(fan_out ** tier for tier in range(depth + 1))
+    pool_size = person_pool or max(10, num_companies * personal_per_company // 3)
+
+    rng = random.Random(seed)
+    tiers = array('H', [0])
+    parents = array('l', [-1])
+    offsets = array('q', [0])
+    refs = array('l')
+    shares = array('H')
+
+    index = 0
+    while index < len(tiers):
+        tier = tiers[index]
+        holders = []
+        if depth is None or tier < depth:
+            if fan_out_alpha is None:
+                count = fan_out
+            else:
+                count = _power_law_fan_out(rng, fan_out, fan_out_alpha, max_fan_out)
+            count = min(count, num_companies - len(tiers))
+            for _ in range(count):
+                holders.append(len(tiers))
+                tiers.append(tier + 1)
+                parents.append(index)
+        if tier > 0 and rng.random() < cycle_density:
+            ancestor = parents[index]
+            for _ in range(rng.randrange(tier)):
+                ancestor = parents[ancestor]
+            holders.append(ancestor)
+        if index > 0 and rng.random() < cross_holding_rate:
+            other = rng.randrange(len(tiers))
+            if other != index and other not in holders:
+                holders.append(other)
+
+        if fan_out_alpha is None or personal_per_company == 0:
+            person_count = personal_per_company
+        else:
+            person_count = rng.randint(0 if holders else 1, 2 * personal_per_company)
+        persons = rng.sample(range(pool_size), min(person_count, pool_size))
+
+        if holders or persons:
+            refs.extend(holders)
+            refs.extend(-person - 1 for person in persons)
+            split = _split_percentages(rng, len(holders) + len(persons))
+            shares.extend(round(share * 100) for share in split)
+        offsets.append(len(refs))
+        index += 1
+
+    return OwnershipNetwork(root_id, tiers, offsets, refs, shares, pool_size, seed)
+
+
 if __name__ == '__main__':
     data = generate_mock_ubo_data()
     print("=" * 70)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Per-analysis stage timings and counters.
+
+An analysis runs inside ``track_analysis()``; code anywhere below it calls
+``timed_stage(name)`` / ``count(name)`` and the numbers land on the active
+``AnalysisTimings`` through a context variable. Outside an analysis both
+calls are no-ops. Worker threads must be started with a copied context
+(``contextvars.copy_context().run``) to report into the same analysis.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+_current_timings = contextvars.ContextVar('ubo_analysis_timings', default=None)
+
+
+class AnalysisTimings:
+    """Stage durations (ms, summed across threads) and counters for one analysis."""
+
+    def __init__(self):
+        self.stages = {}  # stage name -> accumulated milliseconds
+        self.counts = {}  # counter name -> int
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000.0
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'total_ms': round(self.elapsed_ms(), 2),
+                'stages_ms': {name: round(ms, 2) for name, ms in self.stages.items()},
+                'counts': dict(self.counts)
+            }
+
+    def server_timing_header(self) -> str:
+        """Render the stages as a ``Server-Timing`` header value."""
+        with self._lock:
+            entries = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ', '.join(entries)
+
+
+def current_timings() -> Optional[AnalysisTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def track_analysis(timings: Optional[AnalysisTimings] = None) -> Iterator[AnalysisTimings]:
+    """Make ``timings`` (or a new one) the active collector for this context."""
+    timings = timings or AnalysisTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    """Time a block against the active analysis, if any."""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Increment a counter on the active analysis, if any."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.incr(name, amount)
+
+
+class TimingsAggregator:
+    """Process-wide rollup of finished analyses for the metrics endpoint.
+
+    Keeps totals and maxima per stage plus the last ``window`` samples for
+    percentiles.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.analyses = 0
+        self._stages = {}  # name -> {'count', 'total_ms', 'max_ms', 'recent'}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings: AnalysisTimings) -> None:
+        snapshot = timings.as_dict()
+        stages = dict(snapshot['stages_ms'], total=snapshot['total_ms'])
+        with self._lock:
+            self.analyses += 1
+            for name, ms in stages.items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    stage = self._stages[name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                  'recent': deque(maxlen=self.window)}
+                stage['count'] += 1
+                stage['total_ms'] += ms
+                stage['max_ms'] = max(stage['max_ms'], ms)
+                stage['recent'].append(ms)
+            for name, value in snapshot['counts'].items():
+                self._counts[name] = self._counts.get(name, 0) + value
+
+    @staticmethod
+    def _percentile(ordered, pct: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for name, stage in self._stages.items():
+                recent = sorted(stage['recent'])
+                stages[name] = {
+                    'count': stage['count'],
+                    'mean_ms': round(stage['total_ms'] / stage['count'], 2),
+                    'p50_ms': round(self._percentile(recent, 50), 2),
+                    'p95_ms': round(self._percentile(recent, 95), 2),
+                    'max_ms': round(stage['max_ms'], 2)
+                }
+            return {
+                'analyses': self.analyses,
+                'stages': stages,
+                'counts_total': dict(self._counts),
+                'counts_per_analysis': {name: round(value / self.analyses, 2)
+                                        for name, value in self._counts.items()} if self.analyses else {}
+            }
+
+
+analysis_metrics = TimingsAggregator()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Background job runner for long UBO analyses.
+
+Jobs live in the memory of the process that accepted them, so with several
+gunicorn workers the status URL must reach the same worker (sticky routing
+or a single worker with threads).
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from final_ubo_system import AnalysisCancelled
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class JobLimitExceeded(Exception):
+    """Raised when too many jobs are queued or running."""
+
+
+@dataclass
+class AnalysisJob:
+    """State of one queued, running or finished analysis."""
+    job_id: str
+    registration_id: str
+    status: str = 'queued'  # queued, running, succeeded, failed, cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed', 'cancelled')
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.job_id,
+            'registration_id': self.registration_id,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error
+        }
+        if include_result and self.status == 'succeeded':
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """Run analyses on a bounded thread pool and keep their results for a while.
+
+    ``runner(registration_id, progress_callback)`` performs one analysis and
+    returns the report. The callback records progress and raises
+    AnalysisCancelled once the job has been cancelled.
+    """
+
+    def __init__(self, runner: Callable[[str, ProgressCallback], Dict[str, Any]],
+                 max_workers: int = 2, max_active: int = 100,
+                 retention_seconds: float = 3600, max_retained: int = 500):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_active = max_active
+        self.retention_seconds = retention_seconds
+        self.max_retained = max_retained
+        self._jobs = {}  # job_id -> AnalysisJob, in submission order
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ubo-job')
+
+    def submit(self, registration_id: str) -> AnalysisJob:
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_active:
+                raise JobLimitExceeded(f"{active} analyses already queued or running")
+            job = AnalysisJob(job_id=uuid.uuid4().hex, registration_id=registration_id)
+            self._jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job)
+        logger.info(f"Queued analysis job {job.job_id} for {registration_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[AnalysisJob]:
+        with self._lock:
+            self._prune()
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[AnalysisJob]:
+        """Cancel a queued job at once; a running one stops at its next progress report."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'max_workers': self.max_workers, 'max_active': self.max_active,
+                'retention_seconds': self.retention_seconds, 'jobs': counts}
+
+    def _run(self, job: AnalysisJob) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, 'cancelled')
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+
+        def on_progress(progress: Dict[str, Any]) -> None:
+            job.progress = progress
+            if job.cancel_event.is_set():
+                raise AnalysisCancelled(job.job_id)
+
+        try:
+            job.result = self.runner(job.registration_id, on_progress)
+            self._finish(job, 'succeeded')
+        except AnalysisCancelled:
+            logger.info(f"Analysis job {job.job_id} cancelled")
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            logger.error(f"Analysis job {job.job_id} failed: {e}")
+            job.error = str(e)
+            self._finish(job, 'failed')
+
+    def _finish(self, job: AnalysisJob, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        """Drop finished jobs past retention, oldest first, also enforcing max_retained."""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(finished) - self.max_retained
+        for job in finished:
+            if excess > 0 or now - job.finished_at > self.retention_seconds:
+                del self._jobs[job.job_id]
+                excess -= 1
+
+
+def create_job_manager_from_env(runner: Callable[[str, ProgressCallback], Dict[str, Any]]) -> JobManager:
+    """Build the job manager configured by UBO_JOB_* environment variables."""
+    return JobManager(
+        runner,
+        max_workers=int(os.getenv('UBO_JOB_WORKERS', '2')),
+        max_active=int(os.getenv('UBO_JOB_MAX_ACTIVE', '100')),
+        retention_seconds=float(os.getenv('UBO_JOB_RETENTION_SECONDS', '3600')),
+        max_retained=int(os.getenv('UBO_JOB_MAX_RETAINED', '500'))
+    )
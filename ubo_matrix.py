@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Matrix-based integrated ownership over a fetched hierarchy.
+
+With ``A[i, j]`` the fraction of company ``i`` held by company ``j`` and
+``B[i, p]`` the fraction held directly by person ``p``, the integrated
+ownership of the root is ``e_root (I - A)^-1 B``: every ownership path is
+counted once, including companies reached along several paths, and circular
+cross-holdings contribute their convergent geometric series instead of
+being cut where the traversal happened to meet them again.
+
+SciPy solves the sparse system when it is installed; otherwise the series
+is summed in pure Python, which is exact after ``depth + 1`` terms on
+acyclic hierarchies.
+"""
+
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from final_ubo_system import AnalysisContext, FinalUBOAnalyzer, UBOAnalysisResult
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix, identity
+    from scipy.sparse.linalg import spsolve
+except ImportError:
+    np = None  # Optional: falls back to the pure-Python series
+
+logger = logging.getLogger(__name__)
+
+
+class OwnershipMatrixError(Exception):
+    """Raised when ownership does not converge (cross-holdings of 100% or more)."""
+
+
+@dataclass
+class OwnershipMatrix:
+    """Sparse ownership structure of one hierarchy, companies and persons by index."""
+    company_ids: List[str]
+    person_names: List[str]
+    company_holders: List[List[Tuple[int, float]]]  # row i -> [(holder company j, fraction)]
+    person_holders: List[List[Tuple[int, float]]]  # row i -> [(person p, fraction)]
+
+    @classmethod
+    def from_hierarchy(cls, hierarchy: Dict[str, Any]) -> 'OwnershipMatrix':
+        """Build from FinalUBOAnalyzer.hierarchy; holders that were never fetched are leaves."""
+        company_ids = list(hierarchy)
+        company_index = {company_id: i for i, company_id in enumerate(company_ids)}
+        person_names = []
+        person_index = {}
+        company_holders = []
+        person_holders = []
+        for company_id in company_ids:
+            companies = []
+            persons = []
+            for shareholder in hierarchy[company_id].get('shareholders', []):
+                fraction = float(shareholder.get('percent') or 0.0) / 100.0
+                if shareholder.get('shareholder_type') == 'personal':
+                    name = shareholder.get('name')
+                    if name not in person_index:
+                        person_index[name] = len(person_names)
+                        person_names.append(name)
+                    persons.append((person_index[name], fraction))
+                elif shareholder.get('regis_id') in company_index:
+                    companies.append((company_index[shareholder['regis_id']], fraction))
+            company_holders.append(companies)
+            person_holders.append(persons)
+        return cls(company_ids, person_names, company_holders, person_holders)
+
+    @property
+    def edge_count(self) -> int:
+        return sum(map(len, self.company_holders)) + sum(map(len, self.person_holders))
+
+    def company_weights(self, root_id: str, tolerance: float = 1e-12,
+                        max_iterations: int = 10000) -> List[float]:
+        """Integrated weight of every company in the root: row ``root`` of (I - A)^-1."""
+        root = self.company_ids.index(root_id)
+        if np is not None:
+            return self._company_weights_sparse(root)
+        weights = [0.0] * len(self.company_ids)
+        term = {root: 1.0}  # Contribution of paths of the current length
+        for _ in range(max_iterations):
+            next_term = {}
+            for i, weight in term.items():
+                weights[i] += weight
+                for j, fraction in self.company_holders[i]:
+                    next_term[j] = next_term.get(j, 0.0) + weight * fraction
+            term = {j: weight for j, weight in next_term.items() if weight > tolerance}
+            if not term:
+                return weights
+        raise OwnershipMatrixError(f"Ownership of {root_id} did not converge after {max_iterations} iterations")
+
+    def _company_weights_sparse(self, root: int) -> List[float]:
+        size = len(self.company_ids)
+        rows, cols, data = [], [], []
+        for i, holders in enumerate(self.company_holders):
+            for j, fraction in holders:
+                rows.append(j)  # Transposed: solve (I - A^T) w = e_root
+                cols.append(i)
+                data.append(fraction)
+        system = identity(size, format='csr') - csr_matrix((data, (rows, cols)), shape=(size, size))
+        rhs = np.zeros(size)
+        rhs[root] = 1.0
+        weights = np.atleast_1d(spsolve(system.tocsc(), rhs))
+        if not np.all(np.isfinite(weights)):
+            raise OwnershipMatrixError(f"Ownership matrix is singular for {self.company_ids[root]}")
+        return weights.tolist()
+
+    def person_totals(self, root_id: str, **kwargs) -> Dict[str, float]:
+        """Integrated percentage of the root held by each person."""
+        weights = self.company_weights(root_id, **kwargs)
+        totals = [0.0] * len(self.person_names)
+        for i, persons in enumerate(self.person_holders):
+            weight = weights[i]
+            if weight:
+                for p, fraction in persons:
+                    totals[p] += weight * fraction
+        return {name: totals[p] * 100.0 for p, name in enumerate(self.person_names)}
+
+
+def apply_matrix_engine(result: UBOAnalysisResult, threshold: Optional[float] = None) -> UBOAnalysisResult:
+    """Recompute candidate totals, final UBOs and the checklist with integrated ownership.
+
+    Listed paths and path details stay as the traversal recorded them.
+    """
+    totals = OwnershipMatrix.from_hierarchy(result.hierarchy).person_totals(result.registration_id) \
+        if result.registration_id in result.hierarchy else {}
+    labels = FinalUBOAnalyzer()
+    context = AnalysisContext(hierarchy=result.hierarchy, total_companies_checked=result.total_companies_checked,
+                              max_level_reached=result.max_level_reached, budget_exhausted=result.budget_exhausted,
+                              coverage_percentage=result.coverage_percentage)
+    # Unfetched branches are leaves here too, so they leave the result just as open as the traversal's
+    for failed in result.enlite_health.get('failed_companies', []):
+        context.failed_tasks.append((failed['company_id'], failed['effective_percentage'], failed['level'],
+                                     [{'entity_id': entity_id} for entity_id in failed['path']]))
+        context.failure_reasons[failed['company_id']] = failed['reason']
+    threshold = labels.threshold_15 if threshold is None else threshold
+
+    candidates = [replace(candidate, total_percentage=totals.get(candidate.name, candidate.total_percentage))
+                  for candidate in result.ubo_candidates]
+    final_ubos = [candidate for candidate in candidates if candidate.total_percentage >= threshold]
+    risk_level, compliance_status = labels._determine_risk_and_compliance(context, final_ubos)
+    checklist = labels._create_checklist(context, final_ubos)
+    # Coverage, budget and pruning notes describe the traversal, so keep them
+    checklist['method_1_check'] = dict(result.checklist.get('method_1_check', {}), found_ubo=len(final_ubos) > 0)
+    return replace(result, ubo_candidates=candidates, final_ubos=final_ubos, checklist=checklist,
+                   risk_level=risk_level, compliance_status=compliance_status)
+
+
+def compare_with_paths(result: UBOAnalysisResult, tolerance: float = 1e-6) -> Dict[str, Tuple[float, float]]:
+    """Persons whose path-sum total differs from the integrated one: name -> (paths, matrix)."""
+    matrix_result = apply_matrix_engine(result)
+    return {
+        before.name: (before.total_percentage, after.total_percentage)
+        for before, after in zip(result.ubo_candidates, matrix_result.ubo_candidates)
+        if abs(before.total_percentage - after.total_percentage) > tolerance
+    }
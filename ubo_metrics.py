@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Prometheus text-format metrics for the Enlite client and the UBO analyzer.
+
+Counters, gauges and histograms write into per-thread cells, so the hot
+path takes no lock and allocates only the first time a thread touches a
+label set. A scrape sums the cells of every thread.
+
+With ``UBO_METRICS_DIR`` set, each process also writes its totals to
+``<dir>/ubo_metrics_<pid>.json`` (every ``UBO_METRICS_FLUSH_INTERVAL``
+seconds and on each scrape). Rendering then sums counters and histograms
+across all files and gauges across live processes, so any gunicorn worker
+answers for the whole pool. Clear the directory when the service starts.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[str, Tuple[str, ...]]
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.cell_size = 1
+        registry.register(self)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self.registry._cell(self, labelvalues)[0] += amount
+
+
+class Gauge(_Metric):
+    """Sum of per-thread deltas; inc/dec may happen on different threads."""
+    kind = 'gauge'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self.registry._cell(self, labelvalues)[0] += amount
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.registry._cell(self, labelvalues)[0] -= amount
+
+
+class Histogram(_Metric):
+    """Cell layout: one count per bucket, the +Inf count, then the sum."""
+    kind = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.cell_size = len(self.buckets) + 2
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        cell = self.registry._cell(self, labelvalues)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+
+class MetricsRegistry:
+    """Holds metric definitions and the per-thread cells behind them."""
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}  # name -> metric
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        """Start from empty cells (also runs in forked workers)."""
+        self._local = threading.local()
+        self._shards = []  # (thread, cells) for every thread that recorded something
+        self._retired = {}  # cells folded in from finished threads
+        self._pid = os.getpid()
+        self._flusher = None
+
+    def register(self, metric: _Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return Counter(self, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return Gauge(self, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return Histogram(self, name, documentation, buckets, labelnames)
+
+    def _cell(self, metric: _Metric, labelvalues: Tuple[str, ...]) -> List[float]:
+        cells = getattr(self._local, 'cells', None)
+        if cells is None:
+            cells = self._local.cells = {}
+            with self._lock:
+                self._retire_finished()  # Short-lived worker threads would otherwise pile up between scrapes
+                self._shards.append((threading.current_thread(), cells))
+                self._start_flusher()
+        key = (metric.name, labelvalues)
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0] * metric.cell_size
+        return cell
+
+    def _start_flusher(self) -> None:
+        if self.directory and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='ubo-metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    @staticmethod
+    def _add(totals: Dict[_Key, List[float]], key: _Key, values: Sequence[float]) -> None:
+        current = totals.get(key)
+        if current is None:
+            totals[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+
+    def _retire_finished(self) -> None:
+        """Fold the cells of finished threads into the retired totals; call with the lock held."""
+        live = []
+        for thread, cells in self._shards:
+            if thread.is_alive():
+                live.append((thread, cells))
+            else:
+                # A finished thread can no longer write, so fold it in once
+                for key, values in list(cells.items()):
+                    self._add(self._retired, key, values)
+        self._shards = live
+
+    def collect(self) -> Dict[_Key, List[float]]:
+        """Sum this process's cells across threads."""
+        with self._lock:
+            self._retire_finished()
+            totals = {key: list(values) for key, values in self._retired.items()}
+            shards = [cells for _, cells in self._shards]
+        for cells in shards:
+            for key, values in list(cells.items()):
+                self._add(totals, key, values)
+        return totals
+
+    def flush(self) -> None:
+        """Write this process's totals for the other workers to read."""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"ubo_metrics_{os.getpid()}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            payload = {'pid': os.getpid(), 'written_at': time.time(),
+                       'metrics': [[name, list(labels), values] for (name, labels), values in self.collect().items()]}
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(payload, handle)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Metrics flush to {path} failed: {e}")
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def aggregate(self) -> Dict[_Key, List[float]]:
+        """Totals for this process, or for every worker when a directory is configured."""
+        if not self.directory:
+            return self.collect()
+        self.flush()
+        totals = {}
+        try:
+            names = [name for name in os.listdir(self.directory)
+                     if name.startswith('ubo_metrics_') and name.endswith('.json')]
+        except OSError:
+            return self.collect()
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as handle:
+                    payload = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            alive = payload.get('pid') == os.getpid() or self._pid_alive(payload.get('pid', 0))
+            for metric_name, labels, values in payload.get('metrics', []):
+                metric = self.metrics.get(metric_name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue  # Gauges describe live state; drop those of exited workers
+                self._add(totals, (metric_name, tuple(labels)), values)
+        return totals
+
+    @staticmethod
+    def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+        parts = []
+        for name, value in zip(names, values):
+            escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{name}="{escaped}"')
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+    def render(self, totals: Optional[Dict[_Key, List[float]]] = None) -> str:
+        """Render totals in the Prometheus text exposition format (0.0.4)."""
+        totals = self.aggregate() if totals is None else totals
+        by_metric = {}
+        for (name, labels), values in totals.items():
+            by_metric.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, values in sorted(by_metric.get(name, [])):
+                if metric.kind != 'histogram':
+                    lines.append(f"{name}{self._format_labels(metric.labelnames, labels)} "
+                                 f"{self._format_value(values[0])}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float('inf'),), values[:-1]):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    bucket_labels = self._format_labels(metric.labelnames, labels, f'le="{le}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {int(cumulative)}")
+                label_text = self._format_labels(metric.labelnames, labels)
+                lines.append(f"{name}_sum{label_text} {self._format_value(values[-1])}")
+                lines.append(f"{name}_count{label_text} {int(cumulative)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(directory=os.getenv('UBO_METRICS_DIR') or None,
+                           flush_interval=float(os.getenv('UBO_METRICS_FLUSH_INTERVAL', '5')))
+
+ENLITE_REQUEST_SECONDS = registry.histogram(
+    'ubo_enlite_request_duration_seconds', 'Enlite getDataEnlite call latency by HTTP status or exception type.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60), labelnames=('status',))
+ENLITE_RESPONSE_BYTES = registry.histogram(
+    'ubo_enlite_response_bytes', 'Size of Enlite response payloads.',
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+CACHE_LOOKUPS = registry.counter(
+    'ubo_enlite_cache_lookups_total', 'Company-data cache lookups by result (hit, stale, negative, miss).', ('result',))
+ANALYSES = registry.counter('ubo_analyses_total', 'Finished UBO analyses by outcome.', ('outcome',))
+ANALYSES_IN_FLIGHT = registry.gauge('ubo_analyses_in_flight', 'UBO analyses currently running.')
+ENLITE_CONCURRENCY_LIMIT = registry.gauge(
+    'ubo_enlite_concurrency_limit', 'Adaptive cap on in-flight Enlite calls (summed over workers).')
+ANALYSIS_SECONDS = registry.histogram(
+    'ubo_analysis_duration_seconds', 'Wall time of one UBO analysis.',
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+ANALYSIS_COMPANIES = registry.histogram(
+    'ubo_analysis_companies', 'Companies fetched per analysis.',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+ANALYSIS_MAX_TIER = registry.histogram(
+    'ubo_analysis_max_tier', 'Deepest tier reached per analysis.', buckets=(0, 1, 2, 3, 4, 5, 6, 7, 8, 10))
+
+
+def record_enlite_request(started: float, status: str, payload_bytes: Optional[int] = None) -> None:
+    """Record one Enlite call that began at ``started`` (time.perf_counter())."""
+    ENLITE_REQUEST_SECONDS.observe(time.perf_counter() - started, status)
+    if payload_bytes is not None:
+        ENLITE_RESPONSE_BYTES.observe(payload_bytes)
+
+
+def record_analysis(started: float, outcome: str, companies: int = 0, max_tier: int = 0) -> None:
+    """Record a finished analysis that began at ``started`` (time.perf_counter())."""
+    ANALYSES.inc(outcome)
+    ANALYSIS_SECONDS.observe(time.perf_counter() - started)
+    if outcome == 'success':
+        ANALYSIS_COMPANIES.observe(companies)
+        ANALYSIS_MAX_TIER.observe(max_tier)
+
+
+def render_metrics() -> str:
+    """Prometheus exposition text, including the derived cache hit ratio."""
+    totals = registry.aggregate()
+    lookups = {labels[0]: values[0] for (name, labels), values in totals.items() if name == CACHE_LOOKUPS.name}
+    total_lookups = sum(lookups.values())
+    served = lookups.get('hit', 0) + lookups.get('stale', 0)
+    ratio = served / total_lookups if total_lookups else 0.0
+    return (registry.render(totals)
+            + "# HELP ubo_enlite_cache_hit_ratio Share of cache lookups served from cache (fresh or stale).\n"
+            + "# TYPE ubo_enlite_cache_hit_ratio gauge\n"
+            + f"ubo_enlite_cache_hit_ratio {ratio:.6f}\n")
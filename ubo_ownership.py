@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Memoized ultimate-ownership vectors for portfolio screening.
+
+A company's ownership vector lists the persons who ultimately own it with
+their effective percentages (products along every path, summed). Vectors
+compose: a company's vector is its personal holders plus each corporate
+holder's vector scaled by that holder's stake. Caching them means targets
+sharing upper ownership tiers reuse the work instead of re-traversing and
+re-multiplying the same paths for every target.
+
+Unlike the BFS in FinalUBOAnalyzer, every path is counted (a company
+reached twice contributes twice); a holding that would re-enter a company
+already on the current path is cut, as the BFS cuts cycles. Vectors shaped
+by such a cut are never cached. A cycle longer than the depth budget left
+when a vector was cached is truncated by depth instead, so a later reuse
+under a deeper path may count one lap of it.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from final_ubo_system import AnalysisContext, FinalUBOAnalyzer, UBOAnalysisResult, UBOCandidate, _current_analysis
+from ubo_instrumentation import count, timed_stage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OwnerShare:
+    """One person's aggregated stake in a company."""
+    percentage: float = 0.0
+    paths: int = 0
+    nationality: Optional[str] = None
+    is_director: bool = False
+
+
+@dataclass
+class OwnershipVector:
+    """Ultimate personal owners of a company within a depth budget.
+
+    ``height`` is the number of levels the vector actually used. When
+    ``complete`` no holding was cut by the depth budget, so the vector is
+    also valid for any larger budget. ``unresolved`` is the percentage held
+    through each company whose data could not be fetched.
+    """
+    company_id: str
+    company_name: str
+    owners: Dict[str, OwnerShare] = field(default_factory=dict)
+    unresolved: Dict[str, float] = field(default_factory=dict)
+    holders: Tuple[str, ...] = ()  # Direct corporate holders that were followed
+    height: int = 1
+    complete: bool = True
+
+
+class OwnershipVectorCache:
+    """Thread-safe LRU of ownership vectors keyed by (company ID, depth budget)."""
+
+    def __init__(self, max_entries: Optional[int] = 50000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # (company_id, levels or None) -> (stored_at, vector)
+        self._lock = threading.Lock()
+
+    def _load(self, key: Tuple[str, Optional[int]]) -> Optional[OwnershipVector]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds is not None and time.time() - entry[0] > self.ttl_seconds:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def get(self, company_id: str, levels: int) -> Optional[OwnershipVector]:
+        """Return a vector usable with ``levels`` levels of budget, or None."""
+        with self._lock:
+            vector = self._load((company_id, None))
+            if vector is None or vector.height > levels:
+                vector = self._load((company_id, levels))
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return vector
+
+    def put(self, levels: int, vector: OwnershipVector) -> None:
+        # Complete vectors are stored once and serve every budget >= their height
+        key = (vector.company_id, None if vector.complete else levels)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time(), vector)
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+class SharedOwnershipAnalyzer:
+    """Portfolio analyzer that builds results from cached ownership vectors.
+
+    Share one instance (and its cache) across all analyses of a portfolio.
+    Results carry UBO totals, path counts and summary fields but no
+    hierarchy or per-path detail, so they suit screening and export rather
+    than the network view.
+    """
+
+    def __init__(self, api_client, cache: Optional[OwnershipVectorCache] = None,
+                 max_levels: Optional[int] = None, threshold: Optional[float] = None):
+        self.api_client = api_client
+        self.cache = cache if cache is not None else OwnershipVectorCache()
+        self._labels = FinalUBOAnalyzer()  # Name sanitising and analyzer defaults
+        self.max_levels = max_levels or self._labels.max_levels
+        self.threshold = self._labels.threshold_15 if threshold is None else threshold
+
+    def ownership_vector(self, company_id: str, levels: Optional[int] = None) -> OwnershipVector:
+        """Ownership vector of ``company_id`` looking at most ``levels`` levels up."""
+        vector, _ = self._vector(company_id, self.max_levels if levels is None else levels, set())
+        return vector
+
+    def _vector(self, company_id: str, levels: int, on_path: Set[str]) -> Tuple[OwnershipVector, bool]:
+        """Return (vector, cacheable); vectors shaped by a cycle cut or failed fetch are not cached."""
+        cached = self.cache.get(company_id, levels)
+        if cached is not None:
+            count('ownership_vector_hits')
+            return cached, True
+        count('ownership_vector_misses')
+
+        company_data = self.api_client.get_company_data(company_id)
+        if not company_data:
+            logger.warning(f"Failed to get data for company {company_id}")
+            return OwnershipVector(company_id=company_id, company_name=company_id,
+                                   unresolved={company_id: 100.0}), False
+
+        profile = company_data.get('profile', {})
+        vector = OwnershipVector(
+            company_id=company_id,
+            company_name=self._labels._sanitize_label(
+                profile.get('name_en_full') or profile.get('name_en')
+                or profile.get('name_th_full') or profile.get('name_th') or company_id,
+                fallback=company_id
+            )
+        )
+        cacheable = True
+        holders = []
+        on_path.add(company_id)
+        try:
+            for sh_data in company_data.get('shareholders', []):
+                try:
+                    direct_percentage = float(sh_data.get('percent', '0'))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Error parsing shareholder data: {e}")
+                    continue
+                shareholder_type = sh_data.get('shareholder_type', 'personal')
+                regis_id_held_by = sh_data.get('regis_id_held_by', '')
+                if shareholder_type == 'personal':
+                    name = self._labels._shareholder_name(sh_data)
+                    self._add_share(vector.owners, name, direct_percentage, 1,
+                                    self._labels._sanitize_label(sh_data.get('nationality', ''), fallback='') or None,
+                                    (sh_data.get('directorship') or '').upper() == 'YES')
+                elif regis_id_held_by:
+                    if levels <= 1:
+                        vector.complete = False  # Depth budget exhausted
+                        continue
+                    if regis_id_held_by in on_path:
+                        cacheable = False  # Cycle cut depends on the path taken
+                        continue
+                    holder, holder_cacheable = self._vector(regis_id_held_by, levels - 1, on_path)
+                    cacheable = cacheable and holder_cacheable
+                    holders.append(regis_id_held_by)
+                    vector.height = max(vector.height, holder.height + 1)
+                    vector.complete = vector.complete and holder.complete
+                    factor = direct_percentage / 100.0
+                    for name, share in holder.owners.items():
+                        self._add_share(vector.owners, name, share.percentage * factor, share.paths,
+                                        share.nationality, share.is_director)
+                    for unresolved_id, percentage in holder.unresolved.items():
+                        vector.unresolved[unresolved_id] = vector.unresolved.get(unresolved_id, 0.0) + percentage * factor
+        finally:
+            on_path.discard(company_id)
+        vector.holders = tuple(holders)
+        if cacheable:
+            self.cache.put(levels, vector)
+        return vector, cacheable
+
+    @staticmethod
+    def _add_share(owners: Dict[str, OwnerShare], name: str, percentage: float, paths: int,
+                   nationality: Optional[str], is_director: bool) -> None:
+        share = owners.get(name)
+        if share is None:
+            share = owners[name] = OwnerShare()
+        share.percentage += percentage
+        share.paths += paths
+        if not share.nationality and nationality:
+            share.nationality = nationality
+        share.is_director = share.is_director or is_director
+
+    def _reach(self, root: OwnershipVector) -> Dict[str, int]:
+        """Level of every company reached by walking the followed holders breadth-first."""
+        levels = {root.company_id: 0}
+        queue = deque([root])
+        while queue:
+            vector = queue.popleft()
+            level = levels[vector.company_id]
+            for holder_id in vector.holders:
+                if holder_id in levels:
+                    continue
+                levels[holder_id] = level + 1
+                queue.append(self.ownership_vector(holder_id, self.max_levels - level - 1))
+        return levels
+
+    def analyze(self, registration_id: str) -> UBOAnalysisResult:
+        """Screen one company; the same summary fields as FinalUBOAnalyzer's result."""
+        context = AnalysisContext()
+        analysis_token = _current_analysis.set(context)  # The client reports failure reasons here
+        try:
+            with timed_stage('ownership_vectors'):
+                vector = self.ownership_vector(registration_id)
+                levels = self._reach(vector)
+        finally:
+            _current_analysis.reset(analysis_token)
+        # Companies that could not be fetched leave the result open, as in FinalUBOAnalyzer
+        context.failed_tasks = [(company_id, percentage, levels.get(company_id, 0), [])
+                                for company_id, percentage in vector.unresolved.items()]
+        context.total_companies_checked = len(levels) - len(vector.unresolved)
+        context.max_level_reached = max(level for company_id, level in levels.items()
+                                        if company_id not in vector.unresolved) if context.total_companies_checked else 0
+        context.coverage_percentage = max(0.0, 100.0 - sum(vector.unresolved.values()))
+        breaker = getattr(self.api_client, 'breaker', None)
+        context.breaker_state = breaker.state if breaker is not None else None
+
+        with timed_stage('ubo_calculation'):
+            candidates = [UBOCandidate(name=name, total_percentage=share.percentage, paths=[], method=1,
+                                       nationality=share.nationality, is_director=share.is_director,
+                                       path_count=share.paths)
+                          for name, share in vector.owners.items()]
+            final_ubos = [candidate for candidate in candidates if candidate.total_percentage >= self.threshold]
+            checklist = self._labels._create_checklist(context, final_ubos)
+            risk_level, compliance_status = self._labels._determine_risk_and_compliance(context, final_ubos)
+
+        return UBOAnalysisResult(
+            registration_id=registration_id,
+            company_name=vector.company_name,
+            ubo_candidates=candidates,
+            final_ubos=final_ubos,
+            hierarchy={},
+            checklist=checklist,
+            risk_level=risk_level,
+            compliance_status=compliance_status,
+            total_companies_checked=context.total_companies_checked,
+            max_level_reached=context.max_level_reached,
+            check_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            coverage_percentage=round(context.coverage_percentage, 6),
+            partial=bool(context.failed_tasks),
+            enlite_health=self._labels._enlite_health(context)
+        )
+
+
+def create_ownership_cache_from_env() -> OwnershipVectorCache:
+    """Vector cache sized by UBO_OWNERSHIP_CACHE_MAX_ENTRIES, expiring with ENLITE_CACHE_TTL."""
+    ttl = os.getenv('ENLITE_CACHE_TTL')
+    return OwnershipVectorCache(
+        max_entries=int(os.getenv('UBO_OWNERSHIP_CACHE_MAX_ENTRIES', '50000')) or None,
+        ttl_seconds=float(ttl) if ttl else None
+    )
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Hierarchy snapshots for incremental KYC re-analysis.
+
+Each completed analysis stores, per root company, the parsed data of every
+company it fetched (shareholders, directors, ``director_upd_date``) with the
+time it was fetched, plus the UBO totals. A re-analysis serves companies
+fetched within the freshness window from the snapshot and refetches only
+the older ones, so a periodic refresh costs API calls only for stale nodes.
+Totals are then recomputed over the in-memory data and the result is
+diffed against the snapshot to list exactly which ownership edges,
+directors and UBO totals changed since the last check.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from final_ubo_system import FinalUBOAnalyzer, UBOAnalysisResult, ubo_analyzer
+from ubo_instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """Base interface for snapshot stores keyed by root registration ID."""
+
+    def load(self, registration_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, registration_id: str, snapshot: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, registration_id: str) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': type(self).__name__, 'entries': len(self)}
+
+
+class InMemorySnapshotStore(SnapshotStore):
+    """Process-local LRU of snapshots."""
+
+    def __init__(self, max_entries: Optional[int] = 1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, registration_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._data.get(registration_id)
+            if snapshot is not None:
+                self._data.move_to_end(registration_id)
+            return snapshot
+
+    def save(self, registration_id: str, snapshot: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data.pop(registration_id, None)
+            self._data[registration_id] = snapshot
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, registration_id: str) -> None:
+        with self._lock:
+            self._data.pop(registration_id, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['max_entries'] = self.max_entries
+        return stats
+
+
+class SQLiteSnapshotStore(SnapshotStore):
+    """On-disk snapshots shared by every worker process, surviving restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ubo_snapshots ("
+                " registration_id TEXT PRIMARY KEY,"
+                " snapshot TEXT NOT NULL,"
+                " checked_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (sqlite3 connections are not shareable)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, registration_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._connect().execute(
+                "SELECT snapshot FROM ubo_snapshots WHERE registration_id = ?", (registration_id,)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Snapshot read failed for {registration_id}: {e}")
+            return None
+
+    def save(self, registration_id: str, snapshot: Dict[str, Any]) -> None:
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ubo_snapshots (registration_id, snapshot, checked_at) VALUES (?, ?, ?)",
+                    (registration_id, json.dumps(snapshot, ensure_ascii=False), snapshot['checked_at'])
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Snapshot write failed for {registration_id}: {e}")
+
+    def delete(self, registration_id: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM ubo_snapshots WHERE registration_id = ?", (registration_id,))
+
+    def __len__(self) -> int:
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM ubo_snapshots").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['path'] = self.path
+        return stats
+
+
+class SnapshotClient:
+    """API client wrapper serving companies fetched within the freshness window from a snapshot.
+
+    Every other company is fetched from Enlite: its company-cache entry is
+    dropped first, since that cache may hold data of any age (and serves stale
+    entries), and the snapshot must only stamp data with the time it was fetched.
+    """
+
+    def __init__(self, api_client, companies: Dict[str, Dict[str, Any]], freshness_seconds: float):
+        self.api_client = api_client
+        self.breaker = getattr(api_client, 'breaker', None)  # So results still report the breaker state
+        self.previous = companies
+        self.freshness_seconds = freshness_seconds
+        self.companies = {}  # company_id -> {'fetched_at', 'data'} seen in this run
+        self.reused = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+
+    def get_company_data(self, registration_id: str, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        entry = self.previous.get(registration_id)
+        if entry is not None and time.time() - entry['fetched_at'] <= self.freshness_seconds:
+            count('snapshot_reused')
+            with self._lock:
+                self.reused += 1
+                self.companies[registration_id] = entry
+            return entry['data']
+        cache = getattr(self.api_client, 'cache', None)
+        if cache is not None:
+            cache.delete(registration_id)
+        fetched_at = time.time()
+        data = self.api_client.get_company_data(registration_id, *args, **kwargs)
+        count('snapshot_refetched')
+        with self._lock:
+            self.fetched += 1
+            if data:
+                self.companies[registration_id] = {'fetched_at': fetched_at, 'data': data}
+        return data
+
+
+def _edges(company_data: Dict[str, Any], labels: FinalUBOAnalyzer) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Ownership edges into one company keyed by (holder type, holder)."""
+    edges = {}
+    for sh_data in company_data.get('shareholders', []):
+        shareholder_type = sh_data.get('shareholder_type', 'personal')
+        holder = sh_data.get('regis_id_held_by') if shareholder_type == 'company' else None
+        holder = holder or labels._shareholder_name(sh_data)
+        try:
+            percent = float(sh_data.get('percent') or 0.0)
+        except (TypeError, ValueError):
+            percent = 0.0
+        edge = edges.setdefault((shareholder_type, holder), {'percent': 0.0, 'director_upd_date': ''})
+        edge['percent'] += percent
+        edge['director_upd_date'] = sh_data.get('director_upd_date') or edge['director_upd_date']
+    return edges
+
+
+def _director_names(company_data: Dict[str, Any]) -> set:
+    return {f"{d.get('firstname', '')} {d.get('lastname', '')}".strip() for d in company_data.get('directors', [])}
+
+
+def diff_snapshots(previous: Dict[str, Any], current: Dict[str, Any], tolerance: float = 1e-6) -> Dict[str, Any]:
+    """Changes between two snapshots of the same root.
+
+    Edges and directors are compared for companies present in both; companies
+    that entered or left the hierarchy are listed on their own, since the edge
+    that caused it is reported at the company holding it.
+    """
+    labels = ubo_analyzer
+    before, after = previous['companies'], current['companies']
+    edges = {'added': [], 'removed': [], 'changed': []}
+    directors = {'added': [], 'removed': []}
+    director_updates = []
+    for company_id in sorted(before.keys() & after.keys()):
+        old_data, new_data = before[company_id]['data'], after[company_id]['data']
+        if old_data == new_data:
+            continue
+        old_edges, new_edges = _edges(old_data, labels), _edges(new_data, labels)
+        for key in sorted(old_edges.keys() | new_edges.keys()):
+            old, new = old_edges.get(key), new_edges.get(key)
+            edge = {'company_id': company_id, 'holder_type': key[0], 'holder': key[1]}
+            if old is None:
+                edges['added'].append(dict(edge, percent=new['percent']))
+            elif new is None:
+                edges['removed'].append(dict(edge, previous_percent=old['percent']))
+            else:
+                if abs(old['percent'] - new['percent']) > tolerance:
+                    edges['changed'].append(dict(edge, previous_percent=old['percent'], percent=new['percent']))
+                if old['director_upd_date'] != new['director_upd_date']:
+                    director_updates.append(dict(edge, previous=old['director_upd_date'],
+                                                 current=new['director_upd_date']))
+        old_directors, new_directors = _director_names(old_data), _director_names(new_data)
+        directors['added'].extend({'company_id': company_id, 'name': name}
+                                  for name in sorted(new_directors - old_directors))
+        directors['removed'].extend({'company_id': company_id, 'name': name}
+                                    for name in sorted(old_directors - new_directors))
+
+    old_totals, new_totals = previous.get('ubo_totals', {}), current.get('ubo_totals', {})
+    ubo_totals = [
+        {'name': name, 'previous_percentage': old_totals.get(name), 'percentage': new_totals.get(name)}
+        for name in sorted(old_totals.keys() | new_totals.keys())
+        if name not in old_totals or name not in new_totals
+        or abs(old_totals[name] - new_totals[name]) > tolerance
+    ]
+    changed = any(edges.values()) or any(directors.values()) or director_updates or ubo_totals \
+        or before.keys() != after.keys()
+    return {
+        'since': previous['checked_at'],
+        'changed': bool(changed),
+        'edges': edges,
+        'directors': directors,
+        'director_updates': director_updates,
+        'companies_added': sorted(after.keys() - before.keys()),
+        'companies_removed': sorted(before.keys() - after.keys()),
+        'ubo_totals': ubo_totals
+    }
+
+
+class IncrementalUBOAnalyzer:
+    """Re-analyse companies against their last snapshot.
+
+    Results are those of ``analyzer`` (the shared FinalUBOAnalyzer by default)
+    run over snapshot data younger than ``freshness_seconds`` plus refetched
+    data for the rest. Partial results never replace a stored snapshot.
+    """
+
+    def __init__(self, api_client, store: Optional[SnapshotStore] = None,
+                 analyzer: Optional[FinalUBOAnalyzer] = None, freshness_seconds: float = 86400):
+        self.api_client = api_client
+        self.store = store if store is not None else InMemorySnapshotStore()
+        self.analyzer = analyzer if analyzer is not None else ubo_analyzer
+        self.freshness_seconds = freshness_seconds
+
+    def analyze(self, registration_id: str, freshness_seconds: Optional[float] = None,
+                **options) -> Tuple[UBOAnalysisResult, Dict[str, Any]]:
+        """Return (result, changes); ``changes`` is None on the first check of a company.
+
+        ``options`` are passed to analyze_company_hierarchy.
+        """
+        previous = self.store.load(registration_id)
+        freshness = self.freshness_seconds if freshness_seconds is None else freshness_seconds
+        client = SnapshotClient(self.api_client, previous['companies'] if previous else {}, freshness)
+        result = self.analyzer.analyze_company_hierarchy(client, registration_id, **options)
+        current = {
+            'registration_id': registration_id,
+            'checked_at': time.time(),
+            'companies': {company_id: client.companies[company_id]
+                          for company_id in result.hierarchy if company_id in client.companies},
+            'ubo_totals': {candidate.name: candidate.total_percentage for candidate in result.ubo_candidates}
+        }
+        logger.info(f"Incremental analysis of {registration_id}: {client.reused} companies from snapshot, "
+                    f"{client.fetched} fetched")
+
+        changes = diff_snapshots(previous, current) if previous else None
+        if changes is not None:
+            changes.update(companies_reused=client.reused, companies_fetched=client.fetched)
+        if result.partial:
+            logger.warning(f"Partial result for {registration_id}, keeping the previous snapshot")
+        else:
+            self.store.save(registration_id, current)
+        return result, changes
+
+
+def create_snapshot_store_from_env() -> SnapshotStore:
+    """Build the snapshot store selected by UBO_SNAPSHOT_* environment variables."""
+    backend = os.getenv('UBO_SNAPSHOT_BACKEND', 'memory').strip().lower()
+    if backend == 'sqlite':
+        path = os.getenv('UBO_SNAPSHOT_PATH') or os.path.join(tempfile.gettempdir(), 'ubo_snapshots.sqlite3')
+        logger.info(f"Using SQLite snapshot store at {path}")
+        return SQLiteSnapshotStore(path)
+    if backend != 'memory':
+        logger.warning(f"Unknown UBO_SNAPSHOT_BACKEND '{backend}', falling back to memory")
+    return InMemorySnapshotStore(max_entries=int(os.getenv('UBO_SNAPSHOT_MAX_ENTRIES', '1000')) or None)
+
+
+def create_incremental_analyzer_from_env(api_client, analyzer: Optional[FinalUBOAnalyzer] = None) -> IncrementalUBOAnalyzer:
+    """Incremental analyzer with the UBO_SNAPSHOT_* store and UBO_SNAPSHOT_FRESHNESS window (seconds)."""
+    return IncrementalUBOAnalyzer(api_client, create_snapshot_store_from_env(), analyzer=analyzer,
+                                  freshness_seconds=float(os.getenv('UBO_SNAPSHOT_FRESHNESS', '86400')))